@@ -1,6 +1,54 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
+
+
+def invalidate_film_detail_on_review(sender, instance, using, **kwargs):
+    """Рецензия изменилась - сбрасываем кэш страницы фильма."""
+    from gallery.cache import invalidate_film_detail
+
+    invalidate_film_detail(instance.film_id, using)
+
+
+def invalidate_film_detail_on_comment(sender, instance, using, **kwargs):
+    """Комментарий меняет comments_count в последних рецензиях фильма."""
+    from activities.models import Review
+    from gallery.cache import invalidate_film_detail
+
+    film_id = Review.objects.using(using).filter(
+        pk=instance.review_id
+    ).values_list('film_id', flat=True).first()
+    if film_id is not None:
+        invalidate_film_detail(film_id, using)
 
 
 class ActivitiesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'activities'
+
+    def ready(self):
+        from activities.ratings import (update_rating_stats_on_delete,
+                                        update_rating_stats_on_save)
+
+        activity_model = self.get_model('UserFilmActivity')
+        post_save.connect(
+            update_rating_stats_on_save,
+            sender=activity_model,
+            dispatch_uid='activities_rating_stats_save',
+        )
+        post_delete.connect(
+            update_rating_stats_on_delete,
+            sender=activity_model,
+            dispatch_uid='activities_rating_stats_delete',
+        )
+
+        for signal, suffix in ((post_save, 'save'), (post_delete, 'delete')):
+            signal.connect(
+                invalidate_film_detail_on_review,
+                sender=self.get_model('Review'),
+                dispatch_uid=f'activities_review_film_detail_{suffix}',
+            )
+            signal.connect(
+                invalidate_film_detail_on_comment,
+                sender=self.get_model('CommentReview'),
+                dispatch_uid=f'activities_comment_film_detail_{suffix}',
+            )
@@ -0,0 +1,173 @@
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+
+from activities.models import UserFilmActivity
+from api.pagination import ProfileListPagination
+from gallery.models import Film
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Замерить время списков активностей на пользователе с большим '
+        'числом активностей. Данные создаются во временной транзакции '
+        'и откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument(
+            '--activities',
+            type=int,
+            default=10000,
+            help='Сколько активностей у замеряемого пользователя.',
+        )
+        parser.add_argument(
+            '--other-users',
+            type=int,
+            default=20,
+            help='Сколько других пользователей (по 1/10 от --activities '
+                 'активностей каждый), чтобы таблица была не только '
+                 'из одного пользователя.',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Сколько раз выполнить каждый запрос.',
+        )
+        parser.add_argument(
+            '--explain',
+            action='store_true',
+            help='Показать план каждого запроса.',
+        )
+
+    def handle(self, *args, **options):
+        using = options['database']
+
+        with transaction.atomic(using=using):
+            user = self.fill(
+                using, options['activities'], options['other_users']
+            )
+            for name, queryset in self.cases(using, user):
+                self.measure(
+                    name, queryset, options['repeat'], options['explain']
+                )
+            transaction.set_rollback(True, using=using)
+
+    def fill(self, using, activities, other_users):
+        """Фильмы, пользователи и активности для замера."""
+        stamp = int(time.time())
+        films = Film.objects.using(using).bulk_create(
+            [
+                Film(name=f'benchmark {i}', year=2000)
+                for i in range(activities)
+            ],
+            batch_size=1000,
+        )
+        users = User.objects.using(using).bulk_create(
+            [
+                User(
+                    username=f'benchmark_{stamp}_{i}',
+                    email=f'benchmark_{stamp}_{i}@example.com',
+                    first_name='Benchmark',
+                    last_name=str(i),
+                )
+                for i in range(other_users + 1)
+            ],
+        )
+        user = users[0]
+
+        now = timezone.now()
+        rows = []
+        for number, owner in enumerate(users):
+            owned = films if owner is user else films[number::10]
+            for i, film in enumerate(owned):
+                is_watched = i % 3 != 0
+                rows.append(UserFilmActivity(
+                    user=owner,
+                    film=film,
+                    is_watched=is_watched,
+                    watched_at=(
+                        now - timedelta(hours=i) if is_watched else None
+                    ),
+                    is_planned=not is_watched,
+                    planned_at=(
+                        None if is_watched else now - timedelta(hours=i)
+                    ),
+                    is_public_for_watched=i % 7 != 0,
+                    is_public_for_planned=i % 5 != 0,
+                ))
+        UserFilmActivity.objects.using(using).bulk_create(
+            rows, batch_size=1000
+        )
+
+        self.stdout.write(
+            f'Пользователь {user.pk}: {activities} активностей, '
+            f'всего в таблице {len(rows)}'
+        )
+        return user
+
+    def cases(self, using, user):
+        """(название, запрос) - запросы списков из API."""
+        page = ProfileListPagination.page_size
+        activities = UserFilmActivity.objects.using(using).filter(user=user)
+        film_id = activities.values_list('film_id', flat=True).first()
+
+        by_update = ('-updated_at', '-created_at', '-id')
+        return (
+            (
+                '/activities/ (все)',
+                activities.order_by(*by_update),
+            ),
+            (
+                '/activities/?is_watched (чужие)',
+                activities.filter(
+                    is_watched=True, is_public_for_watched=True
+                ).order_by(*by_update),
+            ),
+            (
+                '/activities/?is_planned (чужие)',
+                activities.filter(
+                    is_planned=True, is_public_for_planned=True
+                ).order_by(*by_update),
+            ),
+            (
+                f'/users/{{id}}/watched/ (страница {page})',
+                activities.filter(
+                    is_watched=True, is_public_for_watched=True
+                ).order_by('-watched_at', '-updated_at', '-id')[:page],
+            ),
+            (
+                f'/users/{{id}}/planned/ (страница {page})',
+                activities.filter(
+                    is_planned=True, is_public_for_planned=True
+                ).order_by('-planned_at', '-updated_at', '-id')[:page],
+            ),
+            (
+                'активность по фильму',
+                activities.filter(film_id=film_id),
+            ),
+        )
+
+    def measure(self, name, queryset, repeat, explain):
+        timings = []
+        for _ in range(max(repeat, 1)):
+            started = time.perf_counter()
+            rows = len(list(queryset.all()))
+            timings.append((time.perf_counter() - started) * 1000)
+
+        self.stdout.write(
+            f'{name:<40} строк {rows:>6}  '
+            f'медиана {statistics.median(timings):8.2f} мс  '
+            f'макс {max(timings):8.2f} мс'
+        )
+        if explain:
+            self.stdout.write(queryset.explain())
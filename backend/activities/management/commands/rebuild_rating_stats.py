@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from activities.ratings import rebuild_rating_stats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать статистику оценок фильмов (FilmRatingStats).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        films = rebuild_rating_stats(using=options['database'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Статистика оценок пересчитана: {films} фильмов'
+        ))
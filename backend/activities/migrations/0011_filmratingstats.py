@@ -0,0 +1,62 @@
+# Generated by Django 4.2.20 on 2026-10-17 23:14
+
+import activities.models
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+# Подсчёт скопирован из activities.ratings на момент миграции:
+# исторический код не должен меняться вместе с приложением
+def fill_rating_stats(apps, schema_editor):
+    using = schema_editor.connection.alias
+    UserFilmActivity = apps.get_model('activities', 'UserFilmActivity')
+    FilmRatingStats = apps.get_model('activities', 'FilmRatingStats')
+
+    histograms = {}
+    rows = UserFilmActivity.objects.using(using).filter(
+        rating__isnull=False
+    ).values('film_id', 'rating').annotate(votes=Count('pk')).order_by()
+    for row in rows:
+        histogram = histograms.setdefault(row['film_id'], [0] * 11)
+        histogram[row['rating']] += row['votes']
+
+    FilmRatingStats.objects.using(using).bulk_create(
+        [
+            FilmRatingStats(
+                film_id=film_id,
+                ratings_count=sum(histogram),
+                ratings_sum=sum(
+                    rating * votes for rating, votes in enumerate(histogram)
+                ),
+                histogram=histogram,
+            )
+            for film_id, histogram in histograms.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0012_film_keyset_indexes'),
+        ('activities', '0010_alter_commentreview_options_alter_review_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FilmRatingStats',
+            fields=[
+                ('film', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_stats', serialize=False, to='gallery.film', verbose_name='Фильм')),
+                ('ratings_count', models.PositiveIntegerField(default=0, verbose_name='Количество оценок')),
+                ('ratings_sum', models.PositiveIntegerField(default=0, verbose_name='Сумма оценок')),
+                ('histogram', models.JSONField(default=activities.models.empty_rating_histogram, help_text='Число оценок 0, 1, ..., 10', verbose_name='Распределение оценок')),
+            ],
+            options={
+                'verbose_name': 'Статистика оценок фильма',
+                'verbose_name_plural': 'Статистика оценок фильмов',
+            },
+        ),
+        migrations.RunPython(fill_rating_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,132 @@
+"""
+Перед unique_user_film_activity убираем дубли (user, film).
+
+Остаётся запись, изменённая последней; если у неё нет оценки, берётся
+последняя оценка из дублей. История просмотров дублей переносится на
+оставшуюся запись. Сигналы исторических моделей не срабатывают, поэтому
+после удаления статистика оценок и счётчики пользователей пересчитываются.
+"""
+from django.db import migrations
+from django.db.models import Count, Q
+
+
+# Пересчёты ниже скопированы из activities.ratings и users.stats на момент
+# миграции: исторический код не должен меняться вместе с приложением
+def rebuild_rating_stats(apps, using):
+    UserFilmActivity = apps.get_model('activities', 'UserFilmActivity')
+    FilmRatingStats = apps.get_model('activities', 'FilmRatingStats')
+
+    histograms = {}
+    rows = UserFilmActivity.objects.using(using).filter(
+        rating__isnull=False
+    ).values('film_id', 'rating').annotate(votes=Count('pk')).order_by()
+    for row in rows:
+        histogram = histograms.setdefault(row['film_id'], [0] * 11)
+        histogram[row['rating']] += row['votes']
+
+    FilmRatingStats.objects.using(using).all().delete()
+    FilmRatingStats.objects.using(using).bulk_create(
+        [
+            FilmRatingStats(
+                film_id=film_id,
+                ratings_count=sum(histogram),
+                ratings_sum=sum(
+                    rating * votes for rating, votes in enumerate(histogram)
+                ),
+                histogram=histogram,
+            )
+            for film_id, histogram in histograms.items()
+        ],
+        batch_size=1000,
+    )
+
+
+def rebuild_user_stats(apps, using):
+    User = apps.get_model('users', 'User')
+    UserStats = apps.get_model('users', 'UserStats')
+    UserFilmActivity = apps.get_model('activities', 'UserFilmActivity')
+    Compilation = apps.get_model('compilations', 'Compilation')
+    Follow = apps.get_model('blog', 'Follow')
+    PhotoUser = apps.get_model('blog', 'PhotoUser')
+
+    counts = {}
+
+    def count(model, user_field, **annotations):
+        rows = model.objects.using(using).values(user_field).annotate(
+            **annotations
+        ).order_by().values_list(user_field, *annotations)
+        for user_id, *values in rows:
+            counts.setdefault(user_id, {}).update(zip(annotations, values))
+
+    count(
+        UserFilmActivity, 'user_id',
+        activities_count=Count('pk'),
+        watched_count=Count('pk', filter=Q(is_watched=True)),
+        planned_count=Count('pk', filter=Q(is_planned=True)),
+    )
+    count(Compilation, 'user_id', compilations_count=Count('pk'))
+    count(Follow, 'follower_id', subscriptions_count=Count('pk'))
+    count(Follow, 'following_id', subscribers_count=Count('pk'))
+    count(PhotoUser, 'user_id', photos_count=Count('pk'))
+
+    UserStats.objects.using(using).all().delete()
+    UserStats.objects.using(using).bulk_create(
+        [
+            UserStats(user_id=user_id, **counts.get(user_id, {}))
+            for user_id in User.objects.using(using).values_list(
+                'pk', flat=True
+            )
+        ],
+        batch_size=1000,
+    )
+
+
+def dedupe_activities(apps, schema_editor):
+    using = schema_editor.connection.alias
+    UserFilmActivity = apps.get_model('activities', 'UserFilmActivity')
+    HistoryWatching = apps.get_model('activities', 'HistoryWatching')
+
+    duplicates = UserFilmActivity.objects.using(using).values(
+        'user_id', 'film_id'
+    ).annotate(copies=Count('pk')).filter(copies__gt=1).order_by()
+
+    removed = 0
+    for pair in duplicates:
+        activities = list(UserFilmActivity.objects.using(using).filter(
+            user_id=pair['user_id'], film_id=pair['film_id'],
+        ).order_by('-updated_at', '-id'))
+        keep, extra = activities[0], activities[1:]
+
+        if keep.rating is None:
+            rating = next(
+                (a.rating for a in extra if a.rating is not None), None
+            )
+            if rating is not None:
+                UserFilmActivity.objects.using(using).filter(
+                    pk=keep.pk
+                ).update(rating=rating)
+
+        extra_ids = [activity.pk for activity in extra]
+        HistoryWatching.objects.using(using).filter(
+            user_film_activities_id__in=extra_ids
+        ).update(user_film_activities_id=keep.pk)
+        UserFilmActivity.objects.using(using).filter(
+            pk__in=extra_ids
+        ).delete()
+        removed += len(extra_ids)
+
+    if removed:
+        rebuild_rating_stats(apps, using)
+        rebuild_user_stats(apps, using)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0011_filmratingstats'),
+        ('users', '0003_userstats'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_activities, migrations.RunPython.noop),
+    ]
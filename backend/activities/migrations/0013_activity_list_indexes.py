@@ -0,0 +1,39 @@
+# Generated by Django 4.2.20 on 2026-10-17 23:57
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('activities', '0012_dedupe_user_film_activity'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userfilmactivity',
+            index=models.Index(fields=['user', '-updated_at', '-created_at', '-id'], name='activity_user_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userfilmactivity',
+            index=models.Index(condition=models.Q(('is_watched', True)), fields=['user', '-watched_at', '-updated_at', '-id'], name='activity_user_watched_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userfilmactivity',
+            index=models.Index(condition=models.Q(('is_planned', True)), fields=['user', '-planned_at', '-updated_at', '-id'], name='activity_user_planned_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='userfilmactivity',
+            constraint=models.UniqueConstraint(fields=('user', 'film'), name='unique_user_film_activity'),
+        ),
+        # Индекс по одному user заменён unique_user_film_activity -
+        # удаляем его, когда составной индекс уже создан
+        migrations.AlterField(
+            model_name='userfilmactivity',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='activities', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.20 on 2026-10-18 12:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0013_activity_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filmratingstats',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
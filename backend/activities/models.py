@@ -1,7 +1,7 @@
 from django.contrib.auth import get_user_model
 from django.core.validators import (MinValueValidator,
                                     MaxValueValidator,)
-from django.db import models
+from django.db import DEFAULT_DB_ALIAS, models, transaction
 from django.utils import timezone
 
 from gallery.models import Film
@@ -34,6 +34,8 @@ class UserFilmActivity(BaseCreatedUpdated):
         on_delete=models.CASCADE,
         verbose_name='Пользователь',
         related_name='activities',
+        # Поиск по user обслуживает unique_user_film_activity
+        db_index=False,
     )
     film = models.ForeignKey(
         Film,
@@ -79,11 +81,60 @@ class UserFilmActivity(BaseCreatedUpdated):
         default=True
     )
 
+    # Поля, которые меняет upsert
+    UPSERT_FIELDS = (
+        'is_planned',
+        'planned_at',
+        'is_watched',
+        'watched_at',
+        'rating',
+        'is_public_for_planned',
+        'is_public_for_watched',
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'film'),
+                name='unique_user_film_activity'
+            )
+        ]
+        # Под списки активностей пользователя: сортировка списка с id
+        # в хвосте, для просмотренных и планируемых - частичные индексы
+        indexes = [
+            models.Index(
+                fields=['user', '-updated_at', '-created_at', '-id'],
+                name='activity_user_updated_idx',
+            ),
+            models.Index(
+                fields=['user', '-watched_at', '-updated_at', '-id'],
+                name='activity_user_watched_idx',
+                condition=models.Q(is_watched=True),
+            ),
+            models.Index(
+                fields=['user', '-planned_at', '-updated_at', '-id'],
+                name='activity_user_planned_idx',
+                condition=models.Q(is_planned=True),
+            ),
+        ]
+
     def __str__(self) -> str:
         return f'{self.user} - {self.film} ({self.film.pk})- is_watched = {self.is_watched} - is_planned = {self.is_planned}'
 
-    def save(self, *args, **kwargs):
-        """Автоматически устанавливает watched_at при отметке как просмотренного."""
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Оценка из БД: по ней считаем изменение в FilmRatingStats
+        instance._loaded_rating = instance.__dict__.get('rating')
+        # Отметки из БД: по ним считаем изменение в UserStats
+        instance._loaded_flags = (
+            instance.__dict__.get('is_watched'),
+            instance.__dict__.get('is_planned'),
+        )
+        return instance
+
+    def set_status_dates(self):
+        """Проставляет watched_at/planned_at по отметкам."""
         # Если фильм отмечается как просмотренный и дата не установлена
         if self.is_watched and not self.watched_at:
             self.watched_at = timezone.now()
@@ -98,7 +149,156 @@ class UserFilmActivity(BaseCreatedUpdated):
         elif not self.is_planned and self.planned_at:
             self.planned_at = None
 
-        super().save(*args, **kwargs)
+    def save(self, *args, **kwargs):
+        """Автоматически устанавливает watched_at при отметке как просмотренного."""
+        self.set_status_dates()
+
+        # Активность, статистика оценок фильма и счётчики пользователя
+        # (post_save) - одна транзакция
+        with transaction.atomic(using=kwargs.get('using') or self._state.db):
+            super().save(*args, **kwargs)
+
+    @classmethod
+    def upsert(cls, user_id, film_id, values, using=DEFAULT_DB_ALIAS):
+        """
+        Создаёт или обновляет активность пользователя по фильму.
+
+        Запись пишется одним INSERT ... ON CONFLICT (user, film) DO
+        UPDATE; статистика оценок фильма и счётчики пользователя
+        меняются в той же транзакции. values - изменяемые поля, не
+        переданные остаются как были. Повторный запрос с теми же
+        values ничего не пишет и возвращает запись из БД.
+
+        Запросы: блокировка пользователя, чтение записи, INSERT ... ON
+        CONFLICT, UPDATE счётчиков пользователя; для новой записи ещё
+        проверка фильма и повторное чтение (pk), при смене оценки -
+        чтение и запись FilmRatingStats.
+
+        Возвращает (активность, создана ли). Film.DoesNotExist - фильма
+        нет.
+        """
+        from activities.ratings import apply_rating_change
+        from users.stats import apply_user_stats_change
+
+        with transaction.atomic(using=using):
+            # Изменения активностей одного пользователя идут по очереди:
+            # иначе два одновременных запроса оба сочтут запись новой
+            list(User.objects.using(using).select_for_update().filter(
+                pk=user_id
+            ).values_list('pk'))
+
+            old = cls.objects.using(using).filter(
+                user_id=user_id, film_id=film_id
+            ).first()
+            if old is None and not Film.objects.using(using).filter(
+                pk=film_id
+            ).exists():
+                raise Film.DoesNotExist(f'Фильм с id {film_id} не найден')
+
+            activity = cls(user_id=user_id, film_id=film_id)
+            if old is not None:
+                for field in cls.UPSERT_FIELDS:
+                    setattr(activity, field, getattr(old, field))
+            for field, value in values.items():
+                setattr(activity, field, value)
+            activity.set_status_dates()
+
+            if old is not None and all(
+                getattr(activity, field) == getattr(old, field)
+                for field in cls.UPSERT_FIELDS
+            ):
+                # Повтор того же запроса: не пишем и не трогаем updated_at
+                return old, False
+
+            cls.objects.using(using).bulk_create(
+                [activity],
+                update_conflicts=True,
+                unique_fields=['user', 'film'],
+                update_fields=[*cls.UPSERT_FIELDS, 'updated_at'],
+            )
+            if old is None:
+                # bulk_create с update_conflicts не возвращает pk
+                activity = cls.objects.using(using).get(
+                    user_id=user_id, film_id=film_id
+                )
+            else:
+                activity.pk = old.pk
+                activity.created_at = old.created_at
+
+            # bulk_create не шлёт сигналы - статистику меняем сами
+            apply_rating_change(
+                film_id,
+                old.rating if old else None,
+                activity.rating,
+                using,
+            )
+            apply_user_stats_change(user_id, {
+                'activities_count': int(old is None),
+                'watched_count': (
+                    int(activity.is_watched)
+                    - int(bool(old and old.is_watched))
+                ),
+                'planned_count': (
+                    int(activity.is_planned)
+                    - int(bool(old and old.is_planned))
+                ),
+            }, using)
+
+        activity._loaded_rating = activity.rating
+        activity._loaded_flags = (activity.is_watched, activity.is_planned)
+        return activity, old is None
+
+
+def empty_rating_histogram():
+    """Гистограмма оценок: число голосов за 0, 1, ..., 10."""
+    return [0] * 11
+
+
+class FilmRatingStats(models.Model):
+    """
+    Оценки пользователей портала по фильму.
+
+    Денормализация UserFilmActivity.rating: обновляется сигналами
+    при изменении оценки, пересчитывается командой rebuild_rating_stats.
+    """
+
+    film = models.OneToOneField(
+        Film,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name='Фильм',
+        related_name='rating_stats',
+    )
+    ratings_count = models.PositiveIntegerField(
+        'Количество оценок',
+        default=0,
+    )
+    ratings_sum = models.PositiveIntegerField(
+        'Сумма оценок',
+        default=0,
+    )
+    histogram = models.JSONField(
+        'Распределение оценок',
+        default=empty_rating_histogram,
+        help_text='Число оценок 0, 1, ..., 10',
+    )
+    # По нему индекс автодополнения догружает сменившиеся оценки,
+    # не трогая Film.updated_at
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        verbose_name = 'Статистика оценок фильма'
+        verbose_name_plural = 'Статистика оценок фильмов'
+
+    def __str__(self):
+        return f'{self.film_id}: {self.average} ({self.ratings_count})'
+
+    @property
+    def average(self):
+        """Средняя оценка, округлённая до десятых."""
+        if not self.ratings_count:
+            return None
+        return round(self.ratings_sum / self.ratings_count, 1)
 
 
 class HistoryWatching(BaseCreatedUpdated):
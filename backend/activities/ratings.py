@@ -0,0 +1,129 @@
+"""
+Поддержка FilmRatingStats в актуальном состоянии.
+
+Оценка меняется только через UserFilmActivity, поэтому статистику
+обновляем сигналами post_save/post_delete по разнице между оценкой
+из БД и новой. Массовые операции (queryset.update, bulk_create)
+сигналов не шлют - после них нужен rebuild_rating_stats.
+"""
+from typing import Optional
+
+from django.apps import apps as global_apps
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from gallery.cache import invalidate_all_film_details, invalidate_film_detail
+
+
+def apply_rating_change(
+    film_id: int,
+    old: Optional[int],
+    new: Optional[int],
+    using: str = DEFAULT_DB_ALIAS,
+) -> None:
+    """Переносит один голос фильма из old в new (None - оценки нет)."""
+    if old == new:
+        return
+
+    from activities.models import FilmRatingStats
+
+    with transaction.atomic(using=using):
+        queryset = FilmRatingStats.objects.using(using).select_for_update()
+        if new is None:
+            # Голос только убирают: строки может уже не быть - например,
+            # фильм удаляется и каскад удалил статистику раньше активностей
+            stats = queryset.filter(film_id=film_id).first()
+            if stats is None:
+                return
+        else:
+            stats, _ = queryset.get_or_create(film_id=film_id)
+
+        histogram = list(stats.histogram)
+        # Старого голоса в статистике может не оказаться, если она
+        # разошлась с данными - в минус не уходим
+        if old is not None and histogram[old] > 0:
+            stats.ratings_count -= 1
+            stats.ratings_sum -= old
+            histogram[old] -= 1
+        if new is not None:
+            stats.ratings_count += 1
+            stats.ratings_sum += new
+            histogram[new] += 1
+
+        stats.histogram = histogram
+        stats.save(using=using)
+
+    invalidate_film_detail(film_id, using)
+
+
+def update_rating_stats_on_save(sender, instance, using, **kwargs):
+    """Обработчик post_save для UserFilmActivity."""
+    old = getattr(instance, '_loaded_rating', None)
+    apply_rating_change(instance.film_id, old, instance.rating, using)
+    instance._loaded_rating = instance.rating
+
+
+def update_rating_stats_on_delete(sender, instance, using, **kwargs):
+    """Обработчик post_delete для UserFilmActivity."""
+    old = getattr(instance, '_loaded_rating', instance.rating)
+    apply_rating_change(instance.film_id, old, None, using)
+
+
+def rebuild_rating_stats(using: str = DEFAULT_DB_ALIAS, apps=global_apps) -> int:
+    """
+    Пересчитывает статистику оценок всех фильмов одним GROUP BY.
+
+    apps - реестр моделей (в миграциях передаётся исторический).
+    Возвращает число фильмов с оценками.
+    """
+    UserFilmActivity = apps.get_model('activities', 'UserFilmActivity')
+    FilmRatingStats = apps.get_model('activities', 'FilmRatingStats')
+
+    histograms = {}
+    rows = UserFilmActivity.objects.using(using).filter(
+        rating__isnull=False
+    ).values('film_id', 'rating').annotate(votes=Count('pk')).order_by()
+    for row in rows:
+        histogram = histograms.setdefault(row['film_id'], [0] * 11)
+        histogram[row['rating']] += row['votes']
+
+    # Строки пишем только у фильмов, где оценки разошлись: updated_at
+    # остальных не меняется. Фильм без оценок сохраняет пустую строку,
+    # чтобы сброс его оценки тоже был виден по updated_at
+    existing = {
+        stats.film_id: stats
+        for stats in FilmRatingStats.objects.using(using).all()
+    }
+    now = timezone.now()
+    to_create = []
+    to_update = []
+    for film_id in {*existing, *histograms}:
+        histogram = histograms.get(film_id, [0] * 11)
+        stats = existing.get(film_id) or FilmRatingStats(film_id=film_id)
+        if film_id in existing and list(stats.histogram) == histogram:
+            continue
+
+        stats.ratings_count = sum(histogram)
+        stats.ratings_sum = sum(
+            rating * votes for rating, votes in enumerate(histogram)
+        )
+        stats.histogram = histogram
+        stats.updated_at = now
+        if film_id in existing:
+            to_update.append(stats)
+        else:
+            to_create.append(stats)
+
+    with transaction.atomic(using=using):
+        FilmRatingStats.objects.using(using).bulk_create(
+            to_create, batch_size=1000
+        )
+        FilmRatingStats.objects.using(using).bulk_update(
+            to_update,
+            ['ratings_count', 'ratings_sum', 'histogram', 'updated_at'],
+            batch_size=1000,
+        )
+        invalidate_all_film_details(using)
+
+    return len(histograms)
@@ -30,7 +30,9 @@ class AddUserActivitySerializer(serializers.ModelSerializer):
     class Meta:
         model = UserFilmActivity
         fields = ('id', 'user', 'film',
-                  'is_planned', 'is_watched', 'rating', 'is_public')
+                  'is_planned', 'planned_at', 'is_watched', 'watched_at',
+                  'rating', 'is_public_for_planned', 'is_public_for_watched')
+        read_only_fields = ('user', 'film', 'planned_at', 'watched_at')
 
 
 class ActivitySerializer(serializers.ModelSerializer):
@@ -42,4 +44,5 @@ class ActivitySerializer(serializers.ModelSerializer):
     class Meta:
         model = UserFilmActivity
         fields = ('user', 'film',
-                  'is_planned', 'is_watched', 'rating', 'is_public')
+                  'is_planned', 'is_watched', 'rating',
+                  'is_public_for_planned', 'is_public_for_watched')
@@ -1,3 +1,142 @@
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from activities.models import FilmRatingStats, UserFilmActivity
+from gallery.models import Film
+from users.models import UserStats
+
+User = get_user_model()
+
+
+class FilmRatingStatsTests(TestCase):
+    """Статистика оценок при удалении фильма и оценок."""
+
+    def setUp(self):
+        self.film = Film.objects.create(name='Фильм', year=2000)
+        self.users = [
+            User.objects.create_user(
+                username=f'user{i}', email=f'user{i}@example.com',
+                password='password',
+            )
+            for i in range(2)
+        ]
+
+    def rate(self, user, rating):
+        return UserFilmActivity.objects.create(
+            user=user, film=self.film, is_watched=True, rating=rating
+        )
+
+    def test_delete_rated_film(self):
+        self.rate(self.users[0], 7)
+        self.rate(self.users[1], 9)
+
+        self.film.delete()
+
+        self.assertFalse(UserFilmActivity.objects.exists())
+        self.assertFalse(FilmRatingStats.objects.exists())
+
+    def test_remove_vote_without_stats_row(self):
+        activity = self.rate(self.users[0], 7)
+        FilmRatingStats.objects.filter(film=self.film).delete()
+
+        activity.delete()
+
+        self.assertFalse(FilmRatingStats.objects.exists())
+
+    def test_change_vote_missing_from_stats(self):
+        activity = self.rate(self.users[0], 7)
+        FilmRatingStats.objects.filter(film=self.film).delete()
+
+        activity.rating = 5
+        activity.save()
+
+        stats = FilmRatingStats.objects.get(film=self.film)
+        self.assertEqual(stats.ratings_count, 1)
+        self.assertEqual(stats.ratings_sum, 5)
+        self.assertEqual(stats.histogram[5], 1)
+
+
+class UserFilmActivityUpsertTests(TestCase):
+    """Повторные и двойные запросы смены статуса."""
+
+    def setUp(self):
+        self.film = Film.objects.create(name='Фильм', year=2000)
+        self.user = User.objects.create_user(
+            username='user', email='user@example.com', password='password'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/v1/activities/user_activities/{self.film.pk}/'
+
+    def stats(self):
+        return UserStats.objects.values_list(
+            'activities_count', 'watched_count', 'planned_count'
+        ).get(user=self.user)
+
+    def test_repeat_does_not_write(self):
+        activity, created = UserFilmActivity.upsert(
+            self.user.pk, self.film.pk, {'is_planned': True}
+        )
+        self.assertTrue(created)
+
+        # Блокировка пользователя и чтение записи - без INSERT и UPDATE
+        with self.assertNumQueries(4):
+            repeated, created = UserFilmActivity.upsert(
+                self.user.pk, self.film.pk, {'is_planned': True}
+            )
+
+        self.assertFalse(created)
+        self.assertEqual(repeated.pk, activity.pk)
+        self.assertEqual(
+            UserFilmActivity.objects.get(pk=activity.pk).updated_at,
+            activity.updated_at,
+        )
+        self.assertEqual(self.stats(), (1, 0, 1))
+
+    def test_change_writes(self):
+        activity, _ = UserFilmActivity.upsert(
+            self.user.pk, self.film.pk, {'is_planned': True}
+        )
+
+        updated, created = UserFilmActivity.upsert(
+            self.user.pk, self.film.pk, {'is_planned': False, 'is_watched': True}
+        )
+
+        self.assertFalse(created)
+        self.assertEqual(updated.pk, activity.pk)
+        self.assertIsNotNone(updated.watched_at)
+        self.assertIsNone(updated.planned_at)
+        self.assertGreater(
+            UserFilmActivity.objects.get(pk=activity.pk).updated_at,
+            activity.updated_at,
+        )
+        self.assertEqual(self.stats(), (1, 1, 0))
+
+    def test_double_submit(self):
+        first = self.client.post(
+            self.url, {'is_watched': True, 'rating': 8}, format='json'
+        )
+        second = self.client.post(
+            self.url, {'is_watched': True, 'rating': 8}, format='json'
+        )
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(UserFilmActivity.objects.count(), 1)
+        self.assertEqual(self.stats(), (1, 1, 0))
+
+        stats = FilmRatingStats.objects.get(film=self.film)
+        self.assertEqual(stats.ratings_count, 1)
+        self.assertEqual(stats.histogram[8], 1)
+
+    def test_missing_film(self):
+        response = self.client.post(
+            '/api/v1/activities/user_activities/0/',
+            {'is_planned': True},
+            format='json',
+        )
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(UserFilmActivity.objects.exists())
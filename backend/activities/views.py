@@ -4,6 +4,7 @@ from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
 from django.contrib.auth import get_user_model
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from rest_framework import viewsets
 
@@ -64,13 +65,16 @@ class UserFilmActivityView(APIView):
         - Добавить в планируемые (is_planned=True)
         - Добавить в просмотренные (is_watched=True)
         - Сменить статус (например, из планируемых в просмотренные)
+
+        Запись создаётся или обновляется одним upsert - повторный
+        запрос (двойной клик) не создаёт дубль и ничего не меняет.
+        Поля, которых нет в запросе, остаются как были.
         """
-        film = get_object_or_404(Film, pk=film_id)
+        serializer = AddUserActivitySerializer(data=request.data, partial=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        # Подготавливаем данные
-        data = request.data.copy()
-        data['user'] = request.user.pk
-        data['film'] = film.pk
+        data = serializer.validated_data
 
         # Проверка на одновременное добавление в оба списка
         if data.get('is_planned') and data.get('is_watched'):
@@ -79,43 +83,17 @@ class UserFilmActivityView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Пытаемся найти существующую запись
         try:
-            activity = UserFilmActivity.objects.get(user=request.user, film=film)
-
-            # Если пользователь пытается установить тот же статус, что уже есть
-            if 'is_planned' in data and activity.is_planned == data['is_planned'] and \
-               'is_watched' in data and activity.is_watched == data['is_watched']:
-                # Просто обновляем другие поля (если есть)
-                if len(data) > 2:  # Если есть поля кроме user и film
-                    serializer = AddUserActivitySerializer(
-                        activity, 
-                        data=data, 
-                        partial=True
-                    )
-                    if serializer.is_valid():
-                        serializer.save()
-                        return Response(serializer.data, status=status.HTTP_200_OK)
-                else:
-                    # Ничего не меняется, возвращаем текущее состояние
-                    serializer = AddUserActivitySerializer(activity)
-                    return Response(serializer.data, status=status.HTTP_200_OK)
-
-            # Обновляем существующую запись
-            serializer = AddUserActivitySerializer(activity, data=data, partial=True)
-            status_code = status.HTTP_200_OK
-
-        except UserFilmActivity.DoesNotExist:
-            # Создаем новую запись
-            serializer = AddUserActivitySerializer(data=data)
-            status_code = status.HTTP_201_CREATED
-
-        # Валидируем и сохраняем
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status_code)
+            activity, created = UserFilmActivity.upsert(
+                request.user.pk, film_id, data
+            )
+        except Film.DoesNotExist:
+            raise Http404('Фильм не найден.')
 
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            AddUserActivitySerializer(activity).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
 
     def patch(self, request, film_id):
         """Частичное обновление дополнительных полей активности.
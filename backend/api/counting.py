@@ -0,0 +1,103 @@
+"""
+Стратегии подсчёта total для выдачи фильмов.
+
+COUNT(*) поверх DISTINCT и join по жанрам дорогой, а точное число
+пользователю почти никогда не нужно. Вьюха выбирает стратегию
+под конкретный action.
+"""
+import hashlib
+import json
+from typing import Optional
+
+from django.core.cache import cache
+from django.db import connections
+
+from talk_about.constants import COUNT_CACHE_TTL, COUNT_ESTIMATE_THRESHOLD
+
+
+class CountStrategy:
+    """Базовая стратегия: точный COUNT(*)."""
+
+    # False - по count нельзя считать страницы: пагинация работает
+    # в режиме has_more, count (если есть) отдаётся для информации
+    counts = True
+
+    def count(self, queryset) -> Optional[int]:
+        return queryset.count()
+
+
+class ExactCount(CountStrategy):
+    """Точный подсчёт на каждый запрос."""
+
+
+class CachedCount(CountStrategy):
+    """Точный подсчёт, закэшированный по нормализованному SQL запроса."""
+
+    def __init__(self, ttl: int = COUNT_CACHE_TTL):
+        self.ttl = ttl
+
+    @staticmethod
+    def make_key(queryset) -> str:
+        # Сортировка на количество не влияет - убираем её из ключа
+        sql, params = queryset.order_by().query.sql_with_params()
+        raw = '{0}|{1}|{2}'.format(
+            queryset.db,
+            sql,
+            json.dumps(params, default=str),
+        )
+        return 'film_count:' + hashlib.sha1(raw.encode()).hexdigest()
+
+    def count(self, queryset) -> Optional[int]:
+        key = self.make_key(queryset)
+        total = cache.get(key)
+        if total is None:
+            total = queryset.count()
+            cache.set(key, total, self.ttl)
+        return total
+
+
+class EstimatedCount(CachedCount):
+    """
+    Оценка числа строк из статистики планировщика PostgreSQL.
+
+    Маленькие выборки (меньше threshold) считаются точно. На других
+    БД - CachedCount. Оценка может ошибаться в обе стороны, поэтому
+    страницы по ней не считаются: пагинация работает в режиме has_more,
+    а число отдаётся в count только для информации.
+    """
+
+    counts = False
+
+    def __init__(self, ttl: int = COUNT_CACHE_TTL,
+                 threshold: int = COUNT_ESTIMATE_THRESHOLD):
+        super().__init__(ttl)
+        self.threshold = threshold
+
+    def estimate(self, queryset) -> Optional[int]:
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    def count(self, queryset) -> Optional[int]:
+        estimated = self.estimate(queryset)
+        if estimated is None or estimated < self.threshold:
+            return super().count(queryset)
+        return estimated
+
+
+class NoCount(CountStrategy):
+    """Не считаем вообще: клиент получает только признак has_more."""
+
+    counts = False
+
+    def count(self, queryset) -> Optional[int]:
+        return None
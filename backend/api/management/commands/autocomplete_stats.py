@@ -0,0 +1,53 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from api.views.films import film_autocomplete
+from gallery.autocomplete import FilmAutocomplete
+
+
+TITLES_PER_REPORT = 100_000
+
+
+class Command(BaseCommand):
+    help = (
+        'Построить индекс автодополнения и показать, сколько памяти '
+        'он занимает (в том числе в пересчёте на 100 тыс. фильмов).'
+    )
+
+    def handle(self, *args, **options):
+        index = FilmAutocomplete(
+            get_queryset=film_autocomplete.get_queryset,
+            serialize=film_autocomplete.serialize,
+            limit=film_autocomplete.limit,
+        )
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        index.build()
+        elapsed = time.perf_counter() - started
+        used, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        stats = index.stats()
+        films = stats['films']
+
+        self.stdout.write(
+            'Фильмов: {0}, ключей: {1}, готовых префиксов: {2}'.format(
+                films, stats['keys'], stats['precomputed_prefixes']
+            )
+        )
+        self.stdout.write(
+            'Сборка: {0:.2f} с, память: {1:.1f} МБ (пик {2:.1f} МБ)'.format(
+                elapsed, used / 2 ** 20, peak / 2 ** 20
+            )
+        )
+
+        if films:
+            per_report = used / films * TITLES_PER_REPORT
+            self.stdout.write(self.style.SUCCESS(
+                'В пересчёте на {0} фильмов: {1:.1f} МБ'.format(
+                    TITLES_PER_REPORT, per_report / 2 ** 20
+                )
+            ))
@@ -1,10 +1,294 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import json
+from functools import partial, reduce
+from operator import or_
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from api.counting import ExactCount
+
+
+class CountingPaginator(DjangoPaginator):
+    """Paginator, который считает count через стратегию подсчёта."""
+
+    def __init__(self, object_list, per_page, count_strategy, **kwargs):
+        self.count_strategy = count_strategy
+        super().__init__(object_list, per_page, **kwargs)
+
+    @cached_property
+    def count(self):
+        return self.count_strategy.count(self.object_list)
 
 
 class FilmSearchPagination(PageNumberPagination):
+    """
+    Постраничная выдача фильмов.
+
+    Количество считается стратегией из api.counting. Если по нему
+    нельзя считать страницы (NoCount, EstimatedCount), отдаём has_more:
+    берём на одну запись больше страницы и смотрим, есть ли она;
+    count тогда только информационный (или None).
+    """
+
+    page_size = 24
+    page_size_query_param = 'page_size'
+    max_page_size = 48
+
+    def __init__(self, count_strategy=None):
+        self.count_strategy = count_strategy or ExactCount()
+        self.django_paginator_class = partial(
+            CountingPaginator, count_strategy=self.count_strategy
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.count_strategy.counts:
+            return super().paginate_queryset(queryset, request, view)
+
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        self.request = request
+        try:
+            self.page_number = int(
+                request.query_params.get(self.page_query_param, 1)
+            )
+        except ValueError:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=request.query_params.get(self.page_query_param),
+                message='Номер страницы должен быть числом.',
+            ))
+        if self.page_number < 1:
+            raise NotFound('Номер страницы должен быть больше 0.')
+
+        offset = (self.page_number - 1) * page_size
+        rows = list(queryset[offset:offset + page_size + 1])
+        self.has_more = len(rows) > page_size
+        self.count = self.count_strategy.count(queryset)
+
+        return rows[:page_size]
+
+    def get_paginated_response(self, data):
+        if self.count_strategy.counts:
+            return super().get_paginated_response(data)
+
+        return Response({
+            'count': self.count,
+            'has_more': self.has_more,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if self.count_strategy.counts:
+            return super().get_next_link()
+
+        if not self.has_more:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.page_query_param, self.page_number + 1
+        )
+
+    def get_previous_link(self):
+        if self.count_strategy.counts:
+            return super().get_previous_link()
+
+        if self.page_number <= 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(
+            url, self.page_query_param, self.page_number - 1
+        )
+
+
+class FilmKeysetPagination(BasePagination):
+    """
+    Keyset-пагинация фильмов: вместо OFFSET - условие "после последней
+    записи" по полям сортировки и id.
+
+    Курсор непрозрачный: base64 от сортировки и значений последней
+    строки. Работает с сортировками из ordering_fields вьюхи и с любыми
+    фильтрами. Если сортировка не поддерживается (например, по
+    релевантности поиска), используется default_ordering.
+    NULL-ы идут там, где их ставит БД (features.nulls_order_largest),
+    чтобы запрос обслуживался обычными составными индексами.
+    """
+
     page_size = 24
     page_size_query_param = 'page_size'
     max_page_size = 48
+    cursor_query_param = 'cursor'
+    default_ordering = ('-kinopoisk_rating', '-year')
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_ordering(self, queryset, view):
+        allowed = set(getattr(view, 'ordering_fields', None) or []) | {'id'}
+        ordering = list(queryset.query.order_by)
+
+        if not ordering or not all(
+            isinstance(term, str) and term.lstrip('-') in allowed
+            for term in ordering
+        ):
+            ordering = list(self.default_ordering)
+
+        # id - уникальный хвост сортировки, без него курсор неоднозначен
+        if not any(term.lstrip('-') in ('id', 'pk') for term in ordering):
+            ordering.append('-id' if ordering[0].startswith('-') else 'id')
+        return ordering
+
+    def encode_cursor(self, ordering, values):
+        # Даты уходят строкой - поле модели разберёт её обратно в фильтре
+        raw = json.dumps({'o': ordering, 'v': values}, default=str).encode()
+        return base64.urlsafe_b64encode(raw).decode()
+
+    def decode_cursor(self, cursor, ordering, model):
+        """
+        Значения курсора, приведённые к типам полей сортировки.
+
+        Курсор приходит от клиента: подделанное значение должно давать
+        404, а не ошибку БД при фильтрации.
+        """
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (binascii.Error, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if (
+            not isinstance(data, dict)
+            or data.get('o') != ordering
+            or not isinstance(data.get('v'), list)
+            or len(data['v']) != len(ordering)
+        ):
+            raise NotFound(self.invalid_cursor_message)
+
+        values = []
+        try:
+            for term, value in zip(ordering, data['v']):
+                name = term.lstrip('-')
+                field = (
+                    model._meta.pk if name == 'pk'
+                    else model._meta.get_field(name)
+                )
+                values.append(
+                    None if value is None else field.to_python(value)
+                )
+        except (FieldDoesNotExist, ValidationError, ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def after_cursor_q(self, ordering, values, nulls_largest):
+        """Условие "строка идёт после курсора" для составной сортировки."""
+        terms = []
+        equal = Q()
+
+        for term, value in zip(ordering, values):
+            name = term.lstrip('-')
+            desc = term.startswith('-')
+            nulls_first = desc == nulls_largest
+
+            if value is None:
+                if nulls_first:
+                    terms.append(equal & Q(**{f'{name}__isnull': False}))
+                equal &= Q(**{f'{name}__isnull': True})
+                continue
+
+            lookup = f'{name}__lt' if desc else f'{name}__gt'
+            strictly_after = Q(**{lookup: value})
+            if not nulls_first and name != 'id':
+                strictly_after |= Q(**{f'{name}__isnull': True})
+            terms.append(equal & strictly_after)
+            equal &= Q(**{name: value})
+
+        return reduce(or_, terms) if terms else Q(pk__in=[])
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        ordering = self.get_ordering(queryset, view)
+        queryset = queryset.order_by(*ordering)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            values = self.decode_cursor(cursor, ordering, queryset.model)
+            nulls_largest = connections[queryset.db].features.nulls_order_largest
+            queryset = queryset.filter(
+                self.after_cursor_q(ordering, values, nulls_largest)
+            )
+
+        rows = list(queryset[:page_size + 1])
+        page = rows[:page_size]
+
+        self.next_cursor = None
+        if len(rows) > page_size:
+            last = page[-1]
+            self.next_cursor = self.encode_cursor(
+                ordering,
+                [getattr(last, term.lstrip('-')) for term in ordering],
+            )
+        return page
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.next_cursor
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class ProfileListPagination(FilmKeysetPagination):
+    """
+    Keyset-пагинация списков профиля: просмотренное, планы, подборки,
+    подписки. Сортировку задаёт queryset вьюхи (поля - в ordering_fields),
+    поэтому глубокие страницы у пользователей с тысячами фильмов
+    не превращаются в большой OFFSET.
+    """
+
+    page_size = 30
+    max_page_size = 100
+    default_ordering = ('-id',)
+
+
+class CreditsPagination(PageNumberPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
 
 
 class ReviewPagination(PageNumberPagination):
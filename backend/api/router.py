@@ -5,7 +5,11 @@ from api.views.activities import ActivityViewSet
 from api.views.reviews import ReviewViewSet, ReviewCommentViewSet
 from api.views.compilations import CompilationViewSet
 from api.views.films import FilmViewSet, TypeList, GenreList, CountryList, MyTopFilmsView, UserTopFilmsView
-from api.views.profile import UserProfileView, MeProfileView, FollowUserView
+from api.views.profile import (UserProfileView, MeProfileView, FollowUserView,
+                               UserProfileSummaryView, MeProfileSummaryView,
+                               UserWatchedView, UserPlannedView,
+                               UserCompilationsView, UserFollowersView,
+                               UserFollowingView)
 from api.views.persons import PersonViewSet
 
 
@@ -28,6 +32,14 @@ urlpatterns = [
     path('users/me/profile/', MeProfileView.as_view(), name='me-profile'),
     path('users/<int:user_id>/follow/', FollowUserView.as_view(), name='user-follow'),
 
+    path('users/<int:user_id>/summary/', UserProfileSummaryView.as_view(), name='user-summary'),
+    path('users/me/summary/', MeProfileSummaryView.as_view(), name='me-summary'),
+    path('users/<int:user_id>/watched/', UserWatchedView.as_view(), name='user-watched'),
+    path('users/<int:user_id>/planned/', UserPlannedView.as_view(), name='user-planned'),
+    path('users/<int:user_id>/compilations/', UserCompilationsView.as_view(), name='user-compilations'),
+    path('users/<int:user_id>/followers/', UserFollowersView.as_view(), name='user-followers'),
+    path('users/<int:user_id>/following/', UserFollowingView.as_view(), name='user-following'),
+
     path('users/me/top-films/', MyTopFilmsView.as_view(), name='me-top-films'),
     path('users/<int:user_id>/top-films/', UserTopFilmsView.as_view(), name='user-top-films'),
 
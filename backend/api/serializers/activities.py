@@ -79,29 +79,18 @@ class AddActivitySerializer(serializers.ModelSerializer):
             'is_public_for_watched',
         )
 
-    def validate_film_id(self, value):
-        """Проверяем, что фильм с таким ID существует."""
-        try:
-            Film.objects.get(pk=value)
-        except Film.DoesNotExist:
-            raise serializers.ValidationError(f"Фильм с id {value} не найден")
-        return value
-
     def create(self, validated_data):
-        """Создаем или обновляем активность."""
+        """Создаем или обновляем активность одним upsert."""
         film_id = validated_data.pop('film_id')
-        film = Film.objects.get(pk=film_id)
         user = validated_data.pop('user')
 
-        activity, created = UserFilmActivity.objects.get_or_create(
-            film=film,
-            user=user,
-            defaults=validated_data,
-        )
-
-        if not created:
-            for attr, value in validated_data.items():
-                setattr(activity, attr, value)
-            activity.save()
+        try:
+            activity, _ = UserFilmActivity.upsert(
+                user.pk, film_id, validated_data
+            )
+        except Film.DoesNotExist:
+            raise serializers.ValidationError(
+                {'film_id': f"Фильм с id {film_id} не найден"}
+            )
 
         return activity
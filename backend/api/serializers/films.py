@@ -1,4 +1,5 @@
-from django.db.models import Avg, Count, Q
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Count, Q
 from rest_framework import serializers
 
 from gallery.models import (Film,
@@ -17,6 +18,21 @@ from gallery.models import (Film,
                             UserTopFilm)
 from activities.models import UserFilmActivity, Review
 from api.serializers.reviews import ReviewListSerializer
+from gallery.credits import build_credits
+from talk_about.constants import LATEST_REVIEWS_LIMIT, SIMILAR_FILMS_LIMIT
+
+
+def get_rating_stats(film):
+    """
+    FilmRatingStats фильма или None, если оценок ещё не было.
+
+    Чтобы не было запроса на каждый фильм, queryset должен
+    делать select_related('rating_stats').
+    """
+    try:
+        return film.rating_stats
+    except ObjectDoesNotExist:
+        return None
 
 
 class GenreSerializer(serializers.ModelSerializer):
@@ -161,6 +177,7 @@ class FilmDetailSerializer(serializers.ModelSerializer):
 
     # Персоны (сгруппированные по профессиям)
     persons_by_profession = serializers.SerializerMethodField()
+    persons_by_profession_more = serializers.SerializerMethodField()
 
     # Сиквелы/приквелы и похожие фильмы
     sequels_and_prequels = serializers.SerializerMethodField()
@@ -226,6 +243,7 @@ class FilmDetailSerializer(serializers.ModelSerializer):
 
             # Персоны
             'persons_by_profession',
+            'persons_by_profession_more',
 
             # Рецензии
             'persons_by_profession',
@@ -245,42 +263,32 @@ class FilmDetailSerializer(serializers.ModelSerializer):
             'activity',
         ]
 
+    def get_credits(self, obj):
+        """Состав фильма считается один раз на оба поля."""
+        if not hasattr(obj, '_credits'):
+            obj._credits = build_credits(obj.pk)
+        return obj._credits
+
     def get_persons_by_profession(self, obj):
         """
-        Группируем всех персон по профессиям.
-        Возвращает словарь: { 'профессия': [список персон] }
-        related_name='film_persons' из модели FilmPerson
+        Группируем персон по профессиям.
+        Возвращает словарь: { 'профессия': [список персон] },
+        в каждой профессии не больше CREDITS_PER_PROFESSION персон.
         """
-        film_persons = obj.film_persons.select_related('person').prefetch_related(
-            'professions__profession'
-        ).all()
-
-        persons_by_profession = {}
-
-        for film_person in film_persons:
-            # Получаем данные персоны
-            person_data = PersonSerializer(film_person.person).data
-            person_data['role_description'] = film_person.description
-
-            # Добавляем персону в каждую её профессию в этом фильме
-            for prof_relation in film_person.professions.all():
-                prof_name = prof_relation.profession.profession
-
-                if prof_name not in persons_by_profession:
-                    persons_by_profession[prof_name] = []
+        return self.get_credits(obj)[0]
 
-                # Проверяем, не добавлена ли уже эта персона в эту профессию
-                if not any(p['id'] == person_data['id'] for p in persons_by_profession[prof_name]):
-                    persons_by_profession[prof_name].append(person_data)
-
-        return persons_by_profession
+    def get_persons_by_profession_more(self, obj):
+        """Сколько персон не вошло в persons_by_profession: { 'профессия': N }."""
+        return self.get_credits(obj)[1]
 
     def get_sequels_and_prequels(self, obj):
         """
         Получаем сиквелы и приквелы.
         related_name='sequels_and_prequels' из модели SequelsAndPrequels
         """
-        sequels = obj.sequels_and_prequels.select_related('related_film').all()
+        sequels = getattr(obj, 'detail_sequels', None)
+        if sequels is None:
+            sequels = obj.sequels_and_prequels.select_related('related_film')
         return SequelsAndPrequelsSerializer(sequels, many=True).data
 
     def get_similar_films(self, obj):
@@ -288,34 +296,22 @@ class FilmDetailSerializer(serializers.ModelSerializer):
         Получаем похожие фильмы.
         related_name='similar_films' из модели SimilarFilms
         """
-        similar = obj.similar_films.select_related('similar_film').all()[:12]
+        similar = getattr(obj, 'detail_similar_films', None)
+        if similar is None:
+            similar = obj.similar_films.select_related(
+                'similar_film'
+            ).order_by('pk')[:SIMILAR_FILMS_LIMIT]
         return SimilarFilmsRelationSerializer(similar, many=True).data
 
     def get_user_rating(self, obj):
-        """
-        Получаем средний рейтинг пользователей.
-        related_name='film_activities' из модели UserFilmActivity
-        """
-        if hasattr(obj, 'avg_rating'):
-            return round(obj.avg_rating, 1) if obj.avg_rating else None
-
-        # Вычисляем средний рейтинг
-        result = UserFilmActivity.objects.filter(
-            film=obj,
-            rating__isnull=False
-        ).aggregate(avg=Avg('rating'))['avg']
-
-        return round(result, 1) if result else None
+        """Средний рейтинг пользователей портала."""
+        stats = get_rating_stats(obj)
+        return stats.average if stats else None
 
     def get_rating_votes_count(self, obj):
         """Количество оценок пользователей."""
-        if hasattr(obj, 'rating_count'):
-            return obj.rating_count
-
-        return UserFilmActivity.objects.filter(
-            film=obj,
-            rating__isnull=False
-        ).count()
+        stats = get_rating_stats(obj)
+        return stats.ratings_count if stats else 0
 
     def get_formatted_budget(self, obj):
         """Форматированный бюджет."""
@@ -340,22 +336,31 @@ class FilmDetailSerializer(serializers.ModelSerializer):
     def get_activity(self, obj):
         """Получаем активити текущего пользователя."""
         request = self.context.get('request')
-        if request and request.user.is_authenticated:
+        if not (request and request.user.is_authenticated):
+            return None
+
+        activities = getattr(obj, 'current_user_activities', None)
+        if activities is not None:
+            activity = activities[0] if activities else None
+        else:
             activity = UserFilmActivity.objects.filter(
                 user=request.user,
                 film=obj
             ).first()
-            if activity:
-                return ActivityInFilmDetailSerializer(activity).data
+
+        if activity:
+            return ActivityInFilmDetailSerializer(activity).data
         return None
 
     def get_latest_reviews(self, obj):
-        reviews = (
-            obj.reviews
-            .select_related('author', 'film')
-            .annotate(comments_count=Count('comments'))
-            .order_by('-created_at')[:7]
-        )
+        reviews = getattr(obj, 'detail_latest_reviews', None)
+        if reviews is None:
+            reviews = (
+                obj.reviews
+                .select_related('author', 'film')
+                .annotate(comments_count=Count('comments'))
+                .order_by('-created_at')[:LATEST_REVIEWS_LIMIT]
+            )
 
         return ReviewListSerializer(
             reviews,
@@ -364,24 +369,31 @@ class FilmDetailSerializer(serializers.ModelSerializer):
         ).data
 
     def get_reviews_stats(self, obj):
-        queryset = Review.objects.filter(film=obj)
-
-        total = queryset.count()
-
-        counts = queryset.aggregate(
-            positive=Count(
-                'id',
-                filter=Q(review_type=Review.ReviewType.POSITIVE),
-            ),
-            neutral=Count(
-                'id',
-                filter=Q(review_type=Review.ReviewType.NEUTRAL),
-            ),
-            negative=Count(
-                'id',
-                filter=Q(review_type=Review.ReviewType.NEGATIVE),
-            ),
-        )
+        if hasattr(obj, 'reviews_positive'):
+            # Аннотации из get_film_detail_queryset
+            counts = {
+                'positive': obj.reviews_positive,
+                'neutral': obj.reviews_neutral,
+                'negative': obj.reviews_negative,
+            }
+        else:
+            counts = Review.objects.filter(film=obj).aggregate(
+                positive=Count(
+                    'id',
+                    filter=Q(review_type=Review.ReviewType.POSITIVE),
+                ),
+                neutral=Count(
+                    'id',
+                    filter=Q(review_type=Review.ReviewType.NEUTRAL),
+                ),
+                negative=Count(
+                    'id',
+                    filter=Q(review_type=Review.ReviewType.NEGATIVE),
+                ),
+            )
+
+        # Других типов рецензий нет, total - сумма
+        total = sum(counts.values())
 
         def item(value):
             percent = round(value * 100 / total, 1) if total else 0
@@ -425,16 +437,9 @@ class SearchListFilmSerilizer(serializers.ModelSerializer):
         ]
 
     def get_rating(self, obj):
-        """Вычисляет средний рейтинг фильма из активностей пользователей."""
-        if hasattr(obj, 'avg_rating'):
-            return round(obj.avg_rating, 1) if obj.avg_rating else None
-
-        result = UserFilmActivity.objects.filter(
-            film=obj,
-            rating__isnull=False
-        ).aggregate(avg=Avg('rating'))['avg']
-
-        return round(result, 1) if result else None
+        """Средний рейтинг фильма из FilmRatingStats."""
+        stats = get_rating_stats(obj)
+        return stats.average if stats else None
 
 
 class TopFilmSerializer(serializers.ModelSerializer):
@@ -1,4 +1,5 @@
 from django.contrib.auth import get_user_model
+from django.db.models import Prefetch, Q, prefetch_related_objects
 from rest_framework import serializers
 
 from api.serializers.users import CustomUserSerializer
@@ -6,6 +7,7 @@ from activities.models import UserFilmActivity
 from compilations.models import Compilation
 from gallery.models import Film
 from blog.models import PhotoUser, Follow
+from users.stats import get_user_stats
 
 User = get_user_model()
 
@@ -94,7 +96,28 @@ class CompilationProfileSerializer(serializers.ModelSerializer):
         )
 
     def get_films_count(self, obj):
-        return obj.films.count()
+        # films предзагружены - len не делает запроса
+        return len(obj.films.all())
+
+
+class CompilationPreviewSerializer(serializers.ModelSerializer):
+    """Подборка в списке подборок профиля: без полного списка фильмов."""
+
+    films_count = serializers.IntegerField(read_only=True)
+    preview_films = ProfileFilmSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Compilation
+        fields = (
+            'id',
+            'title',
+            'description',
+            'is_public',
+            'films_count',
+            'preview_films',
+            'created_at',
+            'updated_at',
+        )
 
 
 class SubscriptionSerializer(serializers.ModelSerializer):
@@ -123,21 +146,19 @@ class SubscriberSerializer(serializers.ModelSerializer):
         )
 
 
-class UserProfileSerializer(serializers.ModelSerializer):
-    """Полный сериализатор страницы пользователя."""
+class UserProfileSummarySerializer(serializers.ModelSerializer):
+    """
+    Шапка страницы пользователя: данные, счётчики и подписка.
 
-    full_name = serializers.SerializerMethodField()
-    avatar_url = serializers.SerializerMethodField()
-
-    activities = serializers.SerializerMethodField()
-    watched_activities = serializers.SerializerMethodField()
-    planned_activities = serializers.SerializerMethodField()
+    Счётчики берутся из UserStats - во вьюхах нужен select_related('stats').
 
-    compilations = serializers.SerializerMethodField()
-    user_photos = serializers.SerializerMethodField()
+    Списки отдаются отдельными постраничными ресурсами
+    (/users/{id}/watched/, /planned/, /compilations/, /followers/,
+    /following/).
+    """
 
-    subscriptions = serializers.SerializerMethodField()
-    subscribers = serializers.SerializerMethodField()
+    full_name = serializers.SerializerMethodField()
+    avatar_url = serializers.SerializerMethodField()
 
     is_subscribed = serializers.SerializerMethodField()
     is_own_profile = serializers.SerializerMethodField()
@@ -173,14 +194,6 @@ class UserProfileSerializer(serializers.ModelSerializer):
 
             'is_subscribed',
             'is_own_profile',
-
-            'activities',
-            'watched_activities',
-            'planned_activities',
-            'compilations',
-            'user_photos',
-            'subscriptions',
-            'subscribers',
         )
 
     def is_owner(self, obj):
@@ -204,133 +217,230 @@ class UserProfileSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(obj.avatar.url)
         return obj.avatar.url
 
-    def get_activities(self, obj):
-        queryset = obj.activities.select_related('film').order_by('-updated_at')
+    def get_activities_count(self, obj):
+        return get_user_stats(obj).activities_count
 
-        if not self.is_owner(obj):
-            queryset = queryset.filter(
-                is_public_for_planned=True
-            ) | queryset.filter(
-                is_public_for_watched=True
+    def get_watched_count(self, obj):
+        return get_user_stats(obj).watched_count
+
+    def get_planned_count(self, obj):
+        return get_user_stats(obj).planned_count
+
+    def get_compilations_count(self, obj):
+        return get_user_stats(obj).compilations_count
+
+    def get_subscriptions_count(self, obj):
+        return get_user_stats(obj).subscriptions_count
+
+    def get_subscribers_count(self, obj):
+        return get_user_stats(obj).subscribers_count
+
+    def get_photos_count(self, obj):
+        return get_user_stats(obj).photos_count
+
+    def get_is_subscribed(self, obj):
+        request = self.context.get('request')
+
+        if not request or not request.user.is_authenticated:
+            return False
+
+        if request.user.pk == obj.pk:
+            return False
+
+        return Follow.objects.filter(
+            follower=request.user,
+            following=obj
+        ).exists()
+
+    def get_is_own_profile(self, obj):
+        request = self.context.get('request')
+
+        if not request or not request.user.is_authenticated:
+            return False
+
+        return request.user.pk == obj.pk
+
+
+def by_date_desc(activities, date_field):
+    """
+    Сортировка активностей по дате поля (новые сверху), затем по
+    updated_at. Активности без даты - в конце.
+    """
+    return sorted(
+        activities,
+        key=lambda activity: (
+            getattr(activity, date_field) is not None,
+            getattr(activity, date_field),
+            activity.updated_at,
+        ),
+        reverse=True,
+    )
+
+
+class UserProfileSerializer(UserProfileSummarySerializer):
+    """
+    Полный сериализатор страницы пользователя: шапка и все списки.
+
+    Списки берутся из предзагрузки profile_prefetches(), фильтры
+    видимости и сортировки для просмотренных/запланированных
+    применяются в Python - число запросов не зависит от размера
+    профиля. Если объект пришёл без предзагрузки, она выполняется
+    в to_representation.
+    """
+
+    activities = serializers.SerializerMethodField()
+    watched_activities = serializers.SerializerMethodField()
+    planned_activities = serializers.SerializerMethodField()
+
+    compilations = serializers.SerializerMethodField()
+    user_photos = serializers.SerializerMethodField()
+
+    subscriptions = serializers.SerializerMethodField()
+    subscribers = serializers.SerializerMethodField()
+
+    class Meta(UserProfileSummarySerializer.Meta):
+        fields = UserProfileSummarySerializer.Meta.fields + (
+            'activities',
+            'watched_activities',
+            'planned_activities',
+            'compilations',
+            'user_photos',
+            'subscriptions',
+            'subscribers',
+        )
+
+    @staticmethod
+    def profile_prefetches(is_owner):
+        """
+        Предзагрузка списков профиля.
+
+        Чужие приватные активности и подборки отсекаются в запросе:
+        активности попадают в profile_activities, подборки - в
+        profile_compilations.
+        """
+        activities = UserFilmActivity.objects.select_related(
+            'film'
+        ).order_by('-updated_at')
+        compilations = Compilation.objects.prefetch_related(
+            'films'
+        ).order_by('-created_at')
+
+        if not is_owner:
+            activities = activities.filter(
+                Q(is_public_for_planned=True) | Q(is_public_for_watched=True)
             )
+            compilations = compilations.filter(is_public=True)
+
+        return (
+            Prefetch(
+                'activities',
+                queryset=activities,
+                to_attr='profile_activities',
+            ),
+            Prefetch(
+                'collections',
+                queryset=compilations,
+                to_attr='profile_compilations',
+            ),
+            Prefetch(
+                'user_photos',
+                queryset=PhotoUser.objects.order_by('-uploaded_at'),
+            ),
+            Prefetch(
+                'user_subscriptions',
+                queryset=Follow.objects.select_related(
+                    'following'
+                ).order_by('-id'),
+            ),
+            Prefetch(
+                'user_subscribers',
+                queryset=Follow.objects.select_related(
+                    'follower'
+                ).order_by('-id'),
+            ),
+        )
 
-            queryset = queryset.distinct().order_by('-updated_at')
+    def to_representation(self, instance):
+        if not hasattr(instance, 'profile_activities'):
+            prefetch_related_objects(
+                [instance], *self.profile_prefetches(self.is_owner(instance))
+            )
+        return super().to_representation(instance)
 
+    def get_is_subscribed(self, obj):
+        request = self.context.get('request')
+
+        if not request or not request.user.is_authenticated:
+            return False
+
+        if request.user.pk == obj.pk:
+            return False
+
+        # Подписчики уже загружены для списка subscribers
+        return any(
+            follow.follower_id == request.user.pk
+            for follow in obj.user_subscribers.all()
+        )
+
+    def get_activities(self, obj):
         return UserFilmActivityProfileSerializer(
-            queryset,
+            obj.profile_activities,
             many=True,
             context=self.context
         ).data
 
     def get_watched_activities(self, obj):
-        queryset = obj.activities.filter(
-            is_watched=True
-        ).select_related('film')
-
-        if not self.is_owner(obj):
-            queryset = queryset.filter(is_public_for_watched=True)
-
-        queryset = queryset.order_by('-watched_at', '-updated_at')
+        is_owner = self.is_owner(obj)
+        activities = [
+            activity for activity in obj.profile_activities
+            if activity.is_watched
+            and (is_owner or activity.is_public_for_watched)
+        ]
 
         return UserFilmActivityProfileSerializer(
-            queryset,
+            by_date_desc(activities, 'watched_at'),
             many=True,
             context=self.context
         ).data
 
     def get_planned_activities(self, obj):
-        queryset = obj.activities.filter(
-            is_planned=True
-        ).select_related('film')
-
-        if not self.is_owner(obj):
-            queryset = queryset.filter(is_public_for_planned=True)
-
-        queryset = queryset.order_by('-planned_at', '-updated_at')
+        is_owner = self.is_owner(obj)
+        activities = [
+            activity for activity in obj.profile_activities
+            if activity.is_planned
+            and (is_owner or activity.is_public_for_planned)
+        ]
 
         return UserFilmActivityProfileSerializer(
-            queryset,
+            by_date_desc(activities, 'planned_at'),
             many=True,
             context=self.context
         ).data
 
     def get_compilations(self, obj):
-        queryset = obj.collections.prefetch_related('films')
-
-        if not self.is_owner(obj):
-            queryset = queryset.filter(is_public=True)
-
-        queryset = queryset.order_by('-created_at')
-
         return CompilationProfileSerializer(
-            queryset,
+            obj.profile_compilations,
             many=True,
             context=self.context
         ).data
 
     def get_user_photos(self, obj):
-        queryset = obj.user_photos.order_by('-uploaded_at')
         return PhotoUserSerializer(
-            queryset,
+            obj.user_photos.all(),
             many=True,
             context=self.context
         ).data
 
     def get_subscriptions(self, obj):
-        queryset = obj.user_subscriptions.select_related('following').order_by('-id')
         return SubscriptionSerializer(
-            queryset,
+            obj.user_subscriptions.all(),
             many=True,
             context=self.context
         ).data
 
     def get_subscribers(self, obj):
-        queryset = obj.user_subscribers.select_related('follower').order_by('-id')
         return SubscriberSerializer(
-            queryset,
+            obj.user_subscribers.all(),
             many=True,
             context=self.context
         ).data
-
-    def get_activities_count(self, obj):
-        return obj.activities.count()
-
-    def get_watched_count(self, obj):
-        return obj.activities.filter(is_watched=True).count()
-
-    def get_planned_count(self, obj):
-        return obj.activities.filter(is_planned=True).count()
-
-    def get_compilations_count(self, obj):
-        return obj.collections.count()
-
-    def get_subscriptions_count(self, obj):
-        return obj.user_subscriptions.count()
-
-    def get_subscribers_count(self, obj):
-        return obj.user_subscribers.count()
-
-    def get_photos_count(self, obj):
-        return obj.user_photos.count()
-
-    def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-
-        if not request or not request.user.is_authenticated:
-            return False
-
-        if request.user.pk == obj.pk:
-            return False
-
-        return Follow.objects.filter(
-            follower=request.user,
-            following=obj
-        ).exists()
-
-    def get_is_own_profile(self, obj):
-        request = self.context.get('request')
-
-        if not request or not request.user.is_authenticated:
-            return False
-
-        return request.user.pk == obj.pk
@@ -0,0 +1,535 @@
+import base64
+import json
+from urllib.parse import parse_qs, urlparse
+
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from activities.models import CommentReview, Review, UserFilmActivity
+from blog.models import Follow, PhotoUser
+from api.counting import EstimatedCount
+from api.pagination import FilmSearchPagination
+from compilations.models import Compilation
+from gallery.models import (
+    Country,
+    Fact,
+    Film,
+    FilmPerson,
+    FilmPersonProfession,
+    Genre,
+    Person,
+    Profession,
+    SequelsAndPrequels,
+    SimilarFilms,
+    Video,
+)
+from users.stats import rebuild_user_stats
+
+User = get_user_model()
+
+
+def make_user(name):
+    return User.objects.create_user(
+        username=name, email=f'{name}@example.com', password='password'
+    )
+
+
+class FilmRetrieveQueriesTests(TestCase):
+    """Число запросов страницы фильма не зависит от его размера."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reviewer = make_user('reviewer')
+        cls.user = make_user('viewer')
+        cls.profession = Profession.objects.create(
+            profession='актеры', en_profession='actor'
+        )
+        cls.small = cls.make_film('small', 1)
+        cls.large = cls.make_film('large', 5)
+
+    @classmethod
+    def make_film(cls, name, size):
+        film = Film.objects.create(name=name, year=2000)
+        for i in range(size):
+            slug = f'{name}-{i}'
+            film.genres.add(Genre.objects.create(name=slug, slug=slug))
+            film.countries.add(Country.objects.create(name=slug, slug=slug))
+            Video.objects.create(film=film, url=f'https://example.com/{slug}')
+            Fact.objects.create(film=film, text=slug)
+
+            person = Person.objects.create(name=slug)
+            film_person = FilmPerson.objects.create(film=film, person=person)
+            FilmPersonProfession.objects.create(
+                film_person=film_person, profession=cls.profession
+            )
+
+            SequelsAndPrequels.objects.create(
+                film=film,
+                related_film=Film.objects.create(name=f'{slug} sequel'),
+            )
+            SimilarFilms.objects.create(
+                film=film,
+                similar_film=Film.objects.create(name=f'{slug} similar'),
+            )
+
+            author = make_user(f'author-{slug}')
+            review = Review.objects.create(
+                author=author, film=film, title=slug, text=slug,
+                review_type=Review.ReviewType.POSITIVE,
+            )
+            CommentReview.objects.create(
+                author=cls.reviewer, review=review, text=slug
+            )
+            UserFilmActivity.objects.create(
+                user=author, film=film, is_watched=True, rating=i % 10
+            )
+        UserFilmActivity.objects.create(
+            user=cls.user, film=film, is_watched=True, rating=7
+        )
+        return film
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def assert_retrieve_queries(self, num):
+        for film in (self.small, self.large):
+            with self.subTest(film=film.name):
+                cache.clear()
+                with self.assertNumQueries(num):
+                    response = self.client.get(f'/api/v1/films/{film.pk}/')
+                self.assertEqual(response.status_code, 200)
+
+    def test_anonymous(self):
+        self.assert_retrieve_queries(10)
+
+        # Из кэша - только updated_at фильма для ключа
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/v1/films/{self.large.pk}/')
+        self.assertIsNone(response.data['activity'])
+
+    def test_authenticated(self):
+        self.client.force_authenticate(self.user)
+        self.assert_retrieve_queries(11)
+
+        # Из кэша - updated_at фильма и активность пользователя
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/v1/films/{self.large.pk}/')
+        self.assertEqual(response.data['activity']['current_user_rating'], 7)
+
+
+class UserProfileQueriesTests(TestCase):
+    """Число запросов полного профиля не зависит от его размера."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.films = [
+            Film.objects.create(name=f'film {i}', year=2000) for i in range(6)
+        ]
+        cls.viewer = make_user('viewer')
+        cls.small = cls.make_profile('small', 1)
+        cls.large = cls.make_profile('large', 5)
+
+    @classmethod
+    def make_profile(cls, name, size):
+        user = make_user(name)
+        for i in range(size):
+            UserFilmActivity.objects.create(
+                user=user, film=cls.films[i], is_watched=i % 2 == 0,
+                is_planned=i % 2 == 1, rating=i if i % 2 == 0 else None,
+            )
+            compilation = Compilation.objects.create(
+                user=user, title=f'{name} {i}', is_public=i % 2 == 0
+            )
+            compilation.films.add(*cls.films[:i + 1])
+            PhotoUser.objects.create(user=user, image=f'{name}-{i}.jpg')
+
+            Follow.objects.create(
+                follower=make_user(f'{name}-follower-{i}'), following=user
+            )
+            Follow.objects.create(
+                follower=user, following=make_user(f'{name}-following-{i}')
+            )
+        # Зритель подписан на оба профиля
+        Follow.objects.create(follower=cls.viewer, following=user)
+        return user
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def get_profiles(self, viewer, url):
+        """
+        Профили small и large глазами viewer (профиль -> пользователь
+        или None): одинаковое число запросов, ответы по порядку.
+        """
+        responses = []
+        for profile in (self.small, self.large):
+            with self.subTest(profile=profile.username):
+                self.client.force_authenticate(viewer(profile))
+                with self.assertNumQueries(7):
+                    response = self.client.get(url(profile))
+                self.assertEqual(response.status_code, 200)
+                responses.append(response.data)
+        return responses
+
+    def profile_url(self, profile):
+        return f'/api/v1/users/{profile.pk}/profile/'
+
+    def test_owner(self):
+        small, large = self.get_profiles(lambda profile: profile, self.profile_url)
+
+        self.assertEqual(len(small['activities']), 1)
+        self.assertEqual(len(large['activities']), 5)
+        self.assertEqual(len(large['compilations']), 5)
+        self.assertEqual(len(large['subscribers']), 6)
+        self.assertEqual(len(large['subscriptions']), 5)
+        self.assertFalse(large['is_subscribed'])
+
+    def test_me(self):
+        small, large = self.get_profiles(
+            lambda profile: profile, lambda profile: '/api/v1/users/me/profile/'
+        )
+
+        self.assertEqual(small['id'], self.small.pk)
+        self.assertEqual(large['id'], self.large.pk)
+        self.assertEqual(len(large['activities']), 5)
+
+    def test_anonymous(self):
+        _, large = self.get_profiles(lambda profile: None, self.profile_url)
+
+        self.assertEqual(len(large['subscribers']), 6)
+        self.assertFalse(large['is_subscribed'])
+
+    def test_other_user(self):
+        _, large = self.get_profiles(
+            lambda profile: self.viewer, self.profile_url
+        )
+
+        self.assertEqual(len(large['subscribers']), 6)
+        self.assertTrue(large['is_subscribed'])
+
+
+class UserProfileListsTests(TestCase):
+    """Постраничные списки и шапка профиля глазами разных зрителей."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = make_user('owner')
+        cls.viewer = make_user('viewer')
+        films = Film.objects.bulk_create(
+            [Film(name=f'film {i}', year=2000) for i in range(80)]
+        )
+
+        # По две активности на минуту - порядок внутри решает id
+        now = timezone.now()
+        UserFilmActivity.objects.bulk_create([
+            UserFilmActivity(
+                user=cls.owner, film=film, is_watched=True,
+                watched_at=now - timedelta(minutes=i // 2),
+                is_public_for_watched=i % 5 != 0,
+            )
+            for i, film in enumerate(films[:70])
+        ] + [
+            UserFilmActivity(
+                user=cls.owner, film=film, is_planned=True,
+                planned_at=now - timedelta(minutes=i),
+                is_public_for_planned=i % 3 != 0,
+            )
+            for i, film in enumerate(films[70:])
+        ])
+        # bulk_create сигналов не шлёт
+        rebuild_user_stats()
+
+        for i in range(4):
+            compilation = Compilation.objects.create(
+                user=cls.owner, title=f'compilation {i}', is_public=i != 0
+            )
+            compilation.films.add(*films[:i + 1])
+
+        Follow.objects.create(follower=cls.viewer, following=cls.owner)
+        for i in range(34):
+            Follow.objects.create(
+                follower=make_user(f'follower-{i}'), following=cls.owner
+            )
+        for i in range(2):
+            Follow.objects.create(
+                follower=cls.owner, following=make_user(f'following-{i}')
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def url(self, name):
+        return f'/api/v1/users/{self.owner.pk}/{name}/'
+
+    def login(self, user):
+        self.client.force_authenticate(user)
+
+    def walk(self, name):
+        """Все записи списка по курсору: (id по порядку, число страниц)."""
+        ids = []
+        pages = 0
+        params = {}
+        while True:
+            response = self.client.get(self.url(name), params)
+            self.assertEqual(response.status_code, 200)
+            ids += [row['id'] for row in response.data['results']]
+            pages += 1
+            cursor = next_cursor(response)
+            if not cursor:
+                return ids, pages
+            params = {'cursor': cursor}
+
+    def assert_walk(self, name, total, pages):
+        ids, walked_pages = self.walk(name)
+        self.assertEqual(len(ids), total)
+        self.assertEqual(walked_pages, pages)
+
+        response = self.client.get(self.url(name), {'page_size': 100})
+        self.assertEqual(ids, [row['id'] for row in response.data['results']])
+        return ids
+
+    def test_watched(self):
+        self.login(self.owner)
+        self.assert_walk('watched', total=70, pages=3)
+
+        for viewer in (self.viewer, None):
+            with self.subTest(viewer=viewer):
+                self.login(viewer)
+                ids = self.assert_walk('watched', total=56, pages=2)
+                self.assertFalse(UserFilmActivity.objects.filter(
+                    pk__in=ids, is_public_for_watched=False
+                ).exists())
+
+    def test_planned(self):
+        self.login(self.owner)
+        self.assert_walk('planned', total=10, pages=1)
+
+        for viewer in (self.viewer, None):
+            with self.subTest(viewer=viewer):
+                self.login(viewer)
+                self.assert_walk('planned', total=6, pages=1)
+
+    def test_compilations(self):
+        self.login(self.owner)
+        self.assert_walk('compilations', total=4, pages=1)
+        response = self.client.get(self.url('compilations'))
+        self.assertEqual(
+            [row['films_count'] for row in response.data['results']],
+            [4, 3, 2, 1],
+        )
+
+        for viewer in (self.viewer, None):
+            with self.subTest(viewer=viewer):
+                self.login(viewer)
+                self.assert_walk('compilations', total=3, pages=1)
+
+    def test_follows(self):
+        for viewer in (self.owner, self.viewer, None):
+            with self.subTest(viewer=viewer):
+                self.login(viewer)
+                self.assert_walk('followers', total=35, pages=2)
+                self.assert_walk('following', total=2, pages=1)
+
+    def test_summary(self):
+        cases = (
+            (self.owner, True, False),
+            (self.viewer, False, True),
+            (None, False, False),
+        )
+        for viewer, own, subscribed in cases:
+            with self.subTest(viewer=viewer):
+                self.login(viewer)
+                response = self.client.get(self.url('summary'))
+
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data['is_own_profile'], own)
+                self.assertEqual(response.data['is_subscribed'], subscribed)
+                self.assertEqual(response.data['watched_count'], 70)
+                self.assertEqual(response.data['planned_count'], 10)
+                self.assertEqual(response.data['subscribers_count'], 35)
+
+        self.login(self.owner)
+        response = self.client.get('/api/v1/users/me/summary/')
+        self.assertEqual(response.data['id'], self.owner.pk)
+
+        self.login(None)
+        response = self.client.get('/api/v1/users/me/summary/')
+        self.assertIn(response.status_code, (401, 403))
+
+    def test_bad_cursor(self):
+        lists = {
+            'watched': ['garbage', 'garbage', 1],
+            'planned': [[], None, 1],
+            'compilations': [{'a': 1}, 1],
+            'followers': ['x'],
+            'following': ['1x'],
+        }
+        for name, values in lists.items():
+            with self.subTest(name=name):
+                response = self.client.get(self.url(name))
+                self.assertEqual(response.status_code, 200)
+
+                # У коротких списков курсора нет - берём сортировку
+                # из курсора с page_size=1
+                cursor = next_cursor(
+                    self.client.get(self.url(name), {'page_size': 1})
+                )
+                response = self.client.get(
+                    self.url(name), {'cursor': tamper_cursor(cursor, values)}
+                )
+                self.assertEqual(response.status_code, 404)
+
+                response = self.client.get(self.url(name), {'cursor': '!!'})
+                self.assertEqual(response.status_code, 404)
+
+    def test_unknown_user(self):
+        response = self.client.get('/api/v1/users/0/watched/')
+        self.assertEqual(response.status_code, 404)
+
+
+class FixedEstimate(EstimatedCount):
+    """Оценка планировщика, которая ошибается на заданное число."""
+
+    def __init__(self, estimate):
+        super().__init__(threshold=0)
+        self.estimated = estimate
+
+    def estimate(self, queryset):
+        return self.estimated
+
+
+class EstimatedCountPaginationTests(TestCase):
+    """Оценка числа строк не влияет на страницы и ссылки."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Film.objects.bulk_create(
+            [Film(name=f'film {i}', year=2000) for i in range(30)]
+        )
+
+    def paginate(self, estimate, page):
+        paginator = FilmSearchPagination(count_strategy=FixedEstimate(estimate))
+        request = Request(APIRequestFactory().get('/films/', {'page': page}))
+        rows = paginator.paginate_queryset(
+            Film.objects.order_by('pk'), request
+        )
+        return rows, paginator.get_paginated_response([]).data
+
+    def test_low_estimate(self):
+        rows, data = self.paginate(estimate=5, page=2)
+
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(data['count'], 5)
+        self.assertFalse(data['has_more'])
+        self.assertIsNone(data['next'])
+
+    def test_high_estimate(self):
+        rows, data = self.paginate(estimate=1000, page=1)
+        self.assertEqual(len(rows), 24)
+        self.assertTrue(data['has_more'])
+
+        rows, data = self.paginate(estimate=1000, page=2)
+        self.assertEqual(len(rows), 6)
+        self.assertIsNone(data['next'])
+
+    def test_list_view(self):
+        response = APIClient().get('/api/v1/films/', {'page': 2})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 6)
+        self.assertFalse(response.data['has_more'])
+
+
+def next_cursor(response):
+    url = response.data['next']
+    return url and parse_qs(urlparse(url).query)['cursor'][0]
+
+
+def tamper_cursor(cursor, values):
+    data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    data['v'] = values
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+
+class FilmKeysetPaginationTests(TestCase):
+    """Курсор проходит все фильмы по порядку и не падает на подделке."""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Повторы и NULL в полях сортировки - хвост сортировки решает id
+        Film.objects.bulk_create([
+            Film(
+                name=f'film {i}',
+                kinopoisk_rating=None if i % 4 == 0 else i % 3 + 5.5,
+                year=None if i % 5 == 0 else 2000 + i % 2,
+            )
+            for i in range(30)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def get(self, **params):
+        return self.client.get(
+            '/api/v1/films/',
+            {'pagination': 'keyset', 'page_size': 7, **params},
+        )
+
+    def walk(self, **params):
+        ids = []
+        cursor = None
+        while True:
+            if cursor:
+                params['cursor'] = cursor
+            response = self.get(**params)
+            self.assertEqual(response.status_code, 200)
+            ids += [film['id'] for film in response.data['results']]
+            cursor = next_cursor(response)
+            if not cursor:
+                return ids
+
+    def one_page(self, ordering):
+        response = self.get(ordering=ordering, page_size=48)
+        self.assertIsNone(response.data['next'])
+        return [film['id'] for film in response.data['results']]
+
+    def test_next_page_continuity(self):
+        for ordering in ('-kinopoisk_rating,-year', 'year,-kinopoisk_rating'):
+            with self.subTest(ordering=ordering):
+                ids = self.walk(ordering=ordering)
+
+                self.assertEqual(len(ids), 30)
+                self.assertEqual(ids, self.one_page(ordering))
+
+    def test_null_values(self):
+        # По одному фильму: курсор встаёт и на строки с NULL. Где NULL -
+        # в начале или в конце - решает БД, поэтому в обе стороны
+        first_values = []
+        for ordering in ('kinopoisk_rating,year', '-kinopoisk_rating,-year'):
+            with self.subTest(ordering=ordering):
+                ids = self.walk(ordering=ordering, page_size=1)
+                self.assertEqual(ids, self.one_page(ordering))
+
+                cursor = next_cursor(self.get(ordering=ordering, page_size=1))
+                first_values.append(
+                    json.loads(base64.urlsafe_b64decode(cursor))['v'][0]
+                )
+
+        self.assertIn(None, first_values)
+
+    def test_tampered_cursor(self):
+        cursor = next_cursor(self.get())
+
+        for values in (['abc', 2000, 1], [7.5, [1], 1], [7.5, 2000, 'x']):
+            with self.subTest(values=values):
+                response = self.get(cursor=tamper_cursor(cursor, values))
+                self.assertEqual(response.status_code, 404)
+
+        self.assertEqual(self.get(cursor='not a cursor').status_code, 404)
@@ -5,34 +5,159 @@ from rest_framework.decorators import action
 import random
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Case, When, IntegerField, Value, Q
+from django.db.models import (Case, Count, When, IntegerField, OuterRef,
+                              Prefetch, Subquery, Value, Q)
+from django.db.models.functions import Coalesce
 from django_filters.rest_framework import DjangoFilterBackend
 from django.shortcuts import get_object_or_404
-
-from gallery.models import (Film, Genre, Country, Type, UserTopFilm)
+from django.utils import timezone
+
+from gallery.autocomplete import FilmAutocomplete
+from gallery.cache import film_detail_key, get_film_detail, set_film_detail
+from gallery.discover import DiscoverPool
+from gallery.credits import credit_payload, credits_queryset
+from gallery.models import (Film, Genre, Country, Type, UserTopFilm,
+                            SequelsAndPrequels, SimilarFilms)
+from activities.models import Review, UserFilmActivity
+from gallery.search import filter_by_title, fuzzy_search
 from api.filters import FilmFilter
-from api.serializers.films import (FilmDetailSerializer,
+from api.serializers.films import (ActivityInFilmDetailSerializer,
+                                   FilmDetailSerializer,
                                    SearchListFilmSerilizer,
                                    GenreSerializer,
                                    CountrySerializer,
                                    TypeSerializer,
                                    UserTopFilmSerializer,
                                    TopFilmSerializer)
-from api.pagination import FilmSearchPagination
+from api.counting import CachedCount, EstimatedCount, ExactCount, NoCount
+from api.pagination import (CreditsPagination, FilmKeysetPagination,
+                            FilmSearchPagination)
 from talk_about.constants import (MIN_RATING,
                                   EXCLUDED_GENRES,
+                                  LATEST_REVIEWS_LIMIT,
                                   MIN_SEARCH_VOTES,
-                                  SEARCH_SUGGESTIONS_LIMIT)
+                                  SEARCH_SUGGESTIONS_LIMIT,
+                                  SIMILAR_FILMS_LIMIT)
 
 
 User = get_user_model()
 
 
+def get_autocomplete_queryset():
+    """Фильмы для индекса автодополнения."""
+    return Film.objects.exclude(
+        Q(name__isnull=True) &
+        Q(alternative_name__isnull=True) &
+        Q(en_name__isnull=True)
+    ).select_related(
+        'type', 'rating_stats'
+    ).prefetch_related(
+        'genres'
+    )
+
+
+film_autocomplete = FilmAutocomplete(
+    get_queryset=get_autocomplete_queryset,
+    serialize=lambda films: SearchListFilmSerilizer(films, many=True).data,
+    limit=SEARCH_SUGGESTIONS_LIMIT,
+    # Оценки портала меняют FilmRatingStats, а не сам фильм
+    change_fields=('updated_at', 'rating_stats__updated_at'),
+)
+
+
+def get_discover_queryset(min_rating=MIN_RATING):
+    """
+    Фильмы для случайных подборок:
+    - рейтинг >= min_rating
+    - есть постер
+    - есть хотя бы один жанр
+    - исключены нежелательные жанры
+    """
+    return (
+        Film.objects.filter(
+            kinopoisk_rating__gte=min_rating,
+            genres__isnull=False,  # 👈 есть хотя бы один жанр
+        )
+        .exclude(
+            Q(poster_url__isnull=True) | Q(poster_url='')
+        )
+        .exclude(
+            genres__name__in=EXCLUDED_GENRES
+        )
+        .distinct()
+    )
+
+
+discover_pool = DiscoverPool(get_queryset=get_discover_queryset)
+
+
+def count_reviews(review_type):
+    """Подзапрос: число рецензий фильма данного типа."""
+    reviews = Review.objects.filter(
+        film=OuterRef('pk'),
+        review_type=review_type,
+    ).order_by().values('film').annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(reviews), 0)
+
+
+def get_film_detail_queryset(user):
+    """
+    Всё, что нужно странице фильма, за фиксированное число запросов.
+
+    Связанные списки - Prefetch в атрибуты detail_*, которые читает
+    FilmDetailSerializer, счётчики рецензий - подзапросами. Состав
+    фильма собирает gallery.credits одним запросом.
+    """
+    prefetches = [
+        'genres',
+        'countries',
+        'videos',
+        'facts',
+        Prefetch(
+            'sequels_and_prequels',
+            queryset=SequelsAndPrequels.objects.select_related('related_film'),
+            to_attr='detail_sequels',
+        ),
+        Prefetch(
+            'similar_films',
+            queryset=SimilarFilms.objects.select_related(
+                'similar_film'
+            ).order_by('pk')[:SIMILAR_FILMS_LIMIT],
+            to_attr='detail_similar_films',
+        ),
+        Prefetch(
+            'reviews',
+            queryset=Review.objects.select_related('author').annotate(
+                comments_count=Count('comments')
+            ).order_by('-created_at')[:LATEST_REVIEWS_LIMIT],
+            to_attr='detail_latest_reviews',
+        ),
+    ]
+    if user.is_authenticated:
+        prefetches.append(Prefetch(
+            'film_activities',
+            queryset=UserFilmActivity.objects.filter(user=user),
+            to_attr='current_user_activities',
+        ))
+
+    return Film.objects.select_related(
+        'type', 'rating_stats'
+    ).prefetch_related(
+        *prefetches
+    ).annotate(
+        reviews_positive=count_reviews(Review.ReviewType.POSITIVE),
+        reviews_neutral=count_reviews(Review.ReviewType.NEUTRAL),
+        reviews_negative=count_reviews(Review.ReviewType.NEGATIVE),
+    )
+
+
 class FilmViewSet(viewsets.ModelViewSet):
     """Вьюсет для фильмов."""
 
-    queryset = Film.objects.all().select_related('type').prefetch_related(
-        'genres', 'countries', 'persons'
+    queryset = Film.objects.all().select_related(
+        'type', 'rating_stats'
+    ).prefetch_related(
+        'genres'
     ).distinct()
     serializer_class = FilmDetailSerializer
     permission_classes = []
@@ -55,6 +180,125 @@ class FilmViewSet(viewsets.ModelViewSet):
     ]
     ordering = ['-kinopoisk_rating', '-year']
 
+    # Как считать total для каждого action
+    count_strategies = {
+        'list': EstimatedCount(),
+        'search': CachedCount(),
+        'search_suggestions': CachedCount(),
+        'discover': CachedCount(),
+    }
+
+    def get_count_strategy(self):
+        """
+        Стратегия подсчёта total для текущего action.
+
+        ?with_count=false - не считать вовсе, отдать has_more.
+        """
+        with_count = self.request.query_params.get('with_count', '').lower()
+        if with_count in ('0', 'false', 'no'):
+            return NoCount()
+        return self.count_strategies.get(self.action, ExactCount())
+
+    # Action-ы, где можно листать курсором (?pagination=keyset или ?cursor=)
+    keyset_actions = ('list', 'search')
+
+    def use_keyset_pagination(self):
+        params = self.request.query_params
+        return self.action in self.keyset_actions and (
+            params.get('pagination') == 'keyset' or 'cursor' in params
+        )
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.pagination_class is None:
+                self._paginator = None
+            elif self.use_keyset_pagination():
+                self._paginator = FilmKeysetPagination()
+            else:
+                self._paginator = self.pagination_class(
+                    count_strategy=self.get_count_strategy()
+                )
+        return self._paginator
+
+    # Action-ы, которые отдают FilmDetailSerializer по одному фильму
+    detail_actions = ('retrieve', 'update', 'partial_update')
+
+    def get_queryset(self):
+        if self.action in self.detail_actions:
+            return get_film_detail_queryset(self.request.user)
+        return super().get_queryset()
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Страница фильма.
+
+        Анонимная часть ответа кэшируется (gallery.cache), активность
+        текущего пользователя и can_edit рецензий подставляются
+        на каждый запрос.
+        """
+        film_id = str(kwargs[self.lookup_url_kwarg or self.lookup_field])
+        film = Film.objects.filter(
+            pk=film_id
+        ).values('pk', 'updated_at').first() if film_id.isdigit() else None
+        if film is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        key = film_detail_key(film['pk'], film['updated_at'], request.get_host())
+        data = get_film_detail(key)
+        if data is None:
+            data = dict(self.get_serializer(self.get_object()).data)
+            activity = data['activity']
+            set_film_detail(key, dict(data, activity=None))
+        else:
+            activity = self.get_current_user_activity(film['pk'])
+
+        user = request.user
+        data['activity'] = activity
+        for review in data['latest_reviews']:
+            review['can_edit'] = (
+                user.is_authenticated and review['author']['id'] == user.id
+            )
+        return Response(data)
+
+    @action(
+        detail=True,
+        methods=['get'],
+        url_path='credits',
+        url_name='credits',
+        permission_classes=[permissions.AllowAny],
+    )
+    def credits(self, request, pk=None):
+        """
+        Полный состав фильма постранично.
+
+        ?profession=актеры - только одна профессия.
+        """
+        film = get_object_or_404(Film.objects.only('pk'), pk=pk)
+        rows = credits_queryset(film.pk, request.query_params.get('profession'))
+
+        paginator = CreditsPagination()
+        page = paginator.paginate_queryset(rows, request, view=self)
+        today = timezone.now().date()
+        results = [
+            dict(credit_payload(row, today), profession=row[0])
+            for row in page
+        ]
+        return paginator.get_paginated_response(results)
+
+    def get_current_user_activity(self, film_id):
+        """Блок activity страницы фильма для текущего пользователя."""
+        if not self.request.user.is_authenticated:
+            return None
+
+        activity = UserFilmActivity.objects.filter(
+            user=self.request.user,
+            film_id=film_id,
+        ).first()
+        if activity is None:
+            return None
+        return ActivityInFilmDetailSerializer(activity).data
+
     def get_serializer_class(self):
         if self.action in ['list',
                            'random_top_films',
@@ -65,30 +309,39 @@ class FilmViewSet(viewsets.ModelViewSet):
         return super().get_serializer_class()
 
     def get_random_films_base_queryset(self, min_rating=MIN_RATING):
-        """
-        Базовый queryset для случайных подборок:
-        - рейтинг >= min_rating
-        - есть постер
-        - есть хотя бы один жанр
-        - исключены нежелательные жанры
-        """
-        queryset = (
-            Film.objects.filter(
-                kinopoisk_rating__gte=min_rating,
-                genres__isnull=False,  # 👈 есть хотя бы один жанр
-            )
-            .exclude(
-                Q(poster_url__isnull=True) | Q(poster_url='')
-            )
-            .exclude(
-                genres__name__in=EXCLUDED_GENRES
-            )
-            .select_related('type')
-            .prefetch_related('genres', 'persons')
-            .distinct()
-        )
+        """Базовый queryset для случайных подборок."""
+        return get_discover_queryset(min_rating).select_related(
+            'type', 'rating_stats'
+        ).prefetch_related('genres')
+
+    def discover_from_db(self, count, genre_ids, year_min, year_max):
+        """Случайная выборка через БД, пока пул discover не собран."""
+        queryset = self.get_random_films_base_queryset(min_rating=MIN_RATING)
+
+        if genre_ids:
+            queryset = queryset.filter(genres__id__in=genre_ids).distinct()
+        if year_min is not None:
+            queryset = queryset.filter(year__gte=year_min)
+        if year_max is not None:
+            queryset = queryset.filter(year__lte=year_max)
+
+        # Для выборки случайных фильмов нужен total, NoCount здесь не подходит
+        total = self.count_strategies['discover'].count(queryset)
+
+        if total == 0:
+            films = []
+        elif total <= count:
+            films = list(queryset)
+            random.shuffle(films)
+        else:
+            if settings.DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+                films = queryset.order_by('?')[:count]
+            else:
+                pks = list(queryset.values_list('id', flat=True))
+                random_pks = random.sample(pks, count)
+                films = list(queryset.filter(id__in=random_pks))
 
-        return queryset
+        return total, films
 
     @action(
         detail=False,
@@ -102,36 +355,34 @@ class FilmViewSet(viewsets.ModelViewSet):
         без короткометражек, концертов и документальных.
         """
         # min_rating = float(request.query_params.get('min_rating', MIN_RATING))
-        queryset = self.get_random_films_base_queryset(min_rating=MIN_RATING)
-
         genres = request.query_params.get('genres')
+        genre_ids = []
         if genres:
             genre_ids = [int(g) for g in genres.split(',') if g.isdigit()]
-            queryset = queryset.filter(genres__id__in=genre_ids).distinct()
 
         year_min = request.query_params.get('year_min')
-        if year_min and year_min.isdigit():
-            queryset = queryset.filter(year__gte=int(year_min))
+        year_min = int(year_min) if year_min and year_min.isdigit() else None
 
         year_max = request.query_params.get('year_max')
-        if year_max and year_max.isdigit():
-            queryset = queryset.filter(year__lte=int(year_max))
+        year_max = int(year_max) if year_max and year_max.isdigit() else None
 
-        total = queryset.count()
         count = min(int(request.query_params.get('count', 50)), 200)
 
-        if total == 0:
-            films = []
-        elif total <= count:
-            films = list(queryset)
-            random.shuffle(films)
+        # Сначала пул в памяти: ни COUNT, ни ORDER BY ? в БД
+        sampled = discover_pool.sample(count, genre_ids, year_min, year_max)
+        if sampled is not None:
+            total, film_ids = sampled
+            films_by_id = Film.objects.select_related(
+                'type', 'rating_stats'
+            ).prefetch_related('genres').in_bulk(film_ids)
+            films = [
+                films_by_id[film_id] for film_id in film_ids
+                if film_id in films_by_id
+            ]
         else:
-            if settings.DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
-                films = queryset.order_by('?')[:count]
-            else:
-                pks = list(queryset.values_list('id', flat=True))
-                random_pks = random.sample(pks, count)
-                films = list(queryset.filter(id__in=random_pks))
+            total, films = self.discover_from_db(
+                count, genre_ids, year_min, year_max
+            )
 
         serializer = self.get_serializer(films, many=True)
 
@@ -159,16 +410,21 @@ class FilmViewSet(viewsets.ModelViewSet):
                 'results': []
             })
 
-        queryset = Film.objects.filter(
-            Q(name__icontains=query) |
-            Q(alternative_name__icontains=query) |
-            Q(en_name__icontains=query),
-        ).exclude(
+        # Сначала индекс в памяти процесса - без запросов к БД
+        suggestions = film_autocomplete.suggest(query)
+        if suggestions and suggestions[0]:
+            total, results = suggestions
+            return Response({
+                'total': total,
+                'results': results
+            })
+
+        base_queryset = Film.objects.exclude(
             Q(name__isnull=True) &
             Q(alternative_name__isnull=True) &
             Q(en_name__isnull=True)
         ).select_related(
-            'type'
+            'type', 'rating_stats'
         ).prefetch_related(
             'genres'
         ).annotate(
@@ -178,15 +434,25 @@ class FilmViewSet(viewsets.ModelViewSet):
                 default=Value(0),
                 output_field=IntegerField(),
             )
-        ).order_by(
+        )
+
+        queryset = filter_by_title(base_queryset, query).order_by(
             '-popularity_priority',   # сначала популярные
+            '-search_rank',           # потом релевантность
             '-kinopoisk_rating',      # потом рейтинг
             '-kinopoisk_votes',       # потом голоса
             '-year'
         ).distinct()
 
-        total = queryset.count()
-        films = queryset[:SEARCH_SUGGESTIONS_LIMIT]
+        films = list(queryset[:SEARCH_SUGGESTIONS_LIMIT])
+        total = self.get_count_strategy().count(queryset)
+
+        # Точных совпадений нет - возможно, опечатка
+        if not films:
+            films = fuzzy_search(
+                base_queryset, query, SEARCH_SUGGESTIONS_LIMIT
+            )
+            total = len(films)
 
         serializer = SearchListFilmSerilizer(films, many=True)
 
@@ -213,25 +479,21 @@ class FilmViewSet(viewsets.ModelViewSet):
                 'results': []
             })
 
-        queryset = Film.objects.filter(
-            Q(name__icontains=query) |
-            Q(alternative_name__icontains=query) |
-            Q(en_name__icontains=query)
-        ).select_related(
-            'type'
+        queryset = filter_by_title(Film.objects.all(), query).select_related(
+            'type', 'rating_stats'
         ).prefetch_related(
             'genres'
         ).order_by(
+            '-search_rank',
             '-kinopoisk_rating',
             '-kinopoisk_votes',
             '-year'
         ).distinct()
 
-        paginator = FilmSearchPagination()
-        page = paginator.paginate_queryset(queryset, request)
+        page = self.paginate_queryset(queryset)
         serializer = SearchListFilmSerilizer(page, many=True)
 
-        return paginator.get_paginated_response(serializer.data)
+        return self.get_paginated_response(serializer.data)
 
 
 class TypeList(generics.ListCreateAPIView):
@@ -1,14 +1,24 @@
 from django.contrib.auth import get_user_model
-from django.db.models import Prefetch
+from django.db.models import Count, Prefetch
 from django.shortcuts import get_object_or_404
+from django.utils.functional import cached_property
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from activities.models import UserFilmActivity
 from compilations.models import Compilation
-from blog.models import PhotoUser, Follow
-from api.serializers.profile import UserProfileSerializer
+from blog.models import Follow
+from gallery.models import Film
+from api.pagination import ProfileListPagination
+from api.serializers.profile import (CompilationPreviewSerializer,
+                                     SubscriberSerializer,
+                                     SubscriptionSerializer,
+                                     UserFilmActivityProfileSerializer,
+                                     UserProfileSerializer,
+                                     UserProfileSummarySerializer)
+from talk_about.constants import PROFILE_COMPILATION_PREVIEW_FILMS
+from users.stats import get_user_stats
 
 User = get_user_model()
 
@@ -19,27 +29,13 @@ class UserProfileView(generics.RetrieveAPIView):
     lookup_url_kwarg = 'user_id'
 
     def get_queryset(self):
-        return User.objects.prefetch_related(
-            Prefetch(
-                'activities',
-                queryset=UserFilmActivity.objects.select_related('film').order_by('-updated_at')
-            ),
-            Prefetch(
-                'collections',
-                queryset=Compilation.objects.prefetch_related('films').order_by('-created_at')
-            ),
-            Prefetch(
-                'user_photos',
-                queryset=PhotoUser.objects.order_by('-uploaded_at')
-            ),
-            Prefetch(
-                'user_subscriptions',
-                queryset=Follow.objects.select_related('following')
-            ),
-            Prefetch(
-                'user_subscribers',
-                queryset=Follow.objects.select_related('follower')
-            ),
+        user = self.request.user
+        is_owner = (
+            user.is_authenticated
+            and user.pk == self.kwargs[self.lookup_url_kwarg]
+        )
+        return User.objects.select_related('stats').prefetch_related(
+            *UserProfileSerializer.profile_prefetches(is_owner)
         )
 
 
@@ -48,33 +44,152 @@ class MeProfileView(generics.RetrieveAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
-        return User.objects.prefetch_related(
-            Prefetch(
-                'activities',
-                queryset=UserFilmActivity.objects.select_related('film').order_by('-updated_at')
-            ),
-            Prefetch(
-                'collections',
-                queryset=Compilation.objects.prefetch_related('films').order_by('-created_at')
-            ),
-            Prefetch(
-                'user_photos',
-                queryset=PhotoUser.objects.order_by('-uploaded_at')
-            ),
-            Prefetch(
-                'user_subscriptions',
-                queryset=Follow.objects.select_related('following')
-            ),
+        return User.objects.select_related('stats').prefetch_related(
+            *UserProfileSerializer.profile_prefetches(is_owner=True)
+        ).get(pk=self.request.user.pk)
+
+
+class UserProfileSummaryView(generics.RetrieveAPIView):
+    """Шапка профиля без списков."""
+
+    serializer_class = UserProfileSummarySerializer
+    permission_classes = [permissions.AllowAny]
+    lookup_url_kwarg = 'user_id'
+    queryset = User.objects.select_related('stats')
+
+
+class MeProfileSummaryView(generics.RetrieveAPIView):
+    serializer_class = UserProfileSummarySerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_object(self):
+        return User.objects.select_related('stats').get(
+            pk=self.request.user.pk
+        )
+
+
+class ProfileListView(generics.ListAPIView):
+    """
+    Базовая вьюха постраничных списков профиля /users/{id}/...
+
+    Каждый список - один запрос по user_id с сортировкой, которую
+    обслуживает индекс, и keyset-пагинацией.
+    """
+
+    permission_classes = [permissions.AllowAny]
+    pagination_class = ProfileListPagination
+
+    @cached_property
+    def profile_user(self):
+        return get_object_or_404(User, pk=self.kwargs['user_id'])
+
+    @property
+    def is_owner(self):
+        user = self.request.user
+        return user.is_authenticated and user.pk == self.profile_user.pk
+
+
+class UserWatchedView(ProfileListView):
+    """Просмотренные фильмы пользователя."""
+
+    serializer_class = UserFilmActivityProfileSerializer
+    ordering_fields = ('watched_at', 'updated_at')
+
+    def get_queryset(self):
+        queryset = UserFilmActivity.objects.filter(
+            user=self.profile_user,
+            is_watched=True,
+        )
+        if not self.is_owner:
+            queryset = queryset.filter(is_public_for_watched=True)
+
+        return queryset.select_related('film').order_by(
+            '-watched_at', '-updated_at'
+        )
+
+
+class UserPlannedView(ProfileListView):
+    """Фильмы, которые пользователь собирается посмотреть."""
+
+    serializer_class = UserFilmActivityProfileSerializer
+    ordering_fields = ('planned_at', 'updated_at')
+
+    def get_queryset(self):
+        queryset = UserFilmActivity.objects.filter(
+            user=self.profile_user,
+            is_planned=True,
+        )
+        if not self.is_owner:
+            queryset = queryset.filter(is_public_for_planned=True)
+
+        return queryset.select_related('film').order_by(
+            '-planned_at', '-updated_at'
+        )
+
+
+class UserCompilationsView(ProfileListView):
+    """Подборки пользователя: число фильмов и несколько первых."""
+
+    serializer_class = CompilationPreviewSerializer
+    ordering_fields = ('created_at',)
+
+    def get_queryset(self):
+        queryset = Compilation.objects.filter(user=self.profile_user)
+        if not self.is_owner:
+            queryset = queryset.filter(is_public=True)
+
+        return queryset.annotate(
+            films_count=Count('films'),
+        ).prefetch_related(
             Prefetch(
-                'user_subscribers',
-                queryset=Follow.objects.select_related('follower')
+                'films',
+                queryset=Film.objects.order_by('id')[
+                    :PROFILE_COMPILATION_PREVIEW_FILMS
+                ],
+                to_attr='preview_films',
             ),
-        ).get(pk=self.request.user.pk)
+        ).order_by('-created_at')
+
+
+class UserFollowersView(ProfileListView):
+    """Кто подписан на пользователя."""
+
+    serializer_class = SubscriberSerializer
+
+    def get_queryset(self):
+        return Follow.objects.filter(
+            following=self.profile_user,
+        ).select_related('follower').order_by('-id')
+
+
+class UserFollowingView(ProfileListView):
+    """На кого подписан пользователь."""
+
+    serializer_class = SubscriptionSerializer
+
+    def get_queryset(self):
+        return Follow.objects.filter(
+            follower=self.profile_user,
+        ).select_related('following').order_by('-id')
 
 
 class FollowUserView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_counts(self, following_user, follower):
+        """Счётчики обоих пользователей после изменения - один запрос."""
+        users = User.objects.select_related('stats').in_bulk(
+            [following_user.pk, follower.pk]
+        )
+        return {
+            'subscribers_count': get_user_stats(
+                users[following_user.pk]
+            ).subscribers_count,
+            'subscriptions_count': get_user_stats(
+                users[follower.pk]
+            ).subscriptions_count,
+        }
+
     def post(self, request, user_id):
         following_user = get_object_or_404(User, pk=user_id)
 
@@ -93,8 +208,7 @@ class FollowUserView(APIView):
             {
                 'is_subscribed': True,
                 'created': created,
-                'subscribers_count': following_user.user_subscribers.count(),
-                'subscriptions_count': request.user.user_subscriptions.count(),
+                **self.get_counts(following_user, request.user),
             },
             status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
         )
@@ -111,8 +225,7 @@ class FollowUserView(APIView):
             {
                 'is_subscribed': False,
                 'deleted': deleted_count > 0,
-                'subscribers_count': following_user.user_subscribers.count(),
-                'subscriptions_count': request.user.user_subscriptions.count(),
+                **self.get_counts(following_user, request.user),
             },
             status=status.HTTP_200_OK
         )
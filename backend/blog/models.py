@@ -2,7 +2,7 @@ import uuid
 
 from django.contrib.auth import get_user_model
 from django.core.files.storage import default_storage
-from django.db import models
+from django.db import models, transaction
 
 from talk_about.utils import delete_folder_with_all_files
 
@@ -49,6 +49,11 @@ class PhotoUser(models.Model):
     )
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
+    def save(self, *args, **kwargs):
+        # Фотография и счётчик в UserStats (post_save) - одна транзакция
+        with transaction.atomic(using=kwargs.get('using') or self._state.db):
+            super().save(*args, **kwargs)
+
     def delete(self, *args, **kwargs):
         #  При удалении объекта из БД - удаляем физический файл с сервера
         default_storage.delete(self.image.name)
@@ -83,6 +88,11 @@ class Follow(models.Model):
                 f'{self.following.first_name} {self.following.last_name} '
                 f'({self.following.id})')
 
+    def save(self, *args, **kwargs):
+        # Подписка и счётчики обоих пользователей (post_save) - одна транзакция
+        with transaction.atomic(using=kwargs.get('using') or self._state.db):
+            super().save(*args, **kwargs)
+
 
 class Post(models.Model):
     """Публикации пользователей(на любую тематику)."""
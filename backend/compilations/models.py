@@ -1,5 +1,5 @@
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
 
 from gallery.models import Film
 
@@ -53,6 +53,11 @@ class Compilation(BaseCreatedUpdated):
     def __str__(self) -> str:
         return f'{self.pk} - {self.title or "Без названия"}'
 
+    def save(self, *args, **kwargs):
+        # Подборка и счётчик в UserStats (post_save) - одна транзакция
+        with transaction.atomic(using=kwargs.get('using') or self._state.db):
+            super().save(*args, **kwargs)
+
 
 class CompilationsFilms(BaseCreatedUpdated):
     """Связь Подборка - Фильм (многие ко многиим)."""
@@ -1,6 +1,34 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate, post_save
+
+
+def ensure_search_index(using, **kwargs):
+    """Восстанавливаем поисковый индекс после миграций.
+
+    SQLite пересоздаёт таблицу фильмов при части миграций,
+    и триггеры FTS5 при этом удаляются.
+    """
+    from django.db import connections
+
+    from gallery.search import install_search_index
+
+    connection = connections[using]
+    if 'gallery_film' not in connection.introspection.table_names():
+        return
+
+    install_search_index(connection)
 
 
 class GalleryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'gallery'
+
+    def ready(self):
+        from gallery.search import refresh_film_trigrams_on_save
+
+        post_migrate.connect(ensure_search_index, sender=self)
+        post_save.connect(
+            refresh_film_trigrams_on_save,
+            sender=self.get_model('Film'),
+            dispatch_uid='gallery_film_trigrams',
+        )
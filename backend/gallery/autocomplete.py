@@ -0,0 +1,367 @@
+"""
+Автодополнение названий фильмов из памяти процесса.
+
+Индекс - отсортированный массив ключей (нормализованные хвосты названий,
+начиная с каждого слова) и параллельный массив id фильмов. Поиск по
+префиксу - два bisect. Для коротких префиксов (2-3 символа) топ-K
+самых популярных фильмов посчитан заранее.
+
+Индекс строится в фоновом потоке при первом обращении. Пока он не готов,
+suggest() возвращает None, и вызывающий код идёт в БД. Дальше индекс
+догружает изменённые фильмы по меткам времени (change_fields), убирает
+пропавшие из queryset и периодически перестраивается целиком, так что
+запросы пользователей SQL не делают.
+"""
+import heapq
+import json
+import logging
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+
+from gallery.search import SEARCH_FIELDS
+from talk_about.constants import (AUTOCOMPLETE_KEY_LENGTH,
+                                  AUTOCOMPLETE_REBUILD_SECONDS,
+                                  AUTOCOMPLETE_REFRESH_OVERLAP_SECONDS,
+                                  AUTOCOMPLETE_REFRESH_SECONDS,
+                                  MIN_SEARCH_VOTES)
+
+
+logger = logging.getLogger(__name__)
+
+# Для префиксов такой длины топ-K хранится готовым
+PRECOMPUTED_PREFIX_LENGTHS = (2, 3)
+
+# Если изменилось больше фильмов - дешевле перестроить индекс целиком
+MAX_INCREMENTAL_FILMS = 1000
+
+BUILD_CHUNK_SIZE = 2000
+
+KEY_END = '\uffff'
+
+
+def normalize(value: Optional[str]) -> str:
+    """Нижний регистр, ё -> е, всё кроме букв и цифр -> один пробел."""
+    value = (value or '').lower().replace('ё', 'е')
+    return ' '.join(re.findall(r'\w+', value))
+
+
+def title_keys(titles, key_length: int = AUTOCOMPLETE_KEY_LENGTH) -> set:
+    """Ключи индекса: хвосты каждого названия, начиная с каждого слова."""
+    keys = set()
+    for title in titles:
+        normalized = normalize(title)
+        if not normalized:
+            continue
+        starts = [0] + [
+            index + 1 for index, char in enumerate(normalized) if char == ' '
+        ]
+        for start in starts:
+            keys.add(normalized[start:start + key_length])
+    return keys
+
+
+def popularity_score(film) -> tuple:
+    """Ключ сортировки как в search-suggestions (меньше - выше)."""
+    votes = film.kinopoisk_votes or 0
+    return (
+        0 if votes >= MIN_SEARCH_VOTES else 1,
+        -(film.kinopoisk_rating or 0),
+        -votes,
+        -(film.year or 0),
+    )
+
+
+class FilmAutocomplete:
+    """Индекс автодополнения, живущий в памяти процесса.
+
+    Args:
+        get_queryset: возвращает queryset фильмов для индекса
+        serialize: превращает список фильмов в список словарей ответа
+        limit: сколько подсказок отдавать на префикс
+        change_fields: метки времени, по которым догружаются изменения
+            (можно через связи, например rating_stats__updated_at)
+    """
+
+    def __init__(
+        self,
+        get_queryset: Callable,
+        serialize: Callable,
+        limit: int,
+        key_length: int = AUTOCOMPLETE_KEY_LENGTH,
+        refresh_seconds: float = AUTOCOMPLETE_REFRESH_SECONDS,
+        rebuild_seconds: float = AUTOCOMPLETE_REBUILD_SECONDS,
+        refresh_overlap_seconds: float = AUTOCOMPLETE_REFRESH_OVERLAP_SECONDS,
+        change_fields: Tuple[str, ...] = ('updated_at',),
+    ):
+        self.get_queryset = get_queryset
+        self.serialize = serialize
+        self.limit = limit
+        self.key_length = key_length
+        self.refresh_seconds = refresh_seconds
+        self.rebuild_seconds = rebuild_seconds
+        self.refresh_overlap = timedelta(seconds=refresh_overlap_seconds)
+        self.change_fields = change_fields
+
+        self._lock = threading.RLock()
+        self._worker: Optional[threading.Thread] = None
+
+        self._keys: List[str] = []
+        self._key_films = array('l')
+        # film_id -> (popularity_score, payload в JSON, ключи фильма)
+        self._films: Dict[int, Tuple[tuple, bytes, tuple]] = {}
+        # короткий префикс -> (всего фильмов, топ-K id)
+        self._top: Dict[str, Tuple[int, List[int]]] = {}
+
+        self.ready = False
+        self._synced_until = None
+        # (id, поле, метка) изменений из окна перекрытия, уже загруженных
+        self._seen_changes: Set[tuple] = set()
+        self._built_at = 0.0
+        self._checked_at = 0.0
+
+    # Чтение
+
+    def suggest(self, query: str) -> Optional[Tuple[int, List[dict]]]:
+        """
+        Подсказки по префиксу: (всего совпадений, топ-K payload).
+
+        None - индекс не готов или префикс длиннее ключей индекса,
+        нужно идти в БД.
+        """
+        self.schedule_refresh()
+
+        prefix = normalize(query)
+        if not self.ready or not prefix or len(prefix) > self.key_length:
+            return None
+
+        with self._lock:
+            if prefix in self._top:
+                total, film_ids = self._top[prefix]
+            else:
+                total, film_ids = self._scan(prefix)
+            payloads = [self._films[film_id][1] for film_id in film_ids]
+
+        return total, [json.loads(payload) for payload in payloads]
+
+    def _scan(self, prefix: str) -> Tuple[int, List[int]]:
+        start = bisect_left(self._keys, prefix)
+        end = bisect_left(self._keys, prefix + KEY_END, lo=start)
+        film_ids = set(self._key_films[start:end])
+        top = heapq.nsmallest(
+            self.limit, film_ids, key=lambda film_id: self._films[film_id][0]
+        )
+        return len(film_ids), top
+
+    # Построение
+
+    def schedule_refresh(self, force_rebuild: bool = False) -> None:
+        """Запускает фоновую сборку или догрузку, если пора."""
+        now = time.monotonic()
+        rebuild = (
+            force_rebuild
+            or not self.ready
+            or now - self._built_at >= self.rebuild_seconds
+        )
+        if not rebuild and now - self._checked_at < self.refresh_seconds:
+            return
+
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._checked_at = now
+            self._worker = threading.Thread(
+                target=self._run_in_thread,
+                args=(rebuild,),
+                name='film-autocomplete',
+                daemon=True,
+            )
+            self._worker.start()
+
+    def _run_in_thread(self, rebuild: bool) -> None:
+        try:
+            if rebuild:
+                self.build()
+            else:
+                self.refresh()
+        except Exception:
+            logger.exception('Не удалось обновить индекс автодополнения')
+        finally:
+            # У фонового потока своё подключение к БД
+            connection.close()
+
+    def _load(self, queryset) -> Dict[int, Tuple[tuple, bytes, tuple]]:
+        films = {}
+        chunk = []
+
+        def flush():
+            for film, payload in zip(chunk, self.serialize(chunk)):
+                keys = title_keys(
+                    (getattr(film, field) for field in SEARCH_FIELDS),
+                    self.key_length,
+                )
+                if not keys:
+                    continue
+                films[film.pk] = (
+                    popularity_score(film),
+                    json.dumps(payload, ensure_ascii=False).encode(),
+                    tuple(sorted(keys)),
+                )
+            chunk.clear()
+
+        for film in queryset.iterator(chunk_size=BUILD_CHUNK_SIZE):
+            chunk.append(film)
+            if len(chunk) >= BUILD_CHUNK_SIZE:
+                flush()
+        flush()
+
+        return films
+
+    def build(self) -> None:
+        """Полная сборка индекса (блокирующая)."""
+        queryset = self.get_queryset()
+        synced_until = max(
+            filter(None, queryset.aggregate(**{
+                f'last_{index}': Max(field)
+                for index, field in enumerate(self.change_fields)
+            }).values()),
+            default=None,
+        )
+        films = self._load(queryset)
+
+        pairs = sorted(
+            (key, film_id)
+            for film_id, (_, _, keys) in films.items()
+            for key in keys
+        )
+        keys = [key for key, _ in pairs]
+        key_films = array('l', (film_id for _, film_id in pairs))
+
+        with self._lock:
+            self._films = films
+            self._keys = keys
+            self._key_films = key_films
+            self._top = {}
+            for length in PRECOMPUTED_PREFIX_LENGTHS:
+                self._precompute(length)
+            self._synced_until = synced_until or timezone.now()
+            self._seen_changes = set()
+            self._built_at = time.monotonic()
+            self.ready = True
+
+    def refresh(self) -> None:
+        """
+        Догружает фильмы, изменённые с прошлой сборки, и убирает
+        пропавшие из queryset (удалённые или отфильтрованные).
+
+        Метка времени ставится до коммита, и медленная транзакция
+        становится видна, когда соседние с более поздними метками уже
+        загружены. Поэтому изменения за refresh_overlap до прошлой
+        догрузки просматриваются повторно, а уже загруженные версии
+        (id, поле, метка) отбрасываются. Транзакции длиннее окна
+        подхватит полная перестройка.
+        """
+        if self._synced_until is None:
+            self.build()
+            return
+
+        queryset = self.get_queryset().prefetch_related(None)
+        since = self._synced_until - self.refresh_overlap
+        # В окне перекрытия лежат и уже загруженные изменения
+        limit = MAX_INCREMENTAL_FILMS + len(self._seen_changes) + 1
+
+        changes = set()
+        for field in self.change_fields:
+            rows = list(
+                queryset.filter(**{f'{field}__gt': since}).values_list(
+                    'pk', field
+                ).order_by()[:limit]
+            )
+            if len(rows) >= limit:
+                self.build()
+                return
+            changes.update((pk, field, at) for pk, at in rows)
+
+        changed_ids = {pk for pk, _, _ in changes - self._seen_changes}
+        if len(changed_ids) > MAX_INCREMENTAL_FILMS:
+            self.build()
+            return
+
+        live_ids = set(queryset.values_list('pk', flat=True))
+        films = self._load(self.get_queryset().filter(pk__in=changed_ids))
+
+        with self._lock:
+            # Фильм, загруженный сейчас, мог появиться после live_ids
+            removed_ids = self._films.keys() - live_ids - films.keys()
+
+            touched_prefixes = set()
+            for film_id in changed_ids | removed_ids:
+                old = self._films.pop(film_id, None)
+                if old:
+                    for key in old[2]:
+                        self._remove_key(key, film_id)
+                        touched_prefixes.update(self._short_prefixes(key))
+
+            for film_id, entry in films.items():
+                self._films[film_id] = entry
+                for key in entry[2]:
+                    position = bisect_left(self._keys, key)
+                    insort(self._keys, key)
+                    self._key_films.insert(position, film_id)
+                    touched_prefixes.update(self._short_prefixes(key))
+
+            for prefix in touched_prefixes:
+                total, film_ids = self._scan(prefix)
+                if total:
+                    self._top[prefix] = (total, film_ids)
+                else:
+                    self._top.pop(prefix, None)
+
+            self._synced_until = max(
+                [self._synced_until, *(at for _, _, at in changes)]
+            )
+            since = self._synced_until - self.refresh_overlap
+            self._seen_changes = {
+                change for change in changes if change[2] > since
+            }
+
+    def _remove_key(self, key: str, film_id: int) -> None:
+        position = bisect_left(self._keys, key)
+        while position < len(self._keys) and self._keys[position] == key:
+            if self._key_films[position] == film_id:
+                del self._keys[position]
+                del self._key_films[position]
+                return
+            position += 1
+
+    def _short_prefixes(self, key: str) -> List[str]:
+        return [
+            key[:length] for length in PRECOMPUTED_PREFIX_LENGTHS
+            if len(key) >= length
+        ]
+
+    def _precompute(self, length: int) -> None:
+        start = 0
+        while start < len(self._keys):
+            prefix = self._keys[start][:length]
+            if len(prefix) < length:
+                start += 1
+                continue
+            self._top[prefix] = self._scan(prefix)
+            start = bisect_left(self._keys, prefix + KEY_END, lo=start)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'films': len(self._films),
+                'keys': len(self._keys),
+                'precomputed_prefixes': len(self._top),
+            }
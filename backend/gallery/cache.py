@@ -0,0 +1,69 @@
+"""
+Кэш страницы фильма (анонимная часть ответа FilmDetailSerializer).
+
+Ключ собирается из:
+- поколения всех страниц (сбрасывается массовым пересчётом);
+- версии конкретного фильма (растёт при записи рецензий,
+  комментариев и оценок);
+- Film.updated_at (меняется при импорте и редактировании фильма).
+
+Поэтому явно удалять ничего не нужно: после любой записи запрос
+идёт по новому ключу, старые записи доживают до TTL.
+"""
+from typing import Optional
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from talk_about.constants import FILM_DETAIL_CACHE_TTL
+
+
+GENERATION_KEY = 'film_detail:generation'
+
+
+def _version_key(film_id: int) -> str:
+    return f'film_detail:version:{film_id}'
+
+
+def _bump(key: str) -> None:
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Ключа ещё нет (или его вытеснили) - начинаем заново
+        cache.set(key, 1, None)
+
+
+def film_detail_key(film_id: int, updated_at, variant: str = '') -> str:
+    """Ключ кэша страницы фильма.
+
+    variant - то, от чего ещё зависит ответ (например, хост
+    для абсолютных ссылок на аватары).
+    """
+    version_key = _version_key(film_id)
+    versions = cache.get_many([GENERATION_KEY, version_key])
+    generation = versions.get(GENERATION_KEY, 0)
+    version = versions.get(version_key, 0)
+    stamp = updated_at.timestamp() if updated_at else 0
+    return f'film_detail:{generation}:{film_id}:{version}:{stamp}:{variant}'
+
+
+def get_film_detail(key: str) -> Optional[dict]:
+    return cache.get(key)
+
+
+def set_film_detail(key: str, data: dict) -> None:
+    cache.set(key, data, FILM_DETAIL_CACHE_TTL)
+
+
+def invalidate_film_detail(film_id: int, using: str = DEFAULT_DB_ALIAS) -> None:
+    """Сбрасывает кэш страницы фильма после коммита транзакции.
+
+    Если сбросить раньше, параллельный запрос может успеть закэшировать
+    ещё не закоммиченное состояние под новой версией.
+    """
+    transaction.on_commit(lambda: _bump(_version_key(film_id)), using=using)
+
+
+def invalidate_all_film_details(using: str = DEFAULT_DB_ALIAS) -> None:
+    """Сбрасывает кэш страниц всех фильмов."""
+    transaction.on_commit(lambda: _bump(GENERATION_KEY), using=using)
@@ -0,0 +1,89 @@
+"""
+Состав фильма: персоны, сгруппированные по профессиям.
+
+Строки берутся одним запросом через values_list (связь
+персона-профессия + персона + профессия), без моделей и сериализаторов
+на каждую персону. Повторы персоны внутри профессии отсекаются
+множеством, длинные списки обрезаются с подсчётом остатка.
+"""
+from typing import Dict, Optional, Tuple
+
+from django.utils import timezone
+
+from gallery.models import FilmPersonProfession
+from gallery.utils import calculate_age
+from talk_about.constants import CREDITS_PER_PROFESSION
+
+
+CREDIT_FIELDS = (
+    'profession__profession',
+    'film_person__description',
+    'film_person__person_id',
+    'film_person__person__kinopoisk_id',
+    'film_person__person__name',
+    'film_person__person__en_name',
+    'film_person__person__photo_url',
+    'film_person__person__growth',
+    'film_person__person__birthday',
+    'film_person__person__death',
+)
+
+
+def credits_queryset(film_id: int, profession: Optional[str] = None):
+    """Строки состава фильма в порядке добавления (кортежи CREDIT_FIELDS)."""
+    queryset = FilmPersonProfession.objects.filter(
+        film_person__film_id=film_id
+    )
+    if profession:
+        queryset = queryset.filter(profession__profession=profession)
+    return queryset.order_by('film_person_id', 'pk').values_list(*CREDIT_FIELDS)
+
+
+def credit_payload(row: tuple, today) -> dict:
+    """Персона в формате PersonSerializer + role_description."""
+    (_, description, person_id, kinopoisk_id, name, en_name,
+     photo_url, growth, birthday, death) = row
+    return {
+        'id': person_id,
+        'kinopoisk_id': kinopoisk_id,
+        'name': name,
+        'en_name': en_name,
+        'photo_url': photo_url,
+        'growth': growth,
+        'birthday': birthday.isoformat() if birthday else None,
+        'death': death.isoformat() if death else None,
+        'age': calculate_age(birthday, death, today),
+        'role_description': description,
+    }
+
+
+def build_credits(
+    film_id: int,
+    limit: Optional[int] = CREDITS_PER_PROFESSION,
+) -> Tuple[Dict[str, list], Dict[str, int]]:
+    """
+    Персоны фильма по профессиям.
+
+    Возвращает ({профессия: [персоны]}, {профессия: сколько не вошло}).
+    limit=None - без обрезки.
+    """
+    today = timezone.now().date()
+    by_profession: Dict[str, list] = {}
+    seen: Dict[str, set] = {}
+    more: Dict[str, int] = {}
+
+    for row in credits_queryset(film_id):
+        profession, person_id = row[0], row[2]
+
+        persons = seen.setdefault(profession, set())
+        if person_id in persons:
+            continue
+        persons.add(person_id)
+
+        items = by_profession.setdefault(profession, [])
+        if limit is None or len(items) < limit:
+            items.append(credit_payload(row, today))
+        else:
+            more[profession] = more.get(profession, 0) + 1
+
+    return by_profession, more
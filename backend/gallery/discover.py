@@ -0,0 +1,261 @@
+"""
+Пул фильмов для discover в памяти процесса.
+
+Вместо COUNT и ORDER BY ? на каждый запрос держим id подходящих фильмов
+в компактных array('l'): общий список, по жанрам, по годам и по парам
+жанр x год. Фильтр по году внутри жанра - готовые массивы пар, без
+пересечений и сортировки; несколько жанров объединяются по годам,
+то есть по небольшим массивам. Случайная выборка - random.sample по
+индексам, то есть O(count), а не O(каталога).
+
+Пул строится в фоновом потоке при первом обращении (пока он не готов,
+sample() возвращает None, и вызывающий код идёт в БД), перестраивается
+по TTL и после завершения импорта (ImportRun.finished_at: курсор
+импорта сохраняется на каждой странице, а пул нужен один раз за запуск).
+"""
+import logging
+import random
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from itertools import accumulate, chain
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from django.db import connection
+from django.db.models import Max
+
+from gallery.models import FilmGenre, ImportRun
+from talk_about.constants import (DISCOVER_POOL_CHECK_SECONDS,
+                                  DISCOVER_POOL_TTL)
+
+
+logger = logging.getLogger(__name__)
+
+BUILD_CHUNK_SIZE = 5000
+
+
+def disjoint_union(parts: List[array]) -> List[array]:
+    """
+    Объединение массивов id без повторов, кусками.
+
+    Самый большой массив берётся целиком, без копирования; множество
+    строится только из остальных, и из него вычитается большой.
+    Сортировки нет - выборке порядок не нужен.
+    """
+    parts = sorted(parts, key=len, reverse=True)
+    if len(parts) < 2:
+        return parts
+
+    rest = set().union(*parts[1:])
+    rest.difference_update(parts[0])
+    return [parts[0], array('l', rest)] if rest else parts[:1]
+
+
+class DiscoverPool:
+    """Пул id фильмов для случайных подборок.
+
+    Args:
+        get_queryset: возвращает queryset фильмов, подходящих для discover
+        ttl: через сколько секунд пул перестраивается в любом случае
+        check_seconds: как часто проверять, не закончился ли импорт
+    """
+
+    def __init__(
+        self,
+        get_queryset: Callable,
+        ttl: float = DISCOVER_POOL_TTL,
+        check_seconds: float = DISCOVER_POOL_CHECK_SECONDS,
+    ):
+        self.get_queryset = get_queryset
+        self.ttl = ttl
+        self.check_seconds = check_seconds
+
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+
+        self._ids = array('l')
+        self._by_genre: Dict[int, array] = {}
+        self._by_year: Dict[int, array] = {}
+        # жанр -> год -> id
+        self._by_genre_year: Dict[int, Dict[int, array]] = {}
+
+        self.ready = False
+        self._built_at = 0.0
+        self._checked_at = 0.0
+        self._import_marker = None
+
+    # Чтение
+
+    def sample(
+        self,
+        count: int,
+        genre_ids: Iterable[int] = (),
+        year_min: Optional[int] = None,
+        year_max: Optional[int] = None,
+    ) -> Optional[Tuple[int, List[int]]]:
+        """
+        Случайные id фильмов: (всего подходящих, выборка).
+
+        Жанры объединяются через ИЛИ, как genres__id__in в ORM.
+        None - пул ещё не готов.
+        """
+        self.schedule_refresh()
+        if not self.ready:
+            return None
+
+        with self._lock:
+            ids, by_genre, by_year, by_genre_year = (
+                self._ids, self._by_genre, self._by_year, self._by_genre_year
+            )
+
+        parts = self._candidates(
+            ids, by_genre, by_year, by_genre_year,
+            list(genre_ids), year_min, year_max,
+        )
+        offsets = list(accumulate(len(part) for part in parts))
+        total = offsets[-1] if offsets else 0
+
+        positions = random.sample(range(total), min(count, total))
+        sampled = []
+        for position in positions:
+            index = bisect_right(offsets, position)
+            start = offsets[index - 1] if index else 0
+            sampled.append(parts[index][position - start])
+
+        return total, sampled
+
+    @staticmethod
+    def _candidates(ids, by_genre, by_year, by_genre_year, genre_ids,
+                    year_min, year_max):
+        """Кандидаты в виде непересекающихся массивов id."""
+        filter_years = year_min is not None or year_max is not None
+        if not genre_ids and not filter_years:
+            return [ids]
+
+        def year_matches(year):
+            return (
+                (year_min is None or year >= year_min)
+                and (year_max is None or year <= year_max)
+            )
+
+        if not genre_ids:
+            # Год у фильма один - массивы по годам не пересекаются
+            return [
+                part for year, part in by_year.items() if year_matches(year)
+            ]
+
+        genre_ids = [genre for genre in set(genre_ids) if genre in by_genre]
+        if not filter_years:
+            return disjoint_union([by_genre[genre] for genre in genre_ids])
+
+        # Фильм с одним годом может совпасть только в массивах этого года
+        by_year_parts: Dict[int, List[array]] = {}
+        for genre in genre_ids:
+            for year, part in by_genre_year[genre].items():
+                if year_matches(year):
+                    by_year_parts.setdefault(year, []).append(part)
+        return list(chain.from_iterable(
+            disjoint_union(parts) for parts in by_year_parts.values()
+        ))
+
+    # Построение
+
+    def schedule_refresh(self, force_rebuild: bool = False) -> None:
+        """Запускает фоновую сборку, если пул устарел."""
+        now = time.monotonic()
+        if (
+            not force_rebuild
+            and self.ready
+            and now - self._built_at < self.ttl
+            and now - self._checked_at < self.check_seconds
+        ):
+            return
+
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._checked_at = now
+            self._worker = threading.Thread(
+                target=self._run_in_thread,
+                args=(force_rebuild,),
+                name='discover-pool',
+                daemon=True,
+            )
+            self._worker.start()
+
+    def _run_in_thread(self, force_rebuild: bool) -> None:
+        try:
+            if force_rebuild or self.is_stale():
+                self.build()
+        except Exception:
+            logger.exception('Не удалось обновить пул discover')
+        finally:
+            # У фонового потока своё подключение к БД
+            connection.close()
+
+    def get_import_marker(self):
+        # И упавший запуск успевает сохранить страницы до ошибки
+        return ImportRun.objects.aggregate(last=Max('finished_at'))['last']
+
+    def is_stale(self) -> bool:
+        if not self.ready or time.monotonic() - self._built_at >= self.ttl:
+            return True
+        return self.get_import_marker() != self._import_marker
+
+    def build(self) -> None:
+        """Полная сборка пула (блокирующая)."""
+        import_marker = self.get_import_marker()
+        queryset = self.get_queryset().order_by()
+
+        ids = array('l')
+        by_year: Dict[int, array] = {}
+        rows = queryset.values_list('pk', 'year').iterator(
+            chunk_size=BUILD_CHUNK_SIZE
+        )
+        for film_id, year in rows:
+            ids.append(film_id)
+            if year is not None:
+                by_year.setdefault(year, array('l')).append(film_id)
+
+        by_genre: Dict[int, array] = {}
+        by_genre_year: Dict[int, Dict[int, array]] = {}
+        links = FilmGenre.objects.filter(
+            film__in=queryset.values('pk')
+        ).values_list('genre_id', 'film_id', 'film__year').distinct().iterator(
+            chunk_size=BUILD_CHUNK_SIZE
+        )
+        for genre_id, film_id, year in links:
+            by_genre.setdefault(genre_id, array('l')).append(film_id)
+            genre_years = by_genre_year.setdefault(genre_id, {})
+            if year is not None:
+                genre_years.setdefault(year, array('l')).append(film_id)
+
+        with self._lock:
+            self._ids = ids
+            self._by_genre = by_genre
+            self._by_year = by_year
+            self._by_genre_year = by_genre_year
+            self._import_marker = import_marker
+            self._built_at = time.monotonic()
+            self.ready = True
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'films': len(self._ids),
+                'genres': len(self._by_genre),
+                'years': len(self._by_year),
+                'bytes': sum(
+                    part.itemsize * len(part)
+                    for part in chain(
+                        [self._ids],
+                        self._by_genre.values(),
+                        self._by_year.values(),
+                        *(
+                            years.values()
+                            for years in self._by_genre_year.values()
+                        ),
+                    )
+                ),
+            }
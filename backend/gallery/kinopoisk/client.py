@@ -0,0 +1,350 @@
+"""
+HTTP-клиент Kinopoisk API.
+
+Запросы проходят через общий ограничитель частоты (token bucket),
+ответы 429/5xx и сетевые ошибки повторяются с экспоненциальной паузой.
+Адрес API берётся из settings.KINOPOISK_API_BASE, поэтому клиент можно
+направить на локальный фейковый сервер. Общий лимит запросов (before_request)
+списывается за каждую попытку, включая повторы.
+"""
+import random
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import requests
+from django.conf import settings
+
+from gallery.kinopoisk.stream import CHUNK_SIZE, StreamedPage, open_body, spool
+
+
+DEFAULT_API_BASE = "https://api.kinopoisk.dev"
+
+MAX_VOTES_FILTER_VALUE = 99999999
+
+# Ответы, после которых запрос имеет смысл повторить
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+@dataclass
+class TokenInfo:
+    requests_used: Optional[int] = None
+    requests_remaining: Optional[int] = None
+    daily_limit: Optional[int] = None
+    resets_at: Optional[str] = None
+
+
+class KinopoiskAPIError(Exception):
+    """Ошибка при работе с Kinopoisk API."""
+
+
+class KinopoiskQuotaExhausted(KinopoiskAPIError):
+    """Общий лимит запросов исчерпан - запрос не отправлен."""
+
+
+def format_number(value: float) -> str:
+    """Форматирует число для query-параметров Kinopoisk API."""
+    if float(value).is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def make_range_filter(
+    min_value: Optional[float],
+    max_value: Optional[float],
+) -> Optional[str]:
+    """
+    Делает строку диапазона для API:
+    7-10, 500000-99999999, 1990-2026.
+    """
+    if min_value is None and max_value is None:
+        return None
+
+    if min_value is None:
+        return f"0-{format_number(max_value)}"
+
+    if max_value is None:
+        return f"{format_number(min_value)}-{MAX_VOTES_FILTER_VALUE}"
+
+    return f"{format_number(min_value)}-{format_number(max_value)}"
+
+
+class TokenBucket:
+    """
+    Ограничитель частоты запросов.
+
+    rate - сколько запросов в секунду в среднем, capacity - сколько
+    можно сделать подряд без ожидания. rate <= 0 - без ограничения.
+    Потокобезопасен: один экземпляр можно делить между потоками.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Ждёт свободный токен. Возвращает, сколько секунд ждали."""
+        if self.rate <= 0:
+            return 0.0
+
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity,
+                    self._tokens + (now - self._updated_at) * self.rate,
+                )
+                self._updated_at = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+
+                delay = (1 - self._tokens) / self.rate
+
+            time.sleep(delay)
+            waited += delay
+
+
+class KinopoiskClient:
+    def __init__(
+        self,
+        api_key: str,
+        timeout: int = 30,
+        api_base: Optional[str] = None,
+        rate_limiter: Optional[TokenBucket] = None,
+        max_retries: int = 5,
+        backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        before_request: Optional[Callable[[], bool]] = None,
+    ):
+        self.session = requests.Session()
+        self.session.headers.update({"X-API-KEY": api_key})
+        self.timeout = timeout
+
+        self.api_base = (
+            api_base
+            or getattr(settings, "KINOPOISK_API_BASE", None)
+            or DEFAULT_API_BASE
+        ).rstrip("/")
+        self.token_info_url = f"{self.api_base}/v1.5/token"
+        self.movies_url = f"{self.api_base}/v1.5/movie"
+
+        self.rate_limiter = rate_limiter or TokenBucket(rate=0)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        # Списывает одну попытку из общего лимита; False - лимит исчерпан
+        self.before_request = before_request
+
+        # Счётчики для отчёта в конце импорта
+        self.requests_sent = 0
+        self.retries = 0
+        # Секунды по стадиям: rate_wait, http, retry_wait, decode
+        self.stage_seconds: Counter = Counter()
+
+    def _retry_delay(
+        self,
+        attempt: int,
+        response: Optional[requests.Response] = None,
+    ) -> float:
+        """Пауза перед повтором: Retry-After или экспонента с джиттером."""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            try:
+                return min(float(retry_after), self.max_backoff)
+            except (TypeError, ValueError):
+                pass
+
+        delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _get(
+        self,
+        url: str,
+        params: Optional[List[Tuple[str, str]]] = None,
+        stream: bool = False,
+    ) -> Union[Dict[str, Any], StreamedPage]:
+        """
+        GET с повторами. stream=True - тело ответа не разбирается
+        целиком, а возвращается как StreamedPage.
+        """
+        attempt = 0
+        while True:
+            if self.before_request is not None and not self.before_request():
+                raise KinopoiskQuotaExhausted("Общий лимит запросов исчерпан.")
+            self.stage_seconds["rate_wait"] += self.rate_limiter.acquire()
+            self.requests_sent += 1
+
+            started = time.perf_counter()
+            try:
+                response = self.session.get(
+                    url, params=params, timeout=self.timeout, stream=stream
+                )
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                self.stage_seconds["http"] += time.perf_counter() - started
+                if attempt >= self.max_retries:
+                    raise KinopoiskAPIError(
+                        "API недоступен: {0}".format(exc)
+                    )
+                response = None
+            else:
+                self.stage_seconds["http"] += time.perf_counter() - started
+                if (
+                    response.status_code not in RETRY_STATUSES
+                    or attempt >= self.max_retries
+                ):
+                    break
+                response.close()
+
+            delay = self._retry_delay(attempt, response)
+            self.stage_seconds["retry_wait"] += delay
+            time.sleep(delay)
+            attempt += 1
+            self.retries += 1
+
+        if response.status_code == 401:
+            raise KinopoiskAPIError("Неверный API ключ или он не передан.")
+
+        if response.status_code == 403:
+            raise KinopoiskAPIError("Превышен суточный лимит запросов.")
+
+        if response.status_code == 400:
+            raise KinopoiskAPIError(
+                "Невалидный запрос: {0}".format(response.text)
+            )
+
+        try:
+            response.raise_for_status()
+        except requests.HTTPError as exc:
+            raise KinopoiskAPIError(
+                "Ошибка API: {0}; body={1}".format(exc, response.text)
+            )
+
+        if stream:
+            started = time.perf_counter()
+            with response:
+                body = spool(response.iter_content(CHUNK_SIZE))
+            self.stage_seconds["http"] += time.perf_counter() - started
+
+            started = time.perf_counter()
+            page = open_body(body)
+            self.stage_seconds["decode"] += time.perf_counter() - started
+            return page
+
+        started = time.perf_counter()
+        data = response.json()
+        self.stage_seconds["decode"] += time.perf_counter() - started
+        return data
+
+    def get_token_info(self) -> TokenInfo:
+        data = self._get(self.token_info_url)
+
+        return TokenInfo(
+            requests_used=data.get("used"),
+            requests_remaining=data.get("requestsRemaining"),
+            daily_limit=data.get("limit"),
+            resets_at=data.get("resetsAt"),
+        )
+
+    def get_movies_page(
+        self,
+        limit: int = 250,
+        next_cursor: Optional[str] = None,
+        updated_since: Optional[str] = None,
+        min_rating: float = 7.0,
+        min_votes: int = 500000,
+        year_min: Optional[int] = None,
+        year_max: Optional[int] = None,
+        require_backdrop: bool = True,
+        stream: bool = False,
+    ) -> Union[Dict[str, Any], StreamedPage]:
+        rating_filter = make_range_filter(min_rating, 10)
+        votes_filter = make_range_filter(min_votes, MAX_VOTES_FILTER_VALUE)
+        year_filter = make_range_filter(year_min, year_max)
+
+        params = [
+            ("limit", str(limit)),
+
+            # Основные поля
+            ("selectFields", "id"),
+            ("selectFields", "name"),
+            ("selectFields", "enName"),
+            ("selectFields", "alternativeName"),
+            ("selectFields", "description"),
+            ("selectFields", "shortDescription"),
+            ("selectFields", "slogan"),
+            ("selectFields", "type"),
+            ("selectFields", "isSeries"),
+            ("selectFields", "year"),
+
+            # Рейтинги и голоса
+            ("selectFields", "rating"),
+            ("selectFields", "votes"),
+            ("selectFields", "ratingMpaa"),
+            ("selectFields", "ageRating"),
+
+            # Детали
+            ("selectFields", "budget"),
+            ("selectFields", "movieLength"),
+
+            # Связи и медиа
+            ("selectFields", "genres"),
+            ("selectFields", "countries"),
+            ("selectFields", "poster"),
+            ("selectFields", "backdrop"),
+            ("selectFields", "logo"),
+            ("selectFields", "videos"),
+            ("selectFields", "persons"),
+            ("selectFields", "facts"),
+            ("selectFields", "fees"),
+            ("selectFields", "similarMovies"),
+            ("selectFields", "sequelsAndPrequels"),
+
+            # Служебные
+            ("selectFields", "updatedAt"),
+            ("selectFields", "createdAt"),
+
+            # Жёсткие фильтры качества
+            ("type", "movie"),
+            ("isSeries", "false"),
+            ("rating.kp", rating_filter),
+            ("votes.kp", votes_filter),
+
+            # Нужные поля не должны быть пустыми
+            ("notNullFields", "id"),
+            ("notNullFields", "name"),
+            ("notNullFields", "year"),
+            ("notNullFields", "rating.kp"),
+            ("notNullFields", "votes.kp"),
+            ("notNullFields", "poster.url"),
+            ("notNullFields", "genres.name"),
+
+            # Сортировка: сначала новее, потом популярнее, потом выше рейтинг
+            ("sortField", "year"),
+            ("sortType", "-1"),
+            ("sortField", "votes.kp"),
+            ("sortType", "-1"),
+            ("sortField", "rating.kp"),
+            ("sortType", "-1"),
+        ]
+
+        if require_backdrop:
+            params.append(("notNullFields", "backdrop.url"))
+
+        if year_filter:
+            params.append(("year", year_filter))
+
+        if updated_since:
+            params.append(("updatedAt", updated_since))
+
+        if next_cursor:
+            params.append(("next", next_cursor))
+
+        return self._get(self.movies_url, params=params, stream=stream)
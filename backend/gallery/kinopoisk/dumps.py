@@ -0,0 +1,174 @@
+"""
+Запись и чтение сырых страниц Kinopoisk API на диске.
+
+Каждая страница - отдельный файл JSON lines, сжатый gzip или zstd:
+первая строка - служебные поля ответа (cursor, next, hasNext, total...),
+дальше по одному фильму на строку. Имя файла - хэш курсора, которым
+страница запрошена, поэтому повтор идёт по той же цепочке курсоров,
+что и импорт из API, но без запросов и расхода лимита.
+
+zstd требует пакет zstandard; без него доступен только gzip.
+"""
+import gzip
+import hashlib
+import io
+import json
+import os
+from pathlib import Path
+from itertools import islice
+from typing import Any, Callable, Dict, Iterator, Optional, Union
+
+from gallery.kinopoisk.stream import StreamedPage
+
+try:
+    import zstandard
+except ImportError:  # zstd необязателен
+    zstandard = None
+
+
+COMPRESSIONS = {
+    "gzip": ".jsonl.gz",
+    "zstd": ".jsonl.zst",
+}
+
+# Ключ первой страницы (курсора у неё нет)
+FIRST_PAGE_KEY = "first"
+
+
+class DumpError(Exception):
+    """Ошибка при работе с дампом страниц."""
+
+
+def cursor_key(cursor: Optional[str]) -> str:
+    if not cursor:
+        return FIRST_PAGE_KEY
+    return hashlib.sha1(cursor.encode("utf-8")).hexdigest()[:20]
+
+
+class PageDump:
+    """Каталог со страницами одного импорта.
+
+    Args:
+        directory: каталог дампа (создаётся при первой записи)
+        compression: gzip или zstd - чем сжимать новые файлы;
+            читаются файлы в любом из форматов
+    """
+
+    def __init__(self, directory, compression: str = "gzip"):
+        if compression not in COMPRESSIONS:
+            raise DumpError(f"Неизвестное сжатие: {compression}")
+        if compression == "zstd" and zstandard is None:
+            raise DumpError("Для zstd нужен пакет zstandard")
+
+        self.directory = Path(directory)
+        self.compression = compression
+
+    def path_for(self, cursor: Optional[str], compression: str) -> Path:
+        return self.directory / (cursor_key(cursor) + COMPRESSIONS[compression])
+
+    def find(self, cursor: Optional[str]) -> Optional[Path]:
+        for compression in COMPRESSIONS:
+            path = self.path_for(cursor, compression)
+            if path.exists():
+                return path
+        return None
+
+    # Запись
+
+    def write_page(
+        self,
+        cursor: Optional[str],
+        data: Union[Dict[str, Any], StreamedPage],
+    ) -> Path:
+        """Сохраняет ответ API. Файл появляется целиком или не появляется."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.path_for(cursor, self.compression)
+        tmp_path = path.with_name(path.name + ".tmp")
+
+        if isinstance(data, StreamedPage):
+            meta = dict(data.meta)
+            docs = data.iter_docs()
+        else:
+            meta = {key: value for key, value in data.items() if key != "docs"}
+            docs = data.get("docs") or []
+        meta["cursor"] = cursor
+
+        with self._open_write(tmp_path) as stream:
+            stream.write(json.dumps(meta, ensure_ascii=False) + "\n")
+            for doc in docs:
+                stream.write(json.dumps(doc, ensure_ascii=False) + "\n")
+
+        os.replace(tmp_path, path)
+        return path
+
+    def recording(
+        self,
+        fetch_page: Callable[[Optional[str]], Dict[str, Any]],
+    ) -> Callable[[Optional[str]], Dict[str, Any]]:
+        """Обёртка над загрузкой страницы, сохраняющая каждый ответ."""
+        def fetch_and_record(cursor: Optional[str]) -> Dict[str, Any]:
+            data = fetch_page(cursor)
+            self.write_page(cursor, data)
+            return data
+
+        return fetch_and_record
+
+    def _open_write(self, path: Path):
+        if self.compression == "zstd":
+            raw = open(path, "wb")
+            compressed = zstandard.ZstdCompressor().stream_writer(raw)
+            return io.TextIOWrapper(compressed, encoding="utf-8")
+        return gzip.open(path, "wt", encoding="utf-8", compresslevel=6)
+
+    # Чтение
+
+    def read_lines(self, cursor: Optional[str]) -> Iterator[str]:
+        """Строки файла страницы (первая - служебная)."""
+        path = self.find(cursor)
+        if path is None:
+            raise DumpError(
+                "В дампе {0} нет страницы для курсора {1}".format(
+                    self.directory, cursor or "(первая страница)"
+                )
+            )
+
+        with self._open_read(path) as stream:
+            for line in stream:
+                if line.strip():
+                    yield line
+
+    def read_page(self, cursor: Optional[str]) -> Dict[str, Any]:
+        """Ответ API в исходном виде - подменяет загрузку страницы."""
+        lines = self.read_lines(cursor)
+        data = json.loads(next(lines))
+        data.pop("cursor", None)
+        data["docs"] = [json.loads(line) for line in lines]
+        return data
+
+    def open_page(self, cursor: Optional[str]) -> StreamedPage:
+        """
+        Та же страница для потокового импорта: фильмы читаются
+        из файла по одному при обходе.
+        """
+        lines = self.read_lines(cursor)
+        try:
+            meta = json.loads(next(lines))
+        finally:
+            lines.close()
+        meta.pop("cursor", None)
+
+        def docs() -> Iterator[Dict[str, Any]]:
+            lines = islice(self.read_lines(cursor), 1, None)
+            return (json.loads(line) for line in lines)
+
+        return StreamedPage(meta=meta, docs=docs)
+
+    @staticmethod
+    def _open_read(path: Path):
+        if path.name.endswith(COMPRESSIONS["zstd"]):
+            if zstandard is None:
+                raise DumpError(f"Для чтения {path} нужен пакет zstandard")
+            raw = open(path, "rb")
+            decompressed = zstandard.ZstdDecompressor().stream_reader(raw)
+            return io.TextIOWrapper(decompressed, encoding="utf-8")
+        return gzip.open(path, "rt", encoding="utf-8")
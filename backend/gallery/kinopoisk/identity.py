@@ -0,0 +1,68 @@
+"""
+Кэш соответствий "ключ из API -> запись в БД" на время импорта.
+
+Одни и те же актёры и профессии встречаются в сотнях фильмов за запуск,
+поэтому PageIngestor помнит их pk и сохранённые значения полей: запись,
+которая уже есть в кэше с теми же значениями, не ищется и не
+перезаписывается. Размер ограничен - вытесняются давно не нужные.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Tuple
+
+
+class IdentityMap:
+    """LRU-кэш со счётчиками попаданий и промахов.
+
+    Args:
+        maxsize: сколько записей хранить; 0 - кэш выключен
+    """
+
+    def __init__(self, maxsize: int = 50000):
+        self.maxsize = maxsize
+        self._items: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._items
+
+    def get_many(
+        self,
+        keys: Iterable[Hashable],
+    ) -> Tuple[Dict[Hashable, Any], List[Hashable]]:
+        """({ключ: значение} найденных, ключи, которых нет в кэше)."""
+        found = {}
+        missing = []
+        for key in keys:
+            if key in self._items:
+                self._items.move_to_end(key)
+                found[key] = self._items[key]
+                self.hits += 1
+            else:
+                missing.append(key)
+                self.misses += 1
+        return found, missing
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def update(self, items: Dict[Hashable, Any]) -> None:
+        for key, value in items.items():
+            self.put(key, value)
+
+    def clear(self) -> None:
+        """Сбрасывает записи (например, после отката транзакции)."""
+        self._items.clear()
+
+    def stats(self) -> str:
+        return "попаданий {0}, промахов {1}, в кэше {2}".format(
+            self.hits, self.misses, len(self._items)
+        )
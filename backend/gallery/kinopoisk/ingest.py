@@ -0,0 +1,959 @@
+"""
+Сохранение страницы фильмов Kinopoisk API пачкой.
+
+Вместо get_or_create/update_or_create на каждый жанр, персону и факт
+страница (до 250 фильмов) пишется фиксированным числом запросов:
+справочники и существующие записи достаются одним IN на таблицу,
+запись - bulk_create(update_conflicts=True) или ignore_conflicts.
+Вся страница сохраняется в одной транзакции.
+
+У каждого фильма хранятся хэши разделов документа (Film.import_hashes),
+посчитанные только по тем полям, которые мы сохраняем. При повторном
+импорте фильм без изменений не трогается вовсе (и его updated_at не
+меняется), а у изменившегося перезаписываются только те разделы, чей
+хэш отличается: строка Film - только при изменении её собственных
+полей, иначе обновляются лишь хэши.
+
+Связи с похожими фильмами и сиквелами сохраняются вместе со страницей,
+если связанный фильм уже есть в БД; остальные в той же транзакции
+пишутся в PendingFilmLink. Связанный фильм часто приходит на одной
+из следующих страниц - тогда связь создаётся при его сохранении,
+а что осталось, разрешает resolve_links в конце импорта (или
+следующий запуск, если этот упал).
+
+Персоны, профессии и участники фильмов запоминаются в IdentityMap
+на весь запуск: уже известная запись с теми же полями не ищется
+в БД и не перезаписывается.
+"""
+import hashlib
+import json
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from gallery.models import (
+    Country,
+    Fact,
+    Fees,
+    Film,
+    FilmCountry,
+    FilmGenre,
+    FilmPerson,
+    FilmPersonProfession,
+    Genre,
+    PendingFilmLink,
+    Person,
+    Profession,
+    SequelsAndPrequels,
+    SimilarFilms,
+    Type,
+    Video,
+)
+from gallery.cache import invalidate_film_detail
+from gallery.kinopoisk.identity import IdentityMap
+from gallery.kinopoisk.metrics import StageTimer
+from gallery.search import refresh_film_trigrams
+
+
+BATCH_SIZE = 500
+
+# Размер IN (...) при поиске существующих записей
+LOOKUP_CHUNK_SIZE = 1000
+
+FEES_PLACES = {
+    "world": "Мир",
+    "usa": "США",
+    "russia": "Россия",
+}
+
+
+def film_fields(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Поля Film из документа API (без type и kinopoisk_api_id)."""
+    rating = payload.get("rating") or {}
+    votes = payload.get("votes") or {}
+    budget = payload.get("budget") or {}
+    poster = payload.get("poster") or {}
+    backdrop = payload.get("backdrop") or {}
+    logo = payload.get("logo") or {}
+
+    return {
+        "name": payload.get("name"),
+        "en_name": payload.get("enName"),
+        "alternative_name": payload.get("alternativeName"),
+        "description": payload.get("description"),
+        "short_description": payload.get("shortDescription"),
+        "slogan": payload.get("slogan"),
+        "year": payload.get("year"),
+        "movie_length": payload.get("movieLength"),
+        "kinopoisk_rating": rating.get("kp"),
+        "kinopoisk_votes": votes.get("kp"),
+        "imdb_rating": rating.get("imdb"),
+        "imdb_votes": votes.get("imdb"),
+        "rating_mpaa": payload.get("ratingMpaa"),
+        "age_rating": payload.get("ageRating"),
+        "budget_value": budget.get("value"),
+        "budget_currency": budget.get("currency"),
+        "poster_url": poster.get("url"),
+        "poster_preview_url": poster.get("previewUrl"),
+        "logo_url": logo.get("url"),
+        "logo_preview_url": logo.get("previewUrl"),
+        "backdrop_url": backdrop.get("url"),
+        "backdrop_preview_url": backdrop.get("previewUrl"),
+    }
+
+
+# Что перезаписывается у уже существующего фильма
+FILM_UPDATE_FIELDS = [*film_fields({}), "type", "import_hashes", "updated_at"]
+
+# Вид связи -> (ключ документа, модель связи, поле связанного фильма)
+RELATED_KINDS = {
+    "similar": ("similarMovies", SimilarFilms, "similar_film"),
+    "sequel": ("sequelsAndPrequels", SequelsAndPrequels, "related_film"),
+}
+
+# Увеличить при изменении того, какие поля документа и как сохраняются:
+# все фильмы при следующем импорте перезапишутся
+HASH_VERSION = 1
+
+
+def _named_items(payload: Dict[str, Any], key: str) -> List[str]:
+    return sorted({
+        item.get("name") for item in payload.get(key) or []
+        if item.get("name")
+    })
+
+
+def _videos(payload: Dict[str, Any]) -> list:
+    videos = payload.get("videos") or {}
+    if not isinstance(videos, dict):
+        return []
+    return [
+        [item.get("url"), item.get("name"), item.get("site")]
+        for item in videos.get("trailers", []) or []
+    ]
+
+
+def _fees(payload: Dict[str, Any]) -> dict:
+    fees = payload.get("fees") or {}
+    if not isinstance(fees, dict):
+        return {}
+    return {
+        key: [block.get("value"), block.get("currency")]
+        for key in FEES_PLACES
+        for block in [fees.get(key) or {}]
+    }
+
+
+# Раздел документа -> значения, от которых зависит сохранённое.
+# Похожие фильмы и сиквелы не хэшируются: связь может стать возможной
+# позже (когда связанный фильм импортируют), а вставка связей
+# с ignore_conflicts ничего не перезаписывает.
+HASHED_SECTIONS = {
+    "film": lambda payload: [film_fields(payload), payload.get("type")],
+    "genres": lambda payload: _named_items(payload, "genres"),
+    "countries": lambda payload: _named_items(payload, "countries"),
+    "persons": lambda payload: [
+        [
+            item.get("id"), item.get("name"), item.get("enName"),
+            item.get("photo"), item.get("description"),
+            item.get("profession"), item.get("enProfession"),
+        ]
+        for item in payload.get("persons") or []
+    ],
+    "videos": _videos,
+    "facts": lambda payload: [
+        [item.get("value"), item.get("type"), bool(item.get("spoiler", False))]
+        for item in payload.get("facts") or []
+    ],
+    "fees": _fees,
+}
+
+
+def payload_hashes(payload: Dict[str, Any]) -> Dict[str, str]:
+    """Хэши разделов документа API для Film.import_hashes."""
+    hashes = {}
+    for section, values in HASHED_SECTIONS.items():
+        raw = json.dumps(
+            [HASH_VERSION, values(payload)],
+            ensure_ascii=False,
+            sort_keys=True,
+            default=str,
+        )
+        hashes[section] = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+    return hashes
+
+
+def placeholder_fields(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Поля Film-заглушки для похожего фильма или сиквела."""
+    poster = item.get("poster") or {}
+    rating = item.get("rating") or {}
+
+    return {
+        "name": item.get("name"),
+        "en_name": item.get("enName"),
+        "alternative_name": item.get("alternativeName"),
+        "year": item.get("year"),
+        "poster_url": poster.get("url"),
+        "poster_preview_url": poster.get("previewUrl"),
+        "kinopoisk_rating": rating.get("kp"),
+        "imdb_rating": rating.get("imdb"),
+    }
+
+
+def chunks(values: Iterable, size: int = LOOKUP_CHUNK_SIZE) -> Iterable[list]:
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+class PageIngestor:
+    """Сохраняет документы одной страницы API пачкой.
+
+    Args:
+        allow_related_placeholders: создавать Film-заглушки для похожих
+            фильмов и сиквелов, которых ещё нет в БД
+        ignore_hashes: перезаписывать фильмы, даже если хэши не изменились
+        cache_size: сколько персон и участников фильмов помнить между
+            страницами (0 - не помнить)
+        using: алиас БД
+    """
+
+    def __init__(
+        self,
+        allow_related_placeholders: bool = False,
+        ignore_hashes: bool = False,
+        cache_size: int = 50000,
+        using: str = DEFAULT_DB_ALIAS,
+    ):
+        self.allow_related_placeholders = allow_related_placeholders
+        self.ignore_hashes = ignore_hashes
+        self.using = using
+
+        # kinopoisk_id -> (pk, (name, en_name, photo_url))
+        self.persons_cache = IdentityMap(cache_size)
+        # profession -> (pk, en_profession)
+        self.professions_cache = IdentityMap(cache_size)
+        # (film_id, person_id) -> (pk, description)
+        self.film_persons_cache = IdentityMap(cache_size)
+
+        # Счётчики за всё время работы (для отчёта команды)
+        self.films_unchanged = 0
+        self.sections_written: Counter = Counter()
+        self.links_resolved = 0
+        self.placeholders_created = 0
+        self.persons_written = 0
+        self.film_persons_written = 0
+
+    def objects(self, model):
+        return model.objects.using(self.using)
+
+    def ingest(
+        self,
+        docs: List[Dict[str, Any]],
+        timer: Optional[StageTimer] = None,
+    ) -> int:
+        """
+        Сохраняет документы, прошедшие фильтры качества.
+
+        timer - куда записать время и запросы по стадиям.
+        Возвращает число сохранённых фильмов.
+        """
+        # Повтор фильма на странице: побеждает последний документ
+        payloads = {doc["id"]: doc for doc in docs if doc.get("id")}
+        if not payloads:
+            return 0
+
+        timer = timer or StageTimer(self.using)
+
+        try:
+            changed = self.save_page(payloads, timer)
+        except Exception:
+            # После отката в кэше могли остаться pk несохранённых записей
+            self.clear_caches()
+            raise
+
+        self.films_unchanged += len(payloads) - len(changed)
+        for sections in changed.values():
+            self.sections_written.update(sections)
+
+        return len(payloads)
+
+    def save_page(
+        self,
+        payloads: Dict[int, Dict[str, Any]],
+        timer: StageTimer,
+    ) -> Dict[int, Set[str]]:
+        """Запись страницы в одной транзакции. Возвращает изменившиеся разделы."""
+        with transaction.atomic(using=self.using):
+            with timer.stage("hashes"):
+                hashes = {
+                    kinopoisk_id: payload_hashes(payload)
+                    for kinopoisk_id, payload in payloads.items()
+                }
+                film_ids, changed = self.detect_changes(hashes)
+
+            def section(name):
+                return {
+                    kinopoisk_id: payloads[kinopoisk_id]
+                    for kinopoisk_id, sections in changed.items()
+                    if name in sections
+                }
+
+            # Строку фильма пишем, только если изменились её поля: иначе
+            # updated_at (ключ кэшей) сдвигался бы от смены состава или фактов
+            film_payloads = section("film")
+            if film_payloads:
+                with timer.stage("films"):
+                    film_ids.update(self.save_films(film_payloads, hashes))
+            hashes_only = {
+                kinopoisk_id: hashes[kinopoisk_id]
+                for kinopoisk_id, sections in changed.items()
+                if "film" not in sections
+            }
+            if hashes_only:
+                with timer.stage("films"):
+                    self.save_hashes(hashes_only, film_ids)
+
+            with timer.stage("genres"):
+                self.save_named_links(
+                    section("genres"), film_ids, "genres", Genre, FilmGenre,
+                    "genre",
+                )
+            with timer.stage("countries"):
+                self.save_named_links(
+                    section("countries"), film_ids, "countries", Country,
+                    FilmCountry, "country",
+                )
+            with timer.stage("persons"):
+                self.save_persons(section("persons"), film_ids)
+            with timer.stage("videos"):
+                self.save_videos(section("videos"), film_ids)
+            with timer.stage("facts"):
+                self.save_facts(section("facts"), film_ids)
+            with timer.stage("fees"):
+                self.save_fees(section("fees"), film_ids)
+            with timer.stage("links"):
+                self.save_links(payloads, film_ids)
+
+            # bulk_create не шлёт post_save - триграммы обновляем сами
+            renamed_ids = [film_ids[kinopoisk_id] for kinopoisk_id in section("film")]
+            if renamed_ids:
+                with timer.stage("trigrams"):
+                    refresh_film_trigrams(renamed_ids, using=self.using)
+
+            # Сама фиксация транзакции - при выходе из atomic
+            commit_started = time.perf_counter()
+        timer.add("commit", time.perf_counter() - commit_started)
+
+        return changed
+
+    def clear_caches(self) -> None:
+        self.persons_cache.clear()
+        self.professions_cache.clear()
+        self.film_persons_cache.clear()
+
+    def detect_changes(self, hashes: Dict[int, Dict[str, str]]):
+        """
+        Сравнивает хэши страницы с сохранёнными.
+
+        Возвращает ({kinopoisk_api_id: pk} уже известных фильмов,
+        {kinopoisk_api_id: изменившиеся разделы} - только для фильмов,
+        которые нужно записать).
+        """
+        film_ids = {}
+        stored = {}
+        for chunk in chunks(hashes):
+            rows = self.objects(Film).filter(
+                kinopoisk_api_id__in=chunk
+            ).values_list("kinopoisk_api_id", "pk", "import_hashes")
+            for kinopoisk_id, pk, import_hashes in rows:
+                film_ids[kinopoisk_id] = pk
+                stored[kinopoisk_id] = import_hashes or {}
+
+        changed: Dict[int, Set[str]] = {}
+        for kinopoisk_id, new_hashes in hashes.items():
+            old_hashes = stored.get(kinopoisk_id, {})
+            sections = {
+                name for name, value in new_hashes.items()
+                if self.ignore_hashes or old_hashes.get(name) != value
+            }
+            if sections:
+                changed[kinopoisk_id] = sections
+
+        return film_ids, changed
+
+    # Справочники
+
+    def resolve_names(self, model, names: Iterable[str],
+                      field: str = "name") -> Dict[str, int]:
+        """
+        {название: pk} для справочника, недостающие записи создаются.
+
+        Новые значения справочников появляются редко, поэтому они
+        создаются через save() - так срабатывает автозаполнение slug.
+        """
+        names = {name for name in names if name}
+        found = {}
+        for chunk in chunks(names):
+            found.update(
+                self.objects(model).filter(
+                    **{f"{field}__in": chunk}
+                ).values_list(field, "pk")
+            )
+
+        for name in names - found.keys():
+            obj, _ = self.objects(model).get_or_create(**{field: name})
+            found[name] = obj.pk
+
+        return found
+
+    def resolve_film_ids(self, kinopoisk_ids: Iterable[int]) -> Dict[int, int]:
+        found = {}
+        for chunk in chunks(set(kinopoisk_ids)):
+            found.update(
+                self.objects(Film).filter(
+                    kinopoisk_api_id__in=chunk
+                ).values_list("kinopoisk_api_id", "pk")
+            )
+        return found
+
+    # Фильмы
+
+    def save_films(
+        self,
+        payloads: Dict[int, Dict[str, Any]],
+        hashes: Dict[int, Dict[str, str]],
+    ) -> Dict[int, int]:
+        """Upsert фильмов страницы. Возвращает {kinopoisk_api_id: pk}."""
+        type_ids = self.resolve_names(
+            Type, (payload.get("type") for payload in payloads.values())
+        )
+
+        # Строки пишутся в порядке ключа: параллельные импорты (шарды)
+        # берут блокировки в одном порядке и не ловят взаимоблокировки
+        films = []
+        for kinopoisk_id, payload in sorted(payloads.items()):
+            fields = film_fields(payload)
+            films.append(Film(
+                kinopoisk_api_id=kinopoisk_id,
+                type_id=type_ids.get(payload.get("type")),
+                import_hashes=hashes[kinopoisk_id],
+                **fields,
+            ))
+
+        self.objects(Film).bulk_create(
+            films,
+            batch_size=BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=["kinopoisk_api_id"],
+            update_fields=FILM_UPDATE_FIELDS,
+        )
+
+        return self.resolve_film_ids(payloads)
+
+    def save_hashes(
+        self,
+        hashes: Dict[int, Dict[str, str]],
+        film_ids: Dict[int, int],
+    ) -> None:
+        """
+        Хэши фильмов, у которых изменились только связанные разделы.
+
+        Строка фильма и updated_at не меняются, поэтому кэш страницы
+        фильма сбрасывается явно.
+        """
+        self.objects(Film).bulk_update(
+            [
+                Film(pk=film_ids[kinopoisk_id], import_hashes=film_hashes)
+                for kinopoisk_id, film_hashes in sorted(hashes.items())
+            ],
+            ["import_hashes"],
+            batch_size=BATCH_SIZE,
+        )
+        for kinopoisk_id in hashes:
+            invalidate_film_detail(film_ids[kinopoisk_id], using=self.using)
+
+    def save_named_links(self, payloads, film_ids, key, model,
+                         link_model, link_field) -> None:
+        """Жанры и страны: справочник по имени + связь с фильмом."""
+        items = {
+            kinopoisk_id: [
+                item.get("name") for item in payload.get(key) or []
+                if item.get("name")
+            ]
+            for kinopoisk_id, payload in payloads.items()
+        }
+        name_ids = self.resolve_names(
+            model, (name for names in items.values() for name in names)
+        )
+
+        self.objects(link_model).bulk_create(
+            [
+                link_model(
+                    film_id=film_ids[kinopoisk_id],
+                    **{f"{link_field}_id": name_ids[name]},
+                )
+                for kinopoisk_id, names in items.items()
+                for name in set(names)
+            ],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+    # Персоны
+
+    def resolve_professions(self, items: List[Dict[str, Any]]) -> Dict[str, int]:
+        """{профессия: pk}; английское название обновляется, если изменилось."""
+        professions = {}
+        for item in items:
+            profession_ru = item.get("profession")
+            profession_en = item.get("enProfession")
+            if profession_ru and profession_en:
+                professions[profession_ru] = profession_en
+
+        cached, missing = self.professions_cache.get_many(professions)
+        found = {}
+        stale = []
+        for profession_ru, (pk, profession_en) in cached.items():
+            found[profession_ru] = pk
+            if professions[profession_ru] != profession_en:
+                stale.append((profession_ru, pk))
+
+        if missing:
+            rows = self.objects(Profession).filter(
+                profession__in=missing
+            ).values_list("profession", "pk", "en_profession")
+            for profession_ru, pk, profession_en in rows:
+                found[profession_ru] = pk
+                if professions[profession_ru] != profession_en:
+                    stale.append((profession_ru, pk))
+
+        for profession_ru, pk in stale:
+            self.objects(Profession).filter(pk=pk).update(
+                en_profession=professions[profession_ru]
+            )
+
+        for profession_ru in professions.keys() - found.keys():
+            profession, _ = self.objects(Profession).get_or_create(
+                profession=profession_ru,
+                defaults={"en_profession": professions[profession_ru]},
+            )
+            found[profession_ru] = profession.pk
+
+        for profession_ru, profession_en in professions.items():
+            self.professions_cache.put(
+                profession_ru, (found[profession_ru], profession_en)
+            )
+
+        return found
+
+    def sync_persons(
+        self,
+        persons: Dict[int, Tuple[Optional[str], Optional[str], Optional[str]]],
+    ) -> Dict[int, int]:
+        """
+        {kinopoisk_id: pk} для {kinopoisk_id: (name, en_name, photo_url)}.
+
+        Пишутся только новые персоны и те, у которых поменялись поля.
+        """
+        cached, missing = self.persons_cache.get_many(persons)
+        person_ids = {}
+        to_write = set()
+        for kinopoisk_id, (pk, fields) in cached.items():
+            person_ids[kinopoisk_id] = pk
+            if fields != persons[kinopoisk_id]:
+                to_write.add(kinopoisk_id)
+
+        for chunk in chunks(missing):
+            rows = self.objects(Person).filter(
+                kinopoisk_id__in=chunk
+            ).values_list("kinopoisk_id", "pk", "name", "en_name", "photo_url")
+            for kinopoisk_id, pk, *fields in rows:
+                person_ids[kinopoisk_id] = pk
+                if tuple(fields) != persons[kinopoisk_id]:
+                    to_write.add(kinopoisk_id)
+        new = [kinopoisk_id for kinopoisk_id in missing if kinopoisk_id not in person_ids]
+        to_write.update(new)
+
+        self.objects(Person).bulk_create(
+            [
+                Person(
+                    kinopoisk_id=kinopoisk_id,
+                    name=persons[kinopoisk_id][0],
+                    en_name=persons[kinopoisk_id][1],
+                    photo_url=persons[kinopoisk_id][2],
+                )
+                for kinopoisk_id in sorted(to_write)
+            ],
+            batch_size=BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=["kinopoisk_id"],
+            update_fields=["name", "en_name", "photo_url"],
+        )
+        self.persons_written += len(to_write)
+
+        # pk вставленных bulk_create с update_conflicts не возвращает
+        for chunk in chunks(new):
+            person_ids.update(
+                self.objects(Person).filter(
+                    kinopoisk_id__in=chunk
+                ).values_list("kinopoisk_id", "pk")
+            )
+
+        for kinopoisk_id, fields in persons.items():
+            self.persons_cache.put(kinopoisk_id, (person_ids[kinopoisk_id], fields))
+
+        return person_ids
+
+    def sync_film_persons(
+        self,
+        descriptions: Dict[Tuple[int, int], Optional[str]],
+    ) -> Dict[Tuple[int, int], int]:
+        """
+        {(film_id, person_id): pk} для {(film_id, person_id): description}.
+
+        Пишутся только новые участники и те, у кого поменялось описание.
+        """
+        cached, missing = self.film_persons_cache.get_many(descriptions)
+        film_person_ids = {}
+        to_write = set()
+        for key, (pk, description) in cached.items():
+            film_person_ids[key] = pk
+            if description != descriptions[key]:
+                to_write.add(key)
+
+        def lookup(keys):
+            found = {}
+            for chunk in chunks({film_id for film_id, _ in keys}):
+                rows = self.objects(FilmPerson).filter(
+                    film_id__in=chunk
+                ).values_list("film_id", "person_id", "pk", "description")
+                for film_id, person_id, pk, description in rows:
+                    if (film_id, person_id) in keys:
+                        found[(film_id, person_id)] = (pk, description)
+            return found
+
+        for key, (pk, description) in lookup(set(missing)).items():
+            film_person_ids[key] = pk
+            if description != descriptions[key]:
+                to_write.add(key)
+        new = {key for key in missing if key not in film_person_ids}
+        to_write.update(new)
+
+        self.objects(FilmPerson).bulk_create(
+            [
+                FilmPerson(
+                    film_id=film_id,
+                    person_id=person_id,
+                    description=descriptions[(film_id, person_id)],
+                )
+                for film_id, person_id in sorted(to_write)
+            ],
+            batch_size=BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=["film", "person"],
+            update_fields=["description"],
+        )
+        self.film_persons_written += len(to_write)
+
+        if new:
+            film_person_ids.update(
+                (key, pk) for key, (pk, _) in lookup(new).items()
+            )
+
+        for key, description in descriptions.items():
+            self.film_persons_cache.put(key, (film_person_ids[key], description))
+
+        return film_person_ids
+
+    def save_persons(self, payloads, film_ids) -> None:
+        credits = [
+            (kinopoisk_id, item)
+            for kinopoisk_id, payload in payloads.items()
+            for item in payload.get("persons") or []
+            if item.get("id")
+        ]
+        if not credits:
+            return
+
+        person_ids = self.sync_persons({
+            item["id"]: (item.get("name"), item.get("enName"), item.get("photo"))
+            for _, item in credits
+        })
+
+        # Персона с несколькими профессиями приходит несколькими элементами,
+        # описание роли берём из последнего
+        film_person_ids = self.sync_film_persons({
+            (film_ids[kinopoisk_id], person_ids[item["id"]]): item.get("description")
+            for kinopoisk_id, item in credits
+        })
+
+        profession_ids = self.resolve_professions([item for _, item in credits])
+        links = set()
+        for kinopoisk_id, item in credits:
+            profession_id = profession_ids.get(item.get("profession"))
+            if profession_id is None:
+                continue
+            key = (film_ids[kinopoisk_id], person_ids[item["id"]])
+            links.add((film_person_ids[key], profession_id))
+
+        self.objects(FilmPersonProfession).bulk_create(
+            [
+                FilmPersonProfession(
+                    film_person_id=film_person_id,
+                    profession_id=profession_id,
+                )
+                for film_person_id, profession_id in sorted(links)
+            ],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+    # Видео, факты, сборы
+
+    def save_videos(self, payloads, film_ids) -> None:
+        videos = {}
+        for kinopoisk_id, payload in payloads.items():
+            videos_payload = payload.get("videos") or {}
+            if not isinstance(videos_payload, dict):
+                continue
+            for item in videos_payload.get("trailers", []) or []:
+                url = item.get("url")
+                if not url:
+                    continue
+                videos[url] = Video(
+                    url=url,
+                    film_id=film_ids[kinopoisk_id],
+                    name=item.get("name"),
+                    site=item.get("site"),
+                    type="trailer",
+                )
+
+        self.objects(Video).bulk_create(
+            list(videos.values()),
+            batch_size=BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=["url"],
+            update_fields=["film", "name", "site", "type"],
+        )
+
+    def save_facts(self, payloads, film_ids) -> None:
+        if not payloads:
+            return
+
+        existing = set()
+        for chunk in chunks(film_ids[kinopoisk_id] for kinopoisk_id in payloads):
+            existing.update(
+                self.objects(Fact).filter(film_id__in=chunk).values_list(
+                    "film_id", "text", "type", "spoiler"
+                )
+            )
+
+        facts = []
+        for kinopoisk_id, payload in payloads.items():
+            for item in payload.get("facts") or []:
+                text = item.get("value")
+                if not text:
+                    continue
+                key = (
+                    film_ids[kinopoisk_id],
+                    text,
+                    item.get("type"),
+                    bool(item.get("spoiler", False)),
+                )
+                if key in existing:
+                    continue
+                existing.add(key)
+                facts.append(Fact(
+                    film_id=key[0], text=key[1], type=key[2], spoiler=key[3]
+                ))
+
+        self.objects(Fact).bulk_create(facts, batch_size=BATCH_SIZE)
+
+    def save_fees(self, payloads, film_ids) -> None:
+        fees = []
+        for kinopoisk_id, payload in payloads.items():
+            fees_payload = payload.get("fees") or {}
+            if not isinstance(fees_payload, dict):
+                continue
+            for key, place in FEES_PLACES.items():
+                block = fees_payload.get(key) or {}
+                if block.get("value") is None:
+                    continue
+                fees.append(Fees(
+                    film_id=film_ids[kinopoisk_id],
+                    place=place,
+                    value=block.get("value"),
+                    currency=block.get("currency"),
+                ))
+
+        self.objects(Fees).bulk_create(
+            fees,
+            batch_size=BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=["film", "place"],
+            update_fields=["value", "currency"],
+        )
+
+    # Похожие фильмы и сиквелы
+
+    def save_links(self, payloads, film_ids: Dict[int, int]) -> None:
+        """
+        Связи страницы и отложенные связи, ждавшие фильмы страницы.
+
+        Вызывается в транзакции страницы: связи, для которых связанного
+        фильма ещё нет, сохраняются в PendingFilmLink вместе с ней.
+        """
+        links: Dict[Tuple[int, int, str], Optional[Dict[str, Any]]] = {}
+        for kind, (key, _, _) in RELATED_KINDS.items():
+            for kinopoisk_id, payload in payloads.items():
+                for item in payload.get(key) or []:
+                    related_id = item.get("id")
+                    if related_id:
+                        links[(kinopoisk_id, related_id, kind)] = (
+                            item if self.allow_related_placeholders else None
+                        )
+
+        # Фильмы страницы могли ждать связи с прошлых страниц
+        waiting = {}
+        for chunk in chunks(payloads):
+            for pk, *link in self.objects(PendingFilmLink).filter(
+                related_kinopoisk_id__in=chunk
+            ).values_list(
+                "pk", "film_kinopoisk_id", "related_kinopoisk_id", "kind"
+            ):
+                waiting[tuple(link)] = pk
+
+        film_ids = dict(film_ids)
+        film_ids.update(self.resolve_film_ids(
+            kinopoisk_id
+            for link in (*links, *waiting)
+            for kinopoisk_id in link[:2]
+            if kinopoisk_id not in film_ids
+        ))
+
+        resolved, unresolved = self.split_links(links, film_ids)
+        self.write_links(resolved, film_ids)
+        self.objects(PendingFilmLink).bulk_create(
+            [
+                PendingFilmLink(
+                    film_kinopoisk_id=film_kp_id,
+                    related_kinopoisk_id=related_kp_id,
+                    kind=kind,
+                    related_item=links[(film_kp_id, related_kp_id, kind)],
+                )
+                for film_kp_id, related_kp_id, kind in unresolved
+            ],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+        resolved, _ = self.split_links(waiting, film_ids)
+        self.write_links(resolved, film_ids)
+        self.delete_pending(waiting[link] for link in resolved)
+
+    def resolve_links(self) -> List[Tuple[int, int, str]]:
+        """
+        Разрешает отложенные связи из PendingFilmLink.
+
+        Если разрешено, для недостающих фильмов создаются заглушки.
+        Разрешённые связи удаляются из таблицы, остальные остаются
+        до следующего импорта. Возвращает неразрешённые связи
+        (film_kp_id, related_kp_id, kind).
+        """
+        unresolved = []
+        last_pk = 0
+        while True:
+            rows = list(
+                self.objects(PendingFilmLink).filter(
+                    pk__gt=last_pk
+                ).order_by("pk").values_list(
+                    "pk", "film_kinopoisk_id", "related_kinopoisk_id", "kind",
+                    "related_item",
+                )[:LOOKUP_CHUNK_SIZE]
+            )
+            if not rows:
+                return sorted(unresolved)
+            last_pk = rows[-1][0]
+
+            with transaction.atomic(using=self.using):
+                unresolved.extend(self.resolve_pending_rows(rows))
+
+    def resolve_pending_rows(self, rows) -> List[Tuple[int, int, str]]:
+        """Одна пачка resolve_links(). Возвращает неразрешённые связи."""
+        links = {
+            (film_kp_id, related_kp_id, kind): pk
+            for pk, film_kp_id, related_kp_id, kind, _ in rows
+        }
+        items = {
+            related_kp_id: item
+            for _, _, related_kp_id, _, item in rows
+            if item is not None
+        }
+
+        film_ids = self.resolve_film_ids(
+            kinopoisk_id for link in links for kinopoisk_id in link[:2]
+        )
+
+        missing = {
+            related_kp_id for _, related_kp_id, _ in links
+            if related_kp_id not in film_ids and related_kp_id in items
+        }
+        if missing and self.allow_related_placeholders:
+            self.objects(Film).bulk_create(
+                [
+                    Film(
+                        kinopoisk_api_id=kinopoisk_id,
+                        **placeholder_fields(items[kinopoisk_id]),
+                    )
+                    for kinopoisk_id in sorted(missing)
+                ],
+                batch_size=BATCH_SIZE,
+                ignore_conflicts=True,
+            )
+            created = self.resolve_film_ids(missing)
+            film_ids.update(created)
+            refresh_film_trigrams(list(created.values()), using=self.using)
+            self.placeholders_created += len(created)
+
+        resolved, unresolved = self.split_links(links, film_ids)
+        self.write_links(resolved, film_ids)
+        self.delete_pending(links[link] for link in resolved)
+        return unresolved
+
+    def split_links(self, links, film_ids: Dict[int, int]):
+        """Связи, у которых есть оба фильма, и остальные."""
+        resolved, unresolved = [], []
+        for link in links:
+            film_kp_id, related_kp_id, _ = link
+            if film_kp_id in film_ids and related_kp_id in film_ids:
+                resolved.append(link)
+            else:
+                unresolved.append(link)
+        return resolved, unresolved
+
+    def write_links(self, links, film_ids: Dict[int, int]) -> None:
+        """Создаёт строки SimilarFilms / SequelsAndPrequels для связей."""
+        rows = {kind: set() for kind in RELATED_KINDS}
+        for film_kp_id, related_kp_id, kind in links:
+            rows[kind].add((film_ids[film_kp_id], film_ids[related_kp_id]))
+
+        for kind, (_, link_model, link_field) in RELATED_KINDS.items():
+            self.objects(link_model).bulk_create(
+                [
+                    link_model(
+                        film_id=film_id, **{f"{link_field}_id": related_id}
+                    )
+                    for film_id, related_id in sorted(rows[kind])
+                ],
+                batch_size=BATCH_SIZE,
+                ignore_conflicts=True,
+            )
+            self.links_resolved += len(rows[kind])
+
+    def delete_pending(self, pks: Iterable[int]) -> None:
+        """Удаляет разрешённые строки PendingFilmLink."""
+        for chunk in chunks(pks):
+            self.objects(PendingFilmLink).filter(pk__in=chunk).delete()
@@ -0,0 +1,81 @@
+"""
+Замеры импорта по стадиям: время и число SQL-запросов.
+
+Запросы считаются через connection.execute_wrapper, поэтому работают
+и без DEBUG. Стадии не должны вкладываться друг в друга - иначе время
+внутренней посчитается дважды.
+"""
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterable, List
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class StageTimer:
+    """Накопитель времени и запросов по стадиям."""
+
+    def __init__(self, using: str = DEFAULT_DB_ALIAS):
+        self.using = using
+        self.seconds: Counter = Counter()
+        self.queries: Counter = Counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        def count_query(execute, sql, params, many, context):
+            self.queries[name] += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        try:
+            with connections[self.using].execute_wrapper(count_query):
+                yield
+        finally:
+            self.seconds[name] += time.perf_counter() - started
+
+    def add(self, name: str, seconds: float) -> None:
+        self.seconds[name] += seconds
+
+    def merge(self, other: "StageTimer") -> None:
+        self.seconds.update(other.seconds)
+        self.queries.update(other.queries)
+
+
+def rounded(values: Dict[str, float], digits: int = 4) -> Dict[str, float]:
+    """Для JSONField: секунды с разумной точностью."""
+    return {name: round(value, digits) for name, value in values.items()}
+
+
+def format_stage_table(
+    seconds: Dict[str, float],
+    queries: Dict[str, int],
+    pages: int,
+    total_seconds: float,
+) -> List[str]:
+    """Строки сводной таблицы по стадиям, самые долгие сверху."""
+    pages = max(pages, 1)
+    total_seconds = total_seconds or 1
+
+    lines = [
+        "{0:<14} {1:>9} {2:>6} {3:>11} {4:>9} {5:>8}".format(
+            "Стадия", "Время, с", "Доля", "мс/стр", "Запросов", "Зап/стр"
+        )
+    ]
+    names: Iterable[str] = sorted(
+        set(seconds) | set(queries), key=lambda name: -seconds.get(name, 0)
+    )
+    for name in names:
+        stage_seconds = seconds.get(name, 0)
+        stage_queries = queries.get(name, 0)
+        lines.append(
+            "{0:<14} {1:>9.2f} {2:>5.0f}% {3:>11.1f} {4:>9} {5:>8.1f}".format(
+                name,
+                stage_seconds,
+                100 * stage_seconds / total_seconds,
+                1000 * stage_seconds / pages,
+                stage_queries,
+                stage_queries / pages,
+            )
+        )
+    return lines
@@ -0,0 +1,182 @@
+"""
+Загрузка страниц Kinopoisk API в фоновом потоке.
+
+Курсор следующей страницы приходит в ответе на текущую, поэтому сами
+запросы идут строго друг за другом. Но пока команда пишет страницу в БД,
+фоновый поток уже качает следующие и складывает их в ограниченную
+очередь: сеть и запись в БД перекрываются, а память не растёт, если БД
+не успевает.
+"""
+import itertools
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple, Union
+
+from django.db import connection
+
+from gallery.kinopoisk.stream import StreamedPage
+
+
+@dataclass
+class FetchedPage:
+    number: int
+    cursor: Optional[str]
+    # Ответ API; при потоковой загрузке фильмы читаются из него по одному
+    data: Union[Dict[str, Any], StreamedPage]
+    fetch_seconds: float
+    # Из чего сложилось fetch_seconds (если известно): http, decode...
+    stages: Dict[str, float] = field(default_factory=dict)
+
+
+_DONE = object()
+
+
+class PagePrefetcher:
+    """Итератор по страницам с упреждающей загрузкой.
+
+    Args:
+        fetch_page: загружает страницу по курсору (None - первая)
+        start_cursor: курсор первой страницы
+        max_pages: сколько страниц загрузить максимум (None - все)
+        depth: сколько загруженных страниц может ждать обработки;
+            0 - без фонового потока, страница грузится по запросу
+        before_fetch: вызывается перед каждой страницей; False - дальше
+            не грузить
+        stop_on: исключения fetch_page, после которых загрузка просто
+            останавливается (например, кончился общий лимит запросов)
+        stage_counters: возвращает накопленные секунды по стадиям
+            загрузки (KinopoiskClient.stage_seconds); разница до и после
+            запроса попадает в FetchedPage.stages
+    """
+
+    def __init__(
+        self,
+        fetch_page: Callable[[Optional[str]], Union[Dict[str, Any], StreamedPage]],
+        start_cursor: Optional[str] = None,
+        max_pages: Optional[int] = None,
+        depth: int = 2,
+        before_fetch: Optional[Callable[[], bool]] = None,
+        stage_counters: Optional[Callable[[], Dict[str, float]]] = None,
+        stop_on: Tuple[type, ...] = (),
+    ):
+        self.fetch_page = fetch_page
+        self.start_cursor = start_cursor
+        self.max_pages = max_pages
+        self.depth = depth
+        self.before_fetch = before_fetch
+        self.stage_counters = stage_counters
+        self.stop_on = stop_on
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max(depth, 1))
+        self._stop = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+
+        # Сколько секунд потребитель простоял в ожидании сети
+        self.wait_seconds = 0.0
+        # Загрузку остановил before_fetch или исключение из stop_on
+        self.stopped_early = False
+
+    def _pages(self) -> Iterator[FetchedPage]:
+        numbers = (
+            range(1, self.max_pages + 1)
+            if self.max_pages is not None
+            else itertools.count(1)
+        )
+        cursor = self.start_cursor
+
+        for number in numbers:
+            if self._stop.is_set():
+                return
+
+            if self.before_fetch is not None and not self.before_fetch():
+                self.stopped_early = True
+                return
+
+            counters = dict(self.stage_counters()) if self.stage_counters else {}
+            started = time.monotonic()
+            try:
+                data = self.fetch_page(cursor)
+            except self.stop_on:
+                self.stopped_early = True
+                return
+            fetch_seconds = time.monotonic() - started
+
+            if self.stage_counters:
+                stages = {
+                    name: value - counters.get(name, 0)
+                    for name, value in self.stage_counters().items()
+                    if value - counters.get(name, 0) > 0
+                }
+            else:
+                stages = {"fetch": fetch_seconds}
+
+            yield FetchedPage(
+                number=number,
+                cursor=cursor,
+                data=data,
+                fetch_seconds=fetch_seconds,
+                stages=stages,
+            )
+
+            cursor = data.get("next")
+            if not data.get("hasNext", False) or not cursor:
+                return
+
+    def __iter__(self) -> Iterator[FetchedPage]:
+        if self.depth <= 0:
+            for page in self._pages():
+                self.wait_seconds += page.fetch_seconds
+                yield page
+            return
+
+        self._worker = threading.Thread(
+            target=self._run, name="kinopoisk-prefetch", daemon=True
+        )
+        self._worker.start()
+
+        try:
+            while True:
+                started = time.monotonic()
+                item = self._queue.get()
+                self.wait_seconds += time.monotonic() - started
+
+                if item is _DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            self.close()
+
+    def _run(self) -> None:
+        try:
+            for page in self._pages():
+                if not self._put(page):
+                    return
+        except Exception as exc:
+            self._put(exc)
+            return
+        finally:
+            # before_fetch или списание лимита в fetch_page могли открыть
+            # подключение к БД в этом потоке
+            connection.close()
+        self._put(_DONE)
+
+    def _put(self, item) -> bool:
+        """Кладёт в очередь, пока потребитель не отказался от страниц."""
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def close(self) -> None:
+        """Останавливает фоновую загрузку (повторный вызов безопасен)."""
+        self._stop.set()
+        if self._worker is not None:
+            self._worker.join(timeout=5)
+            self._worker = None
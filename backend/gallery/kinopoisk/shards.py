@@ -0,0 +1,72 @@
+"""
+Параллельный импорт, разбитый по диапазонам лет.
+
+Каждый диапазон - обычный запуск import_kp_movies с --year-min/--year-max
+в отдельном процессе: у него свой ImportState (имя источника включает
+годы), свой курсор и своя блокировка is_running. Запросы к API
+списываются из общего ImportQuota, который заводит координатор.
+"""
+import io
+import time
+from typing import Any, Dict, List, Tuple
+
+import django
+
+
+def year_shards(
+    year_min: int,
+    year_max: int,
+    years_per_shard: int,
+) -> List[Tuple[int, int]]:
+    """Диапазоны лет [(1990, 1994), (1995, 1999), ...], новые первыми."""
+    shards = []
+    for start in range(year_min, year_max + 1, years_per_shard):
+        shards.append((start, min(start + years_per_shard - 1, year_max)))
+    return shards[::-1]
+
+
+def init_worker() -> None:
+    """Инициализатор процесса пула (процессы запускаются через spawn)."""
+    django.setup()
+
+
+def run_shard(options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Импорт одного диапазона лет в текущем процессе.
+
+    options - аргументы import_kp_movies (имена как у dest).
+    Вывод команды собирается в строку, ошибка не пробрасывается,
+    а возвращается в результате, чтобы не останавливать остальные.
+    """
+    from django.core.management import call_command, load_command_class
+    from django.db import connections
+
+    command = load_command_class("gallery", "import_kp_movies")
+    output = io.StringIO()
+    started = time.monotonic()
+    error = None
+
+    try:
+        call_command(command, stdout=output, stderr=output, **options)
+    except Exception as exc:
+        error = "{0}: {1}".format(type(exc).__name__, exc)
+    finally:
+        connections.close_all()
+
+    result = {
+        "year_min": options["year_min"],
+        "year_max": options["year_max"],
+        "pages": 0,
+        "movies_seen": 0,
+        "movies_saved": 0,
+        "ingest_seconds": 0.0,
+        "requests": 0,
+        "retries": 0,
+        "completed": False,
+        "links_unresolved": [],
+    }
+    result.update(getattr(command, "stats", {}))
+    result["seconds"] = time.monotonic() - started
+    result["error"] = error
+    result["output"] = output.getvalue()
+    return result
@@ -0,0 +1,241 @@
+"""
+Потоковый разбор страниц Kinopoisk API.
+
+Ответ на --limit 250 весит несколько мегабайт, а после response.json()
+целиком лежит в памяти в виде питоновских объектов, пока сохраняется
+вся страница. В потоковом режиме тело ответа сбрасывается во временный
+файл (в памяти до SPOOL_MAX_SIZE, дальше на диске), а фильмы читаются
+из него по одному и сохраняются пачками.
+
+Если установлен ijson, разбор идёт через него; иначе - через
+json.JSONDecoder.raw_decode по кускам файла: каждый фильм разбирается
+отдельно, сама страница целиком не разбирается.
+"""
+import io
+import json
+import re
+import tempfile
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import ijson
+except ImportError:  # ijson необязателен
+    ijson = None
+
+
+# Сколько байт ответа держать в памяти, прежде чем писать на диск
+SPOOL_MAX_SIZE = 1024 * 1024
+
+CHUNK_SIZE = 64 * 1024
+
+# Сколько символов после числа должно быть прочитано, чтобы оно точно
+# не оборвалось на границе куска
+NUMBER_LOOKAHEAD = 32
+
+_WHITESPACE = re.compile(r"\s*")
+_decoder = json.JSONDecoder()
+
+
+class StreamError(Exception):
+    """Ответ API не удалось разобрать."""
+
+
+class StreamedPage:
+    """
+    Страница, фильмы которой читаются по одному.
+
+    get() отдаёт служебные поля ответа (next, hasNext, total...), как
+    dict у обычной страницы, поэтому PagePrefetcher с ней работает без
+    изменений. iter_docs() можно вызывать несколько раз: каждый раз
+    фильмы читаются заново из источника.
+
+    Args:
+        meta: служебные поля ответа (всё, кроме docs)
+        docs: возвращает новый итератор по фильмам
+        close: освобождает источник (временный файл)
+    """
+
+    def __init__(
+        self,
+        meta: Dict[str, Any],
+        docs: Callable[[], Iterator[Dict[str, Any]]],
+        close: Optional[Callable[[], None]] = None,
+    ):
+        self.meta = meta
+        self._docs = docs
+        self._close = close
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.meta.get(key, default)
+
+    def iter_docs(self) -> Iterator[Dict[str, Any]]:
+        return self._docs()
+
+    def close(self) -> None:
+        if self._close is not None:
+            self._close()
+            self._close = None
+
+
+def spool(chunks: Iterable[bytes]):
+    """Тело ответа во временный файл (в памяти до SPOOL_MAX_SIZE)."""
+    body = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    for chunk in chunks:
+        body.write(chunk)
+    return body
+
+
+def open_body(body) -> StreamedPage:
+    """Страница из файла с ответом API: служебные поля читаются сразу."""
+    def docs() -> Iterator[Dict[str, Any]]:
+        body.seek(0)
+        return iter_docs(body)
+
+    body.seek(0)
+    return StreamedPage(meta=read_meta(body), docs=docs, close=body.close)
+
+
+def iter_docs(body) -> Iterator[Dict[str, Any]]:
+    """Фильмы из массива docs бинарного файла с ответом API."""
+    if ijson is not None:
+        return _ijson_docs(body)
+    return (value for key, value in _iter_top_level(body) if key == "docs")
+
+
+def read_meta(body) -> Dict[str, Any]:
+    """Служебные поля ответа; фильмы пропускаются, не накапливаясь."""
+    meta = {}
+    if ijson is not None:
+        try:
+            for prefix, event, value in ijson.parse(body, use_float=True):
+                if prefix and "." not in prefix and event in (
+                    "string", "number", "boolean", "null",
+                ):
+                    meta[prefix] = value
+        except ijson.JSONError as exc:
+            raise StreamError("Ответ API не разобран: {0}".format(exc))
+        return meta
+
+    for key, value in _iter_top_level(body):
+        if key != "docs":
+            meta[key] = value
+    return meta
+
+
+def _ijson_docs(body) -> Iterator[Dict[str, Any]]:
+    try:
+        yield from ijson.items(body, "docs.item", use_float=True)
+    except ijson.JSONError as exc:
+        raise StreamError("Ответ API не разобран: {0}".format(exc))
+
+
+def iter_batches(
+    docs: Iterable[Dict[str, Any]],
+    size: int,
+) -> Iterator[List[Dict[str, Any]]]:
+    """Фильмы пачками по size."""
+    docs = iter(docs)
+    while True:
+        batch = list(islice(docs, size))
+        if not batch:
+            return
+        yield batch
+
+
+class _Reader:
+    """Чтение JSON-значений по одному из текстового потока."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        chunk = self.stream.read(CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Следующий непробельный символ (не сдвигая позицию)."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                raise StreamError("Ответ API оборван")
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise StreamError(
+                "Ожидался {0!r}, получено {1!r}".format(char, self.peek())
+            )
+        self.pos += 1
+
+    def skip(self, char: str) -> bool:
+        if self.peek() == char:
+            self.pos += 1
+            return True
+        return False
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as exc:
+                if self.fill():
+                    continue
+                raise StreamError("Ответ API не разобран: {0}".format(exc))
+
+            # Число на границе куска могло прочитаться не полностью
+            # ("1." из "1.25"), поэтому после него нужен запас символов
+            if (
+                isinstance(value, (int, float))
+                and len(self.buffer) - end < NUMBER_LOOKAHEAD
+                and not self.eof
+                and self.fill()
+            ):
+                continue
+
+            self.pos = end
+            return value
+
+
+def _iter_top_level(body) -> Iterator[Tuple[str, Any]]:
+    """
+    Пары (ключ, значение) объекта верхнего уровня.
+
+    Для docs пара отдаётся на каждый элемент массива.
+    """
+    reader = _Reader(io.TextIOWrapper(body, encoding="utf-8"))
+    try:
+        reader.expect("{")
+        if reader.skip("}"):
+            return
+
+        while True:
+            key = reader.value()
+            reader.expect(":")
+
+            if key == "docs" and reader.skip("["):
+                if not reader.skip("]"):
+                    while True:
+                        yield key, reader.value()
+                        if not reader.skip(","):
+                            reader.expect("]")
+                            break
+            else:
+                yield key, reader.value()
+
+            if not reader.skip(","):
+                reader.expect("}")
+                return
+    finally:
+        # TextIOWrapper закрыл бы body вместе с собой
+        reader.stream.detach()
@@ -1,79 +1,31 @@
+import cProfile
+import io
+import os
+import pstats
+import socket
 import time
-from dataclasses import dataclass
+import uuid
+from collections import Counter
 from datetime import timedelta
-from typing import Any, Dict, List, Optional, Tuple
+from functools import partial
+from typing import Any, Dict, Iterator, List, Optional, Union
 
-import requests
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
-from django.db import transaction
+from django.db import connection
 from django.utils import timezone
 
-from gallery.models import (
-    Country,
-    Fact,
-    Fees,
-    Film,
-    FilmCountry,
-    FilmGenre,
-    FilmPerson,
-    FilmPersonProfession,
-    Genre,
-    ImportState,
-    Person,
-    Profession,
-    SequelsAndPrequels,
-    SimilarFilms,
-    Type,
-    Video,
-)
-
-
-API_BASE = "https://api.kinopoisk.dev"
-TOKEN_INFO_URL = f"{API_BASE}/v1.5/token"
-MOVIES_URL = f"{API_BASE}/v1.5/movie"
+from gallery.kinopoisk.client import (KinopoiskClient,
+                                      KinopoiskQuotaExhausted, TokenBucket)
+from gallery.kinopoisk.dumps import COMPRESSIONS, DumpError, PageDump
+from gallery.kinopoisk.ingest import PageIngestor
+from gallery.kinopoisk.metrics import StageTimer, format_stage_table, rounded
+from gallery.kinopoisk.prefetch import FetchedPage, PagePrefetcher
+from gallery.kinopoisk.stream import StreamedPage, iter_batches
+from gallery.models import ImportPageStat, ImportQuota, ImportRun, ImportState
 
-SOURCE_PREFIX = "kinopoisk_movies_quality"
-MAX_VOTES_FILTER_VALUE = 99999999
-
-
-@dataclass
-class TokenInfo:
-    requests_used: Optional[int] = None
-    requests_remaining: Optional[int] = None
-    daily_limit: Optional[int] = None
-    resets_at: Optional[str] = None
-
-
-class KinopoiskAPIError(Exception):
-    """Ошибка при работе с Kinopoisk API."""
-
-
-def format_number(value: float) -> str:
-    """Форматирует число для query-параметров Kinopoisk API."""
-    if float(value).is_integer():
-        return str(int(value))
-    return str(value)
-
-
-def make_range_filter(
-    min_value: Optional[float],
-    max_value: Optional[float],
-) -> Optional[str]:
-    """
-    Делает строку диапазона для API:
-    7-10, 500000-99999999, 1990-2026.
-    """
-    if min_value is None and max_value is None:
-        return None
-
-    if min_value is None:
-        return f"0-{format_number(max_value)}"
-
-    if max_value is None:
-        return f"{format_number(min_value)}-{MAX_VOTES_FILTER_VALUE}"
 
-    return f"{format_number(min_value)}-{format_number(max_value)}"
+SOURCE_PREFIX = "kinopoisk_movies_quality"
 
 
 def make_import_source_name(
@@ -117,145 +69,6 @@ def to_int(value: Any) -> Optional[int]:
         return None
 
 
-class KinopoiskClient:
-    def __init__(self, api_key: str, timeout: int = 30):
-        self.session = requests.Session()
-        self.session.headers.update({"X-API-KEY": api_key})
-        self.timeout = timeout
-
-    def _get(
-        self,
-        url: str,
-        params: Optional[List[Tuple[str, str]]] = None,
-    ) -> Dict[str, Any]:
-        response = self.session.get(url, params=params, timeout=self.timeout)
-
-        if response.status_code == 401:
-            raise KinopoiskAPIError("Неверный API ключ или он не передан.")
-
-        if response.status_code == 403:
-            raise KinopoiskAPIError("Превышен суточный лимит запросов.")
-
-        if response.status_code == 400:
-            raise KinopoiskAPIError(
-                "Невалидный запрос: {0}".format(response.text)
-            )
-
-        try:
-            response.raise_for_status()
-        except requests.HTTPError as exc:
-            raise KinopoiskAPIError(
-                "Ошибка API: {0}; body={1}".format(exc, response.text)
-            )
-
-        return response.json()
-
-    def get_token_info(self) -> TokenInfo:
-        data = self._get(TOKEN_INFO_URL)
-
-        return TokenInfo(
-            requests_used=data.get("used"),
-            requests_remaining=data.get("requestsRemaining"),
-            daily_limit=data.get("limit"),
-            resets_at=data.get("resetsAt"),
-        )
-
-    def get_movies_page(
-        self,
-        limit: int = 250,
-        next_cursor: Optional[str] = None,
-        updated_since: Optional[str] = None,
-        min_rating: float = 7.0,
-        min_votes: int = 500000,
-        year_min: Optional[int] = None,
-        year_max: Optional[int] = None,
-        require_backdrop: bool = True,
-    ) -> Dict[str, Any]:
-        rating_filter = make_range_filter(min_rating, 10)
-        votes_filter = make_range_filter(min_votes, MAX_VOTES_FILTER_VALUE)
-        year_filter = make_range_filter(year_min, year_max)
-
-        params = [
-            ("limit", str(limit)),
-
-            # Основные поля
-            ("selectFields", "id"),
-            ("selectFields", "name"),
-            ("selectFields", "enName"),
-            ("selectFields", "alternativeName"),
-            ("selectFields", "description"),
-            ("selectFields", "shortDescription"),
-            ("selectFields", "slogan"),
-            ("selectFields", "type"),
-            ("selectFields", "isSeries"),
-            ("selectFields", "year"),
-
-            # Рейтинги и голоса
-            ("selectFields", "rating"),
-            ("selectFields", "votes"),
-            ("selectFields", "ratingMpaa"),
-            ("selectFields", "ageRating"),
-
-            # Детали
-            ("selectFields", "budget"),
-            ("selectFields", "movieLength"),
-
-            # Связи и медиа
-            ("selectFields", "genres"),
-            ("selectFields", "countries"),
-            ("selectFields", "poster"),
-            ("selectFields", "backdrop"),
-            ("selectFields", "logo"),
-            ("selectFields", "videos"),
-            ("selectFields", "persons"),
-            ("selectFields", "facts"),
-            ("selectFields", "fees"),
-            ("selectFields", "similarMovies"),
-            ("selectFields", "sequelsAndPrequels"),
-
-            # Служебные
-            ("selectFields", "updatedAt"),
-            ("selectFields", "createdAt"),
-
-            # Жёсткие фильтры качества
-            ("type", "movie"),
-            ("isSeries", "false"),
-            ("rating.kp", rating_filter),
-            ("votes.kp", votes_filter),
-
-            # Нужные поля не должны быть пустыми
-            ("notNullFields", "id"),
-            ("notNullFields", "name"),
-            ("notNullFields", "year"),
-            ("notNullFields", "rating.kp"),
-            ("notNullFields", "votes.kp"),
-            ("notNullFields", "poster.url"),
-            ("notNullFields", "genres.name"),
-
-            # Сортировка: сначала новее, потом популярнее, потом выше рейтинг
-            ("sortField", "year"),
-            ("sortType", "-1"),
-            ("sortField", "votes.kp"),
-            ("sortType", "-1"),
-            ("sortField", "rating.kp"),
-            ("sortType", "-1"),
-        ]
-
-        if require_backdrop:
-            params.append(("notNullFields", "backdrop.url"))
-
-        if year_filter:
-            params.append(("year", year_filter))
-
-        if updated_since:
-            params.append(("updatedAt", updated_since))
-
-        if next_cursor:
-            params.append(("next", next_cursor))
-
-        return self._get(MOVIES_URL, params=params)
-
-
 class Command(BaseCommand):
     help = (
         "Импорт качественных популярных фильмов из Kinopoisk API v1.5: "
@@ -266,7 +79,51 @@ class Command(BaseCommand):
         parser.add_argument("--limit", type=int, default=250)
         parser.add_argument("--reserve", type=int, default=15)
         parser.add_argument("--max-pages", type=int, default=None)
-        parser.add_argument("--sleep", type=float, default=0.2)
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=5.0,
+            help="Запросов к API в секунду (в среднем). 0 - без ограничения",
+        )
+        parser.add_argument(
+            "--burst",
+            type=int,
+            default=1,
+            help="Сколько запросов можно сделать подряд без паузы",
+        )
+        parser.add_argument(
+            "--prefetch",
+            type=int,
+            default=2,
+            help=(
+                "Сколько страниц качать заранее, пока пишется текущая. "
+                "0 - без фоновой загрузки"
+            ),
+        )
+        parser.add_argument(
+            "--retries",
+            type=int,
+            default=5,
+            help="Сколько раз повторять запрос после 429/5xx и сетевых ошибок",
+        )
+        parser.add_argument(
+            "--quota",
+            type=str,
+            default=None,
+            help=(
+                "Брать запросы из общего лимита ImportQuota с этим именем "
+                "вместо проверки токена (для параллельного импорта)"
+            ),
+        )
+        parser.add_argument(
+            "--api-base",
+            type=str,
+            default=None,
+            help=(
+                "Адрес API, например http://127.0.0.1:8001. "
+                "По умолчанию settings.KINOPOISK_API_BASE"
+            ),
+        )
 
         parser.add_argument("--min-rating", type=float, default=7.0)
         parser.add_argument("--min-votes", type=int, default=500000)
@@ -287,6 +144,25 @@ class Command(BaseCommand):
             ),
         )
 
+        parser.add_argument(
+            "--ignore-hashes",
+            action="store_true",
+            help=(
+                "Перезаписать фильмы, даже если сохранённые данные "
+                "не изменились (по хэшам разделов)"
+            ),
+        )
+
+        parser.add_argument(
+            "--cache-size",
+            type=int,
+            default=50000,
+            help=(
+                "Сколько персон и участников фильмов помнить между "
+                "страницами, чтобы не искать и не перезаписывать их заново"
+            ),
+        )
+
         parser.add_argument(
             "--updated-since",
             type=str,
@@ -303,28 +179,121 @@ class Command(BaseCommand):
             "--dry-run",
             action="store_true",
         )
+        parser.add_argument(
+            "--dump-dir",
+            type=str,
+            default=None,
+            help=(
+                "Сохранять сырые страницы API в этот каталог "
+                "(подкаталог на каждый набор фильтров)"
+            ),
+        )
+        parser.add_argument(
+            "--dump-compression",
+            choices=sorted(COMPRESSIONS),
+            default="gzip",
+            help="Сжатие файлов дампа. zstd требует пакет zstandard",
+        )
+        parser.add_argument(
+            "--from-dump",
+            type=str,
+            default=None,
+            help=(
+                "Импортировать из каталога, записанного через --dump-dir, "
+                "без запросов к API. ImportState при этом не меняется"
+            ),
+        )
         parser.add_argument(
             "--reset-state",
             action="store_true",
             help="Сбросить сохранённый cursor перед запуском",
         )
+        parser.add_argument(
+            "--lock-timeout",
+            type=int,
+            default=30,
+            help=(
+                "Через сколько минут без heartbeat считать запущенный импорт "
+                "упавшим и перехватывать его блокировку"
+            ),
+        )
         parser.add_argument(
             "--full-sync",
             action="store_true",
             help="Запустить полный проход: без updatedAt и с пустым cursor",
         )
+        parser.add_argument(
+            "--stream",
+            action="store_true",
+            help=(
+                "Разбирать страницы потоково и сохранять фильмы пачками "
+                "по --batch-size, не держа в памяти всю страницу"
+            ),
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50,
+            help="Размер пачки фильмов в режиме --stream",
+        )
+        parser.add_argument(
+            "--profile",
+            action="store_true",
+            help=(
+                "В конце вывести таблицу времени и SQL-запросов по стадиям "
+                "(замеры пишутся в ImportRun/ImportPageStat всегда)"
+            ),
+        )
+        parser.add_argument(
+            "--cprofile",
+            type=str,
+            default=None,
+            help=(
+                "Запустить под cProfile и сохранить статистику в этот файл "
+                "(только основной поток, без фоновой загрузки)"
+            ),
+        )
 
     def handle(self, *args, **options):
+        cprofile_path = options["cprofile"]
+        if not cprofile_path:
+            self.run_import(**options)
+            return
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.runcall(self.run_import, **options)
+        finally:
+            profiler.dump_stats(cprofile_path)
+            self.stdout.write("Статистика cProfile сохранена в {0}".format(cprofile_path))
+            if options["profile"]:
+                self.write_cprofile_top(profiler)
+
+    def run_import(self, **options):
+        from_dump = options["from_dump"]
+        dump_dir = options["dump_dir"]
+        quota_name = options["quota"]
+
         api_key = getattr(settings, "KINOPOISK_API_KEY", None)
-        if not api_key:
+        if not api_key and not from_dump:
             raise CommandError("В settings.py не найден KINOPOISK_API_KEY")
 
+        if from_dump and dump_dir:
+            raise CommandError("--from-dump и --dump-dir нельзя использовать вместе")
+
         limit = options["limit"]
         reserve = options["reserve"]
         max_pages = options["max_pages"]
-        sleep_seconds = options["sleep"]
+        prefetch = options["prefetch"]
         dry_run = options["dry_run"]
 
+        self.verbosity = options["verbosity"]
+        self.lock_timeout = timedelta(minutes=options["lock_timeout"])
+        self.lock_owner = "{0}:{1}:{2}".format(
+            socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8]
+        )[-100:]
+        self.stream = options["stream"]
+        self.batch_size = options["batch_size"]
         self.min_rating = options["min_rating"]
         self.min_votes = options["min_votes"]
         self.year_min = options["year_min"]
@@ -340,6 +309,21 @@ class Command(BaseCommand):
         if limit < 1 or limit > 250:
             raise CommandError("--limit должен быть от 1 до 250")
 
+        if options["rate"] < 0:
+            raise CommandError("--rate не может быть отрицательным")
+
+        if prefetch < 0 or options["retries"] < 0:
+            raise CommandError("--prefetch и --retries не могут быть отрицательными")
+
+        if self.batch_size < 1:
+            raise CommandError("--batch-size должен быть больше 0")
+
+        if options["lock_timeout"] <= 0:
+            raise CommandError("--lock-timeout должен быть больше 0")
+
+        if options["cache_size"] < 0:
+            raise CommandError("--cache-size не может быть отрицательным")
+
         if self.min_rating < 0 or self.min_rating > 10:
             raise CommandError("--min-rating должен быть от 0 до 10")
 
@@ -361,14 +345,36 @@ class Command(BaseCommand):
             require_backdrop=self.require_backdrop,
         )
 
+        dump = None
+        try:
+            if from_dump:
+                dump = PageDump(os.path.join(from_dump, source_name))
+            elif dump_dir:
+                dump = PageDump(
+                    os.path.join(dump_dir, source_name),
+                    compression=options["dump_compression"],
+                )
+        except DumpError as exc:
+            raise CommandError(str(exc))
+
+        if from_dump and not dump.directory.is_dir():
+            raise CommandError(
+                "Каталог дампа {0} не найден".format(dump.directory)
+            )
+
         state = None
-        if not dry_run:
+        if not dry_run and not from_dump:
             state, _ = ImportState.objects.get_or_create(source=source_name)
 
-            if state.is_running:
+            if state.is_running and not state.lock_is_stale(self.lock_timeout):
                 raise CommandError(
-                    "Импорт уже помечен как запущенный. "
-                    "Если это зависшее состояние, снимите is_running вручную."
+                    "Импорт уже запущен ({0}, последний heartbeat {1}). "
+                    "Если процесс упал, блокировку перехватит запуск после "
+                    "{2} мин без heartbeat (--lock-timeout).".format(
+                        state.lock_owner or "владелец неизвестен",
+                        state.heartbeat_at or state.updated_at,
+                        options["lock_timeout"],
+                    )
                 )
 
             if reset_state:
@@ -387,33 +393,61 @@ class Command(BaseCommand):
                 ])
                 self.stdout.write(self.style.WARNING("Состояние импорта сброшено"))
 
-        client = KinopoiskClient(api_key=api_key)
-
-        token_info = client.get_token_info()
-        remaining = token_info.requests_remaining or 0
+        client = None
+        budget = None
+        if not from_dump:
+            client = KinopoiskClient(
+                api_key=api_key,
+                api_base=options["api_base"],
+                rate_limiter=TokenBucket(
+                    rate=options["rate"], capacity=options["burst"]
+                ),
+                max_retries=options["retries"],
+                # Лимит списывается за каждую попытку, включая повторы
+                before_request=(
+                    partial(ImportQuota.claim, quota_name)
+                    if quota_name
+                    else None
+                ),
+            )
 
-        self.stdout.write(
-            self.style.SUCCESS(
-                "Лимит: осталось {0}, использовано {1}, дневной лимит {2}, сброс {3}".format(
-                    remaining,
-                    token_info.requests_used,
-                    token_info.daily_limit,
-                    token_info.resets_at,
+            if quota_name:
+                quota = ImportQuota.objects.filter(name=quota_name).first()
+                if quota is None:
+                    raise CommandError(
+                        "Общий лимит {0} не найден".format(quota_name)
+                    )
+                self.stdout.write(
+                    "Общий лимит {0}: осталось {1}".format(
+                        quota_name, quota.remaining
+                    )
                 )
-            )
-        )
+            else:
+                token_info = client.get_token_info()
+                remaining = token_info.requests_remaining or 0
 
-        if remaining <= reserve:
-            self.stdout.write(
-                self.style.WARNING(
-                    "Остановлено: осталось {0} запросов, reserve={1}".format(
-                        remaining, reserve
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        "Лимит: осталось {0}, использовано {1}, дневной лимит {2}, сброс {3}".format(
+                            remaining,
+                            token_info.requests_used,
+                            token_info.daily_limit,
+                            token_info.resets_at,
+                        )
                     )
                 )
-            )
-            return
 
-        budget = remaining - reserve
+                if remaining <= reserve:
+                    self.stdout.write(
+                        self.style.WARNING(
+                            "Остановлено: осталось {0} запросов, reserve={1}".format(
+                                remaining, reserve
+                            )
+                        )
+                    )
+                    return
+
+                budget = remaining - reserve
 
         pages_processed = 0
         movies_seen = 0
@@ -461,61 +495,102 @@ class Command(BaseCommand):
         )
 
         if state:
-            state.is_running = True
-            state.last_error = None
-            state.save(update_fields=["is_running", "last_error", "updated_at"])
+            self.lock_state(state)
+
+        run = None
+        if not dry_run:
+            run = ImportRun.objects.create(
+                source=source_name,
+                options={
+                    name: value for name, value in options.items()
+                    if isinstance(value, (str, int, float, bool, type(None)))
+                },
+            )
 
         completed_full_pass = False
+        unresolved_links = []
+        ingestor = PageIngestor(
+            allow_related_placeholders=self.allow_related_placeholders,
+            ignore_hashes=options["ignore_hashes"],
+            cache_size=options["cache_size"],
+        )
+        started = time.monotonic()
+        ingest_seconds = 0.0
+        # Основной поток по стадиям за весь запуск и загрузка по стадиям
+        run_timer = StageTimer()
+        fetch_stages: Counter = Counter()
+        wait_seen = 0.0
+
+        if from_dump:
+            fetch_page = dump.open_page if self.stream else dump.read_page
+            self.stdout.write("Импорт из дампа {0}".format(dump.directory))
+        else:
+            fetch_page = partial(
+                self.fetch_page, client, limit, updated_since
+            )
+            if dump:
+                fetch_page = dump.recording(fetch_page)
+                self.stdout.write("Страницы сохраняются в {0}".format(dump.directory))
+
+        page_limits = [value for value in (budget, max_pages) if value is not None]
+        if quota_name and connection.vendor == "sqlite":
+            # Списание лимита из фонового потока - второе подключение,
+            # которое SQLite не пустит писать параллельно с сохранением страницы
+            prefetch = 0
+        prefetcher = PagePrefetcher(
+            fetch_page=fetch_page,
+            start_cursor=next_cursor,
+            max_pages=min(page_limits) if page_limits else None,
+            depth=prefetch,
+            stop_on=(KinopoiskQuotaExhausted,),
+            stage_counters=(
+                (lambda: dict(client.stage_seconds)) if client else None
+            ),
+        )
 
         try:
-            while budget > 0:
-                if max_pages is not None and pages_processed >= max_pages:
-                    self.stdout.write(self.style.WARNING("Достигнут --max-pages, остановка"))
-                    break
-
-                self.stdout.write(
-                    "Запрос страницы {0}, budget={1}, cursor={2}".format(
-                        pages_processed + 1,
-                        budget,
-                        "есть" if next_cursor else "нет",
-                    )
-                )
+            for page in prefetcher:
+                page_started = time.perf_counter()
+                timer = StageTimer()
+                timer.add("wait", prefetcher.wait_seconds - wait_seen)
+                wait_seen = prefetcher.wait_seconds
 
-                data = client.get_movies_page(
-                    limit=limit,
-                    next_cursor=next_cursor,
-                    updated_since=updated_since,
-                    min_rating=self.min_rating,
-                    min_votes=self.min_votes,
-                    year_min=self.year_min,
-                    year_max=self.year_max,
-                    require_backdrop=self.require_backdrop,
-                )
+                data = page.data
 
-                budget -= 1
                 pages_processed += 1
 
-                docs = data.get("docs", [])
                 has_next = data.get("hasNext", False)
                 next_cursor = data.get("next")
 
-                self.stdout.write("Получено фильмов: {0}".format(len(docs)))
+                self.stdout.write(
+                    "Страница {0}, cursor={1}, загрузка {2:.2f} с".format(
+                        pages_processed,
+                        "есть" if page.cursor else "нет",
+                        page.fetch_seconds,
+                    )
+                )
 
-                for payload in docs:
-                    movies_seen += 1
+                page_movies = 0
+                page_accepted = 0
+                for docs in self.page_batches(data, timer):
+                    with timer.stage("filter"):
+                        accepted = [
+                            payload for payload in docs
+                            if self.passes_quality_filters(payload)
+                        ]
+                    page_movies += len(docs)
+                    page_accepted += len(accepted)
 
                     if dry_run:
-                        if self.passes_quality_filters(payload):
-                            movies_saved += 1
-                        else:
-                            movies_skipped += 1
-                        continue
-
-                    saved = self.save_movie(payload)
-                    if saved:
-                        movies_saved += 1
+                        movies_saved += len(accepted)
                     else:
-                        movies_skipped += 1
+                        ingest_started = time.monotonic()
+                        movies_saved += ingestor.ingest(accepted, timer=timer)
+                        ingest_seconds += time.monotonic() - ingest_started
+
+                self.stdout.write("Получено фильмов: {0}".format(page_movies))
+                movies_seen += page_movies
+                movies_skipped += page_movies - page_accepted
 
                 if state:
                     state.next_cursor = next_cursor
@@ -523,14 +598,28 @@ class Command(BaseCommand):
                     state.movies_processed = movies_seen
                     state.movies_saved = movies_saved
                     state.last_successful_run_at = timezone.now()
-                    state.save(update_fields=[
-                        "next_cursor",
-                        "pages_processed",
-                        "movies_processed",
-                        "movies_saved",
-                        "last_successful_run_at",
-                        "updated_at",
-                    ])
+                    with timer.stage("state"):
+                        saved = state.heartbeat(
+                            "next_cursor",
+                            "pages_processed",
+                            "movies_processed",
+                            "movies_saved",
+                            "last_successful_run_at",
+                        )
+                    if not saved:
+                        raise CommandError(self.lock_lost_message(state))
+
+                run_timer.merge(timer)
+                fetch_stages.update(page.stages)
+                if run:
+                    self.record_page(
+                        run,
+                        page,
+                        timer,
+                        movies=page_movies,
+                        accepted=page_accepted,
+                        seconds=time.perf_counter() - page_started,
+                    )
 
                 self.stdout.write(
                     self.style.SUCCESS(
@@ -548,12 +637,24 @@ class Command(BaseCommand):
                 if not has_next or not next_cursor:
                     completed_full_pass = True
                     self.stdout.write(self.style.SUCCESS("Больше страниц нет"))
-                    break
 
-                time.sleep(sleep_seconds)
+            if (
+                not completed_full_pass
+                and max_pages is not None
+                and pages_processed >= max_pages
+            ):
+                self.stdout.write(self.style.WARNING("Достигнут --max-pages, остановка"))
+
+            if prefetcher.stopped_early:
+                self.stdout.write(
+                    self.style.WARNING("Общий лимит запросов исчерпан, остановка")
+                )
+
+            if not dry_run:
+                with run_timer.stage("links"):
+                    unresolved_links = self.resolve_links(ingestor)
 
             if state:
-                state.is_running = False
                 state.last_successful_run_at = timezone.now()
 
                 if completed_full_pass:
@@ -563,34 +664,59 @@ class Command(BaseCommand):
                 state.pages_processed = pages_processed
                 state.movies_processed = movies_seen
                 state.movies_saved = movies_saved
-                state.save(update_fields=[
-                    "is_running",
+                if not state.release_lock(
                     "last_successful_run_at",
                     "last_completed_sync_at",
                     "next_cursor",
                     "pages_processed",
                     "movies_processed",
                     "movies_saved",
-                    "updated_at",
-                ])
+                ):
+                    raise CommandError(self.lock_lost_message(state))
 
         except Exception as exc:
+            if not dry_run:
+                # Отложенные связи страниц до ошибки уже в PendingFilmLink;
+                # не получится сейчас - разрешит следующий запуск
+                try:
+                    self.resolve_links(ingestor)
+                except Exception as links_exc:
+                    self.stderr.write(
+                        "Не удалось сохранить связи: {0}".format(links_exc)
+                    )
+
+            if run:
+                self.finish_run(
+                    run,
+                    ImportRun.Status.ERROR,
+                    pages=pages_processed,
+                    movies_seen=movies_seen,
+                    movies_saved=movies_saved,
+                    ingestor=ingestor,
+                    client=client,
+                    seconds=time.monotonic() - started,
+                    timer=run_timer,
+                    fetch_stages=fetch_stages,
+                    error=str(exc),
+                )
+
             if state:
-                state.is_running = False
+                # Если блокировку уже перехватили, состояние не трогаем
                 state.last_error = str(exc)
                 state.pages_processed = pages_processed
                 state.movies_processed = movies_seen
                 state.movies_saved = movies_saved
-                state.save(update_fields=[
-                    "is_running",
+                state.release_lock(
                     "last_error",
                     "pages_processed",
                     "movies_processed",
                     "movies_saved",
-                    "updated_at",
-                ])
+                )
             raise
 
+        finally:
+            prefetcher.close()
+
         self.stdout.write(
             self.style.SUCCESS(
                 "Готово. Страниц: {0}, просмотрено фильмов: {1}, "
@@ -602,6 +728,272 @@ class Command(BaseCommand):
                 )
             )
         )
+        if not dry_run:
+            self.stdout.write(
+                "Без изменений (не перезаписаны): {0}; перезаписано разделов: {1}".format(
+                    ingestor.films_unchanged,
+                    ", ".join(
+                        "{0}={1}".format(name, count)
+                        for name, count in sorted(ingestor.sections_written.items())
+                    ) or "нет",
+                )
+            )
+            self.stdout.write(
+                "Записано персон: {0}, участников фильмов: {1}".format(
+                    ingestor.persons_written, ingestor.film_persons_written
+                )
+            )
+            if self.verbosity >= 2:
+                for label, cache in (
+                    ("персон", ingestor.persons_cache),
+                    ("профессий", ingestor.professions_cache),
+                    ("участников фильмов", ingestor.film_persons_cache),
+                ):
+                    self.stdout.write("Кэш {0}: {1}".format(label, cache.stats()))
+        total_seconds = time.monotonic() - started
+        if run:
+            self.finish_run(
+                run,
+                ImportRun.Status.SUCCESS,
+                pages=pages_processed,
+                movies_seen=movies_seen,
+                movies_saved=movies_saved,
+                ingestor=ingestor,
+                client=client,
+                seconds=total_seconds,
+                timer=run_timer,
+                fetch_stages=fetch_stages,
+            )
+
+        self.write_throughput(pages_processed, total_seconds, ingest_seconds)
+        if client:
+            self.stdout.write(
+                "Запросов к API: {0}, повторов: {1}, ожидание сети {2:.1f} с".format(
+                    client.requests_sent,
+                    client.retries,
+                    prefetcher.wait_seconds,
+                )
+            )
+
+        if options["profile"]:
+            self.write_profile(
+                run_timer, fetch_stages, pages_processed, total_seconds
+            )
+
+        # Итоги для вызывающего кода (import_kp_shards)
+        self.stats = {
+            "run_id": run.pk if run else None,
+            "pages": pages_processed,
+            "movies_seen": movies_seen,
+            "movies_saved": movies_saved,
+            "movies_skipped": movies_skipped,
+            "movies_unchanged": ingestor.films_unchanged,
+            "links_unresolved": unresolved_links,
+            "completed": completed_full_pass,
+            "seconds": total_seconds,
+            "ingest_seconds": ingest_seconds,
+            "requests": client.requests_sent if client else 0,
+            "retries": client.retries if client else 0,
+        }
+
+    def resolve_links(self, ingestor: PageIngestor) -> list:
+        """Разрешает отложенные связи с похожими фильмами и сиквелами."""
+        unresolved = ingestor.resolve_links()
+
+        self.stdout.write(
+            "Связи с похожими фильмами и сиквелами: сохранено {0}, "
+            "создано заглушек {1}, связанный фильм не найден {2}".format(
+                ingestor.links_resolved,
+                ingestor.placeholders_created,
+                len(unresolved),
+            )
+        )
+        if self.verbosity >= 2:
+            for film_kp_id, related_kp_id, kind in unresolved:
+                self.stdout.write(
+                    "  {0} -> {1} ({2})".format(film_kp_id, related_kp_id, kind)
+                )
+
+        return unresolved
+
+    def page_batches(
+        self,
+        data: Union[Dict[str, Any], StreamedPage],
+        timer: StageTimer,
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Фильмы страницы пачками для сохранения.
+
+        Обычная страница - одна пачка. Потоковая читается по --batch-size
+        фильмов, чтобы в памяти не было всей страницы сразу.
+        """
+        if not isinstance(data, StreamedPage):
+            yield data.get("docs", [])
+            return
+
+        batches = iter_batches(data.iter_docs(), self.batch_size)
+        try:
+            while True:
+                with timer.stage("parse"):
+                    docs = next(batches, None)
+                if docs is None:
+                    return
+                yield docs
+        finally:
+            data.close()
+
+    def record_page(
+        self,
+        run: ImportRun,
+        page: FetchedPage,
+        timer: StageTimer,
+        movies: int,
+        accepted: int,
+        seconds: float,
+    ) -> None:
+        """Замеры одной страницы в ImportPageStat."""
+        ImportPageStat.objects.create(
+            run=run,
+            number=page.number,
+            movies=movies,
+            accepted=accepted,
+            seconds=round(seconds, 4),
+            stage_seconds=rounded(timer.seconds),
+            stage_queries=dict(timer.queries),
+            fetch_seconds=rounded(page.stages),
+        )
+
+    def finish_run(
+        self,
+        run: ImportRun,
+        status: str,
+        pages: int,
+        movies_seen: int,
+        movies_saved: int,
+        ingestor: PageIngestor,
+        client: Optional[KinopoiskClient],
+        seconds: float,
+        timer: StageTimer,
+        fetch_stages: Dict[str, float],
+        error: Optional[str] = None,
+    ) -> None:
+        """Итоги запуска в ImportRun."""
+        run.status = status
+        run.finished_at = timezone.now()
+        run.pages = pages
+        run.movies_seen = movies_seen
+        run.movies_saved = movies_saved
+        run.movies_unchanged = ingestor.films_unchanged
+        run.requests = client.requests_sent if client else 0
+        run.retries = client.retries if client else 0
+        run.seconds = round(seconds, 4)
+        run.stage_seconds = rounded(timer.seconds)
+        run.stage_queries = dict(timer.queries)
+        run.fetch_seconds = rounded(fetch_stages)
+        run.error = error
+        run.save()
+
+    def write_profile(
+        self,
+        timer: StageTimer,
+        fetch_stages: Dict[str, float],
+        pages: int,
+        total_seconds: float,
+    ) -> None:
+        """Сводная таблица по стадиям для --profile."""
+        self.stdout.write("")
+        self.stdout.write("Основной поток (wait - ожидание загрузки страниц):")
+        for line in format_stage_table(
+            timer.seconds, timer.queries, pages, total_seconds
+        ):
+            self.stdout.write(line)
+
+        if fetch_stages:
+            self.stdout.write("")
+            self.stdout.write("Загрузка страниц (фоновый поток при --prefetch > 0):")
+            for line in format_stage_table(fetch_stages, {}, pages, total_seconds):
+                self.stdout.write(line)
+
+    def write_cprofile_top(self, profiler: cProfile.Profile, limit: int = 25) -> None:
+        """Самые дорогие функции по cumulative time."""
+        output = io.StringIO()
+        stats = pstats.Stats(profiler, stream=output)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+        self.stdout.write(output.getvalue())
+
+    def lock_state(self, state: ImportState) -> None:
+        """
+        Помечает импорт запущенным.
+
+        Проверка и установка is_running - один UPDATE, поэтому из двух
+        одновременно стартовавших процессов с одним источником
+        продолжит только один. Блокировку упавшего импорта (без heartbeat
+        дольше --lock-timeout) перехватываем: курсор сохраняется после
+        каждой страницы, так что продолжаем с него без потерь.
+        """
+        was_running = state.is_running
+        stale_owner = state.lock_owner
+        stale_heartbeat = state.heartbeat_at or state.updated_at
+
+        if not state.acquire_lock(self.lock_owner, self.lock_timeout):
+            raise CommandError(
+                "Импорт {0} уже запущен другим процессом".format(state.source)
+            )
+
+        if was_running:
+            self.stdout.write(
+                self.style.WARNING(
+                    "Перехвачена зависшая блокировка ({0}, последний "
+                    "heartbeat {1}), продолжаем с сохранённого курсора".format(
+                        stale_owner or "владелец неизвестен", stale_heartbeat
+                    )
+                )
+            )
+
+    def lock_lost_message(self, state: ImportState) -> str:
+        return (
+            "Блокировку импорта {0} перехватил другой процесс: heartbeat "
+            "не обновлялся дольше --lock-timeout. Остановка".format(state.source)
+        )
+
+    def write_throughput(self, pages: int, total_seconds: float,
+                         ingest_seconds: float) -> None:
+        """Скорость импорта в страницах в секунду: общая и только запись в БД."""
+        if not pages:
+            return
+
+        def per_second(seconds):
+            return pages / seconds if seconds > 0 else float("inf")
+
+        self.stdout.write(
+            "Скорость: {0:.2f} стр/с всего ({1:.1f} с), "
+            "запись в БД {2:.2f} стр/с ({3:.1f} с)".format(
+                per_second(total_seconds),
+                total_seconds,
+                per_second(ingest_seconds),
+                ingest_seconds,
+            )
+        )
+
+    def fetch_page(
+        self,
+        client: KinopoiskClient,
+        limit: int,
+        updated_since: Optional[str],
+        next_cursor: Optional[str],
+    ) -> Union[Dict[str, Any], StreamedPage]:
+        """Загрузка одной страницы с текущими фильтрами (из фонового потока)."""
+        return client.get_movies_page(
+            limit=limit,
+            next_cursor=next_cursor,
+            updated_since=updated_since,
+            min_rating=self.min_rating,
+            min_votes=self.min_votes,
+            year_min=self.year_min,
+            year_max=self.year_max,
+            require_backdrop=self.require_backdrop,
+            stream=self.stream,
+        )
 
     def passes_quality_filters(self, payload: Dict[str, Any]) -> bool:
         movie_type = payload.get("type")
@@ -651,269 +1043,3 @@ class Command(BaseCommand):
             return False
 
         return True
-
-    @transaction.atomic
-    def save_movie(self, payload: Dict[str, Any]) -> bool:
-        if not self.passes_quality_filters(payload):
-            return False
-
-        movie_type = payload.get("type")
-
-        type_obj, _ = Type.objects.get_or_create(name=movie_type)
-
-        rating = payload.get("rating") or {}
-        votes = payload.get("votes") or {}
-        budget = payload.get("budget") or {}
-        poster = payload.get("poster") or {}
-        backdrop = payload.get("backdrop") or {}
-        logo = payload.get("logo") or {}
-
-        film, _ = Film.objects.update_or_create(
-            kinopoisk_api_id=payload["id"],
-            defaults={
-                "name": payload.get("name"),
-                "en_name": payload.get("enName"),
-                "alternative_name": payload.get("alternativeName"),
-                "description": payload.get("description"),
-                "short_description": payload.get("shortDescription"),
-                "slogan": payload.get("slogan"),
-                "year": payload.get("year"),
-                "movie_length": payload.get("movieLength"),
-                "kinopoisk_rating": rating.get("kp"),
-                "kinopoisk_votes": votes.get("kp"),
-                "imdb_rating": rating.get("imdb"),
-                "imdb_votes": votes.get("imdb"),
-                "rating_mpaa": payload.get("ratingMpaa"),
-                "age_rating": payload.get("ageRating"),
-                "budget_value": budget.get("value"),
-                "budget_currency": budget.get("currency"),
-                "poster_url": poster.get("url"),
-                "poster_preview_url": poster.get("previewUrl"),
-                "logo_url": logo.get("url"),
-                "logo_preview_url": logo.get("previewUrl"),
-                "backdrop_url": backdrop.get("url"),
-                "backdrop_preview_url": backdrop.get("previewUrl"),
-                "type": type_obj,
-            }
-        )
-
-        self.sync_genres(film, payload.get("genres") or [])
-        self.sync_countries(film, payload.get("countries") or [])
-        self.sync_persons(film, payload.get("persons") or [])
-        self.sync_videos(film, payload.get("videos") or {})
-        self.sync_facts(film, payload.get("facts") or [])
-        self.sync_fees(film, payload.get("fees") or {})
-        self.sync_similar_movies(film, payload.get("similarMovies") or [])
-        self.sync_sequels_and_prequels(film, payload.get("sequelsAndPrequels") or [])
-
-        return True
-
-    def sync_genres(self, film: Film, genres: List[Dict[str, Any]]) -> None:
-        for item in genres:
-            genre_name = item.get("name")
-            if not genre_name:
-                continue
-
-            genre, _ = Genre.objects.get_or_create(name=genre_name)
-            FilmGenre.objects.get_or_create(film=film, genre=genre)
-
-    def sync_countries(self, film: Film, countries: List[Dict[str, Any]]) -> None:
-        for item in countries:
-            country_name = item.get("name")
-            if not country_name:
-                continue
-
-            country, _ = Country.objects.get_or_create(name=country_name)
-            FilmCountry.objects.get_or_create(film=film, country=country)
-
-    def sync_persons(self, film: Film, persons: List[Dict[str, Any]]) -> None:
-        for item in persons:
-            kinopoisk_person_id = item.get("id")
-            if not kinopoisk_person_id:
-                continue
-
-            person_defaults = {
-                "name": item.get("name"),
-                "en_name": item.get("enName"),
-            }
-
-            if hasattr(Person, "photo_url"):
-                person_defaults["photo_url"] = item.get("photo")
-
-            person, _ = Person.objects.update_or_create(
-                kinopoisk_id=kinopoisk_person_id,
-                defaults=person_defaults,
-            )
-
-            film_person, _ = FilmPerson.objects.get_or_create(
-                film=film,
-                person=person,
-                defaults={"description": item.get("description")},
-            )
-
-            description = item.get("description")
-            if film_person.description != description:
-                film_person.description = description
-                film_person.save(update_fields=["description"])
-
-            profession_ru = item.get("profession")
-            profession_en = item.get("enProfession")
-
-            if profession_ru and profession_en:
-                profession, _ = Profession.objects.get_or_create(
-                    profession=profession_ru,
-                    defaults={"en_profession": profession_en},
-                )
-
-                if profession.en_profession != profession_en:
-                    profession.en_profession = profession_en
-                    profession.save(update_fields=["en_profession"])
-
-                FilmPersonProfession.objects.get_or_create(
-                    film_person=film_person,
-                    profession=profession,
-                )
-
-    def sync_videos(self, film: Film, videos_payload: Dict[str, Any]) -> None:
-        trailers = []
-
-        if isinstance(videos_payload, dict):
-            trailers = videos_payload.get("trailers", []) or []
-
-        for item in trailers:
-            url = item.get("url")
-            if not url:
-                continue
-
-            Video.objects.update_or_create(
-                url=url,
-                defaults={
-                    "film": film,
-                    "name": item.get("name"),
-                    "site": item.get("site"),
-                    "type": "trailer",
-                }
-            )
-
-    def sync_facts(self, film: Film, facts: List[Dict[str, Any]]) -> None:
-        for item in facts:
-            text = item.get("value")
-            fact_type = item.get("type")
-            spoiler = bool(item.get("spoiler", False))
-
-            if not text:
-                continue
-
-            exists = Fact.objects.filter(
-                film=film,
-                text=text,
-                type=fact_type,
-                spoiler=spoiler,
-            ).exists()
-
-            if not exists:
-                Fact.objects.create(
-                    film=film,
-                    text=text,
-                    type=fact_type,
-                    spoiler=spoiler,
-                )
-
-    def sync_fees(self, film: Film, fees_payload: Dict[str, Any]) -> None:
-        if not isinstance(fees_payload, dict):
-            return
-
-        mapping = {
-            "world": "Мир",
-            "usa": "США",
-            "russia": "Россия",
-        }
-
-        for key, place in mapping.items():
-            block = fees_payload.get(key) or {}
-            value = block.get("value")
-            currency = block.get("currency")
-
-            if value is None:
-                continue
-
-            Fees.objects.update_or_create(
-                film=film,
-                place=place,
-                defaults={
-                    "value": value,
-                    "currency": currency,
-                }
-            )
-
-    def sync_similar_movies(self, film: Film, items: List[Dict[str, Any]]) -> None:
-        for item in items:
-            similar_id = item.get("id")
-            if not similar_id:
-                continue
-
-            similar_film = Film.objects.filter(
-                kinopoisk_api_id=similar_id
-            ).first()
-
-            if not similar_film and self.allow_related_placeholders:
-                poster = item.get("poster") or {}
-                rating = item.get("rating") or {}
-
-                similar_film, _ = Film.objects.get_or_create(
-                    kinopoisk_api_id=similar_id,
-                    defaults={
-                        "name": item.get("name"),
-                        "en_name": item.get("enName"),
-                        "alternative_name": item.get("alternativeName"),
-                        "year": item.get("year"),
-                        "poster_url": poster.get("url"),
-                        "poster_preview_url": poster.get("previewUrl"),
-                        "kinopoisk_rating": rating.get("kp"),
-                        "imdb_rating": rating.get("imdb"),
-                    }
-                )
-
-            if not similar_film:
-                continue
-
-            SimilarFilms.objects.get_or_create(
-                film=film,
-                similar_film=similar_film,
-            )
-
-    def sync_sequels_and_prequels(self, film: Film, items: List[Dict[str, Any]]) -> None:
-        for item in items:
-            related_id = item.get("id")
-            if not related_id:
-                continue
-
-            related_film = Film.objects.filter(
-                kinopoisk_api_id=related_id
-            ).first()
-
-            if not related_film and self.allow_related_placeholders:
-                poster = item.get("poster") or {}
-                rating = item.get("rating") or {}
-
-                related_film, _ = Film.objects.get_or_create(
-                    kinopoisk_api_id=related_id,
-                    defaults={
-                        "name": item.get("name"),
-                        "en_name": item.get("enName"),
-                        "alternative_name": item.get("alternativeName"),
-                        "year": item.get("year"),
-                        "poster_url": poster.get("url"),
-                        "poster_preview_url": poster.get("previewUrl"),
-                        "kinopoisk_rating": rating.get("kp"),
-                        "imdb_rating": rating.get("imdb"),
-                    }
-                )
-
-            if not related_film:
-                continue
-
-            SequelsAndPrequels.objects.get_or_create(
-                film=film,
-                related_film=related_film,
-            )
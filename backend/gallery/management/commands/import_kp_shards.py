@@ -0,0 +1,277 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from gallery.kinopoisk.client import KinopoiskClient
+from gallery.kinopoisk.ingest import PageIngestor
+from gallery.kinopoisk.shards import init_worker, run_shard, year_shards
+from gallery.models import ImportQuota
+
+
+QUOTA_NAME = "kinopoisk_shards"
+
+
+class Command(BaseCommand):
+    help = (
+        "Параллельный импорт из Kinopoisk API: диапазон лет делится на "
+        "шарды, каждый импортируется отдельным процессом import_kp_movies "
+        "со своим ImportState и общим лимитом запросов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--year-min", type=int, required=True)
+        parser.add_argument("--year-max", type=int, default=None)
+        parser.add_argument(
+            "--shard-years",
+            type=int,
+            default=5,
+            help="Сколько лет в одном шарде",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Сколько шардов импортировать одновременно",
+        )
+        parser.add_argument("--reserve", type=int, default=15)
+        parser.add_argument("--limit", type=int, default=250)
+        parser.add_argument(
+            "--max-pages",
+            type=int,
+            default=None,
+            help="Ограничение страниц на один шард",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=5.0,
+            help="Запросов к API в секунду на все шарды вместе. 0 - без ограничения",
+        )
+        parser.add_argument("--prefetch", type=int, default=2)
+        parser.add_argument("--retries", type=int, default=5)
+        parser.add_argument("--api-base", type=str, default=None)
+        parser.add_argument("--stream", action="store_true")
+        parser.add_argument("--batch-size", type=int, default=50)
+
+        parser.add_argument("--min-rating", type=float, default=7.0)
+        parser.add_argument("--min-votes", type=int, default=500000)
+        parser.add_argument("--no-require-backdrop", action="store_true")
+        parser.add_argument("--allow-related-placeholders", action="store_true")
+        parser.add_argument("--full-sync", action="store_true")
+        parser.add_argument(
+            "--lock-timeout",
+            type=int,
+            default=30,
+            help=(
+                "Минут без heartbeat, после которых блокировка шарда и общий "
+                "лимит прошлого запуска считаются брошенными"
+            ),
+        )
+        parser.add_argument("--dump-dir", type=str, default=None)
+
+    def handle(self, *args, **options):
+        api_key = getattr(settings, "KINOPOISK_API_KEY", None)
+        if not api_key:
+            raise CommandError("В settings.py не найден KINOPOISK_API_KEY")
+
+        year_min = options["year_min"]
+        year_max = options["year_max"] or timezone.now().year
+        workers = options["workers"]
+        reserve = options["reserve"]
+
+        if year_min > year_max:
+            raise CommandError("--year-min не может быть больше --year-max")
+
+        if options["shard_years"] < 1 or workers < 1:
+            raise CommandError("--shard-years и --workers должны быть больше 0")
+
+        if options["lock_timeout"] <= 0:
+            raise CommandError("--lock-timeout должен быть больше 0")
+
+        shards = year_shards(year_min, year_max, options["shard_years"])
+        workers = min(workers, len(shards))
+
+        if connections["default"].vendor == "sqlite" and workers > 1:
+            # SQLite не даёт писать из нескольких процессов одновременно
+            self.stdout.write(
+                self.style.WARNING("SQLite: шарды импортируются по одному")
+            )
+            workers = 1
+
+        client = KinopoiskClient(api_key=api_key, api_base=options["api_base"])
+        token_info = client.get_token_info()
+        remaining = token_info.requests_remaining or 0
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Лимит: осталось {0}, использовано {1}, дневной лимит {2}, сброс {3}".format(
+                    remaining,
+                    token_info.requests_used,
+                    token_info.daily_limit,
+                    token_info.resets_at,
+                )
+            )
+        )
+
+        if remaining <= reserve:
+            self.stdout.write(
+                self.style.WARNING(
+                    "Остановлено: осталось {0} запросов, reserve={1}".format(
+                        remaining, reserve
+                    )
+                )
+            )
+            return
+
+        # Лимит упавшего координатора перехватываем, если его не
+        # расходовали дольше --lock-timeout
+        if not ImportQuota.start(
+            QUOTA_NAME,
+            remaining - reserve,
+            timedelta(minutes=options["lock_timeout"]),
+        ):
+            raise CommandError(
+                "Общий лимит {0} уже используется другим запуском. Если он "
+                "упал, лимит освободится через {1} мин без запросов "
+                "(--lock-timeout).".format(QUOTA_NAME, options["lock_timeout"])
+            )
+
+        shard_options = {
+            "limit": options["limit"],
+            "max_pages": options["max_pages"],
+            # Лимит частоты делится между одновременно работающими шардами
+            "rate": options["rate"] / workers,
+            "prefetch": options["prefetch"],
+            "retries": options["retries"],
+            "api_base": options["api_base"],
+            "stream": options["stream"],
+            "batch_size": options["batch_size"],
+            "min_rating": options["min_rating"],
+            "min_votes": options["min_votes"],
+            "no_require_backdrop": options["no_require_backdrop"],
+            "allow_related_placeholders": options["allow_related_placeholders"],
+            "full_sync": options["full_sync"],
+            "lock_timeout": options["lock_timeout"],
+            "dump_dir": options["dump_dir"],
+            "quota": QUOTA_NAME,
+        }
+
+        self.stdout.write(
+            "Шардов: {0} по {1} лет, процессов: {2}, бюджет запросов: {3}".format(
+                len(shards), options["shard_years"], workers, remaining - reserve
+            )
+        )
+
+        # Дочерние процессы открывают свои подключения
+        connections.close_all()
+
+        results = []
+        started = time.monotonic()
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker,
+            ) as pool:
+                futures = [
+                    pool.submit(
+                        run_shard,
+                        dict(shard_options, year_min=shard_min, year_max=shard_max),
+                    )
+                    for shard_min, shard_max in shards
+                ]
+                for future in as_completed(futures):
+                    result = future.result()
+                    results.append(result)
+                    self.write_shard(result, options["verbosity"])
+        finally:
+            quota_left = ImportQuota.objects.filter(
+                name=QUOTA_NAME
+            ).values_list("remaining", flat=True).first()
+            ImportQuota.objects.filter(name=QUOTA_NAME).delete()
+
+        self.write_summary(results, time.monotonic() - started, quota_left)
+        self.resolve_cross_shard_links(results, options)
+
+        failed = [result for result in results if result["error"]]
+        if failed:
+            raise CommandError(
+                "Шардов с ошибкой: {0} из {1}".format(len(failed), len(results))
+            )
+
+    def resolve_cross_shard_links(self, results, options) -> None:
+        """
+        Повторно разрешает связи, которые шарды не смогли сохранить.
+
+        Похожий фильм или сиквел часто относится к другому диапазону лет
+        и мог быть импортирован соседним шардом уже после того, как
+        этот шард закончил. Неразрешённые связи лежат в PendingFilmLink.
+        """
+        if not any(result.get("links_unresolved") for result in results):
+            return
+
+        ingestor = PageIngestor()
+        unresolved = ingestor.resolve_links()
+        self.stdout.write(
+            "Связи между шардами: сохранено {0}, связанный фильм "
+            "не найден {1}".format(ingestor.links_resolved, len(unresolved))
+        )
+
+    def write_shard(self, result, verbosity: int) -> None:
+        if verbosity >= 2:
+            self.stdout.write(result["output"])
+
+        years = "{0}-{1}".format(result["year_min"], result["year_max"])
+        if result["error"]:
+            self.stdout.write(
+                self.style.ERROR("Шард {0}: ошибка {1}".format(years, result["error"]))
+            )
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Шард {0}: страниц {1}, фильмов {2}, сохранено {3}, "
+                "{4:.1f} с{5}".format(
+                    years,
+                    result["pages"],
+                    result["movies_seen"],
+                    result["movies_saved"],
+                    result["seconds"],
+                    ", проход завершён" if result["completed"] else "",
+                )
+            )
+        )
+
+    def write_summary(self, results, wall_seconds: float, quota_left) -> None:
+        pages = sum(result["pages"] for result in results)
+        ingest_seconds = sum(result["ingest_seconds"] for result in results)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Готово. Шардов: {0}, страниц: {1}, фильмов: {2}, "
+                "сохранено/подходит: {3}".format(
+                    len(results),
+                    pages,
+                    sum(result["movies_seen"] for result in results),
+                    sum(result["movies_saved"] for result in results),
+                )
+            )
+        )
+        if pages and wall_seconds > 0:
+            self.stdout.write(
+                "Скорость: {0:.2f} стр/с за {1:.1f} с; запись в БД суммарно "
+                "{2:.1f} с".format(pages / wall_seconds, wall_seconds, ingest_seconds)
+            )
+        self.stdout.write(
+            "Запросов к API: {0}, повторов: {1}, осталось в общем лимите: {2}".format(
+                sum(result["requests"] for result in results),
+                sum(result["retries"] for result in results),
+                quota_left,
+            )
+        )
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import connections, DEFAULT_DB_ALIAS
+
+from gallery.search import (rebuild_film_trigrams,
+                            rebuild_search_index,
+                            search_index_available)
+
+
+class Command(BaseCommand):
+    help = (
+        'Перестроить поисковый индекс по названиям фильмов '
+        'и триграммы для нечёткого поиска.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        using = options['database']
+        rebuild_search_index(connections[using])
+
+        if search_index_available(using):
+            self.stdout.write(self.style.SUCCESS('Поисковый индекс перестроен'))
+        else:
+            self.stdout.write(self.style.WARNING(
+                'Поисковый индекс не поддерживается этой БД, '
+                'поиск работает через icontains'
+            ))
+
+        rebuild_film_trigrams(using=using)
+        self.stdout.write(self.style.SUCCESS('Триграммы названий перестроены'))
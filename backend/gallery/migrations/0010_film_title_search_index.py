@@ -0,0 +1,91 @@
+from django.db import OperationalError, migrations
+
+
+# DDL скопирован из gallery.search на момент миграции: исторический
+# код не должен меняться вместе с приложением
+
+FTS_TABLE = 'gallery_film_fts'
+PG_SEARCH_INDEX = 'gallery_film_title_search_gin'
+
+PG_VECTOR = (
+    "to_tsvector('simple'::regconfig, "
+    "coalesce(name, '') || ' ' || "
+    "coalesce(alternative_name, '') || ' ' || "
+    "coalesce(en_name, ''))"
+)
+
+SQLITE_TRIGGERS = {
+    'gallery_film_fts_ai': (
+        'CREATE TRIGGER IF NOT EXISTS gallery_film_fts_ai '
+        'AFTER INSERT ON gallery_film BEGIN '
+        'INSERT INTO gallery_film_fts(rowid, name, alternative_name, en_name) '
+        'VALUES (new.id, new.name, new.alternative_name, new.en_name); '
+        'END'
+    ),
+    'gallery_film_fts_ad': (
+        'CREATE TRIGGER IF NOT EXISTS gallery_film_fts_ad '
+        'AFTER DELETE ON gallery_film BEGIN '
+        'INSERT INTO gallery_film_fts'
+        '(gallery_film_fts, rowid, name, alternative_name, en_name) '
+        "VALUES ('delete', old.id, old.name, old.alternative_name, old.en_name); "
+        'END'
+    ),
+    'gallery_film_fts_au': (
+        'CREATE TRIGGER IF NOT EXISTS gallery_film_fts_au '
+        'AFTER UPDATE OF name, alternative_name, en_name ON gallery_film BEGIN '
+        'INSERT INTO gallery_film_fts'
+        '(gallery_film_fts, rowid, name, alternative_name, en_name) '
+        "VALUES ('delete', old.id, old.name, old.alternative_name, old.en_name); "
+        'INSERT INTO gallery_film_fts(rowid, name, alternative_name, en_name) '
+        'VALUES (new.id, new.name, new.alternative_name, new.en_name); '
+        'END'
+    ),
+}
+
+
+def forwards(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            try:
+                cursor.execute(
+                    f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+                    'name, alternative_name, en_name, '
+                    "content='gallery_film', content_rowid='id', "
+                    "tokenize='unicode61 remove_diacritics 2')"
+                )
+            except OperationalError:
+                # SQLite собран без FTS5 - поиск работает через icontains
+                return
+            for sql in SQLITE_TRIGGERS.values():
+                cursor.execute(sql)
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {PG_SEARCH_INDEX} '
+                f'ON gallery_film USING GIN ({PG_VECTOR})'
+            )
+
+
+def backwards(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            for name in SQLITE_TRIGGERS:
+                cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f'DROP INDEX IF EXISTS {PG_SEARCH_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0009_usertopfilm_usertopfilm_unique_user_top_position_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
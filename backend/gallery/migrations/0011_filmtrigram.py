@@ -0,0 +1,94 @@
+# Generated by Django 4.2.20 on 2026-10-17 23:05
+
+import re
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# SQL и разбиение на триграммы скопированы из gallery.search на момент
+# миграции: исторический код не должен меняться вместе с приложением
+
+SEARCH_FIELDS = ('name', 'alternative_name', 'en_name')
+
+PG_TRIGRAM_INDEXES = {
+    field: f'gallery_film_{field}_trgm' for field in SEARCH_FIELDS
+}
+
+
+def film_title_trigrams(film):
+    """Триграммы названий как в pg_trgm: слово дополняется '  ' и ' '."""
+    trigrams = set()
+    for field in SEARCH_FIELDS:
+        value = (getattr(film, field) or '').lower().replace('ё', 'е')
+        for word in re.findall(r'\w+', value):
+            padded = f'  {word} '
+            for index in range(len(padded) - 2):
+                trigrams.add(padded[index:index + 3])
+    return trigrams
+
+
+def forwards(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            for field, index_name in PG_TRIGRAM_INDEXES.items():
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS {index_name} '
+                    f'ON gallery_film USING GIN (lower({field}) gin_trgm_ops)'
+                )
+        return
+
+    Film = apps.get_model('gallery', 'Film')
+    FilmTrigram = apps.get_model('gallery', 'FilmTrigram')
+    db_alias = connection.alias
+
+    films = Film.objects.using(db_alias).only(
+        'name', 'alternative_name', 'en_name'
+    )
+    FilmTrigram.objects.using(db_alias).bulk_create(
+        [
+            FilmTrigram(film_id=film.pk, trigram=trigram)
+            for film in films.iterator()
+            for trigram in film_title_trigrams(film)
+        ],
+        batch_size=1000,
+    )
+
+
+def backwards(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+
+    with connection.cursor() as cursor:
+        for index_name in PG_TRIGRAM_INDEXES.values():
+            cursor.execute(f'DROP INDEX IF EXISTS {index_name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0010_film_title_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FilmTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3, verbose_name='Триграмма')),
+                ('film', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='title_trigrams', to='gallery.film', verbose_name='Фильм')),
+            ],
+            options={
+                'verbose_name': 'Триграмма названия',
+                'verbose_name_plural': 'Триграммы названий',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='filmtrigram',
+            constraint=models.UniqueConstraint(fields=('trigram', 'film'), name='uniq_film_trigram'),
+        ),
+        migrations.RunPython(forwards, backwards),
+    ]
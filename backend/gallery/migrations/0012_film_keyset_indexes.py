@@ -0,0 +1,29 @@
+# Generated by Django 4.2.20 on 2026-10-17 23:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0011_filmtrigram'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='film',
+            index=models.Index(fields=['kinopoisk_rating', 'year', 'id'], name='gallery_fil_kinopoi_728973_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='film',
+            index=models.Index(fields=['year', 'id'], name='gallery_fil_year_419f9f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='film',
+            index=models.Index(fields=['imdb_rating', 'id'], name='gallery_fil_imdb_ra_913cfb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='film',
+            index=models.Index(fields=['movie_length', 'id'], name='gallery_fil_movie_l_ae8713_idx'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 4.2.20 on 2026-10-17 23:20
+
+from django.db import migrations
+from django.db.models import Count, Max, Min
+
+
+def remove_duplicates(apps, schema_editor):
+    """Убираем дубли перед уникальными ограничениями.
+
+    FilmPerson: оставляем первую запись, профессии дублей переносим на неё.
+    Fees: оставляем последнюю запись по месту сборов.
+    Дубли kinopoisk_api_id не трогаем: у фильмов есть пользовательские
+    данные, такие случаи нужно разбирать вручную.
+    """
+    Film = apps.get_model('gallery', 'Film')
+    FilmPerson = apps.get_model('gallery', 'FilmPerson')
+    FilmPersonProfession = apps.get_model('gallery', 'FilmPersonProfession')
+    Fees = apps.get_model('gallery', 'Fees')
+
+    duplicated_films = list(
+        Film.objects.exclude(kinopoisk_api_id=None).values(
+            'kinopoisk_api_id'
+        ).annotate(total=Count('pk')).filter(total__gt=1).values_list(
+            'kinopoisk_api_id', flat=True
+        )[:20]
+    )
+    if duplicated_films:
+        raise RuntimeError(
+            'Есть фильмы с одинаковым kinopoisk_api_id: {0}'.format(
+                duplicated_films
+            )
+        )
+
+    groups = FilmPerson.objects.values('film_id', 'person_id').annotate(
+        keep=Min('pk'), total=Count('pk')
+    ).filter(total__gt=1)
+    for group in groups:
+        duplicates = FilmPerson.objects.filter(
+            film_id=group['film_id'],
+            person_id=group['person_id'],
+        ).exclude(pk=group['keep'])
+        profession_ids = set(
+            FilmPersonProfession.objects.filter(
+                film_person__in=duplicates
+            ).values_list('profession_id', flat=True)
+        )
+        FilmPersonProfession.objects.bulk_create(
+            [
+                FilmPersonProfession(
+                    film_person_id=group['keep'],
+                    profession_id=profession_id,
+                )
+                for profession_id in profession_ids
+            ],
+            ignore_conflicts=True,
+        )
+        duplicates.delete()
+
+    groups = Fees.objects.exclude(film=None).values('film_id', 'place').annotate(
+        keep=Max('pk'), total=Count('pk')
+    ).filter(total__gt=1)
+    for group in groups:
+        Fees.objects.filter(
+            film_id=group['film_id'],
+            place=group['place'],
+        ).exclude(pk=group['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0012_film_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+    ]
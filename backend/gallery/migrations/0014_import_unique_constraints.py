@@ -0,0 +1,26 @@
+# Generated by Django 4.2.20 on 2026-10-17 23:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0013_remove_import_duplicates'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='film',
+            name='kinopoisk_api_id',
+            field=models.PositiveIntegerField(blank=True, null=True, unique=True, verbose_name='ID API Kinopoisk'),
+        ),
+        migrations.AddConstraint(
+            model_name='fees',
+            constraint=models.UniqueConstraint(fields=('film', 'place'), name='uniq_film_fees_place'),
+        ),
+        migrations.AddConstraint(
+            model_name='filmperson',
+            constraint=models.UniqueConstraint(fields=('film', 'person'), name='uniq_film_person'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.20 on 2026-10-17 23:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0014_import_unique_constraints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportQuota',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Название')),
+                ('remaining', models.PositiveIntegerField(default=0, verbose_name='Осталось запросов')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Лимит запросов импорта',
+                'verbose_name_plural': 'Лимиты запросов импорта',
+                'ordering': ['name'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-17 23:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0015_importquota'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='film',
+            name='import_hashes',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='По разделам документа API: фильм, жанры, персоны и т.д.', verbose_name='Хэши данных последнего импорта'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 4.2.20 on 2026-10-17 23:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0016_film_import_hashes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(db_index=True, help_text='Как ImportState.source', max_length=100, verbose_name='Источник')),
+                ('status', models.CharField(choices=[('running', 'Выполняется'), ('success', 'Завершён'), ('error', 'Ошибка')], default='running', max_length=10, verbose_name='Статус')),
+                ('options', models.JSONField(blank=True, default=dict, verbose_name='Параметры запуска')),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Начало')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Окончание')),
+                ('pages', models.PositiveIntegerField(default=0, verbose_name='Страниц')),
+                ('movies_seen', models.PositiveIntegerField(default=0, verbose_name='Просмотрено фильмов')),
+                ('movies_saved', models.PositiveIntegerField(default=0, verbose_name='Сохранено фильмов')),
+                ('movies_unchanged', models.PositiveIntegerField(default=0, verbose_name='Фильмов без изменений')),
+                ('requests', models.PositiveIntegerField(default=0, verbose_name='Запросов к API')),
+                ('retries', models.PositiveIntegerField(default=0, verbose_name='Повторов запросов')),
+                ('seconds', models.FloatField(default=0, verbose_name='Длительность, с')),
+                ('stage_seconds', models.JSONField(blank=True, default=dict, help_text='Основной поток: запись в БД, фильтры, ожидание страниц', verbose_name='Время по стадиям, с')),
+                ('stage_queries', models.JSONField(blank=True, default=dict, verbose_name='SQL-запросов по стадиям')),
+                ('fetch_seconds', models.JSONField(blank=True, default=dict, help_text='http, decode, rate_wait... (в фоновом потоке)', verbose_name='Время загрузки по стадиям, с')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='Ошибка')),
+            ],
+            options={
+                'verbose_name': 'Запуск импорта',
+                'verbose_name_plural': 'Запуски импорта',
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ImportPageStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField(verbose_name='Номер страницы')),
+                ('movies', models.PositiveIntegerField(default=0, verbose_name='Фильмов на странице')),
+                ('accepted', models.PositiveIntegerField(default=0, verbose_name='Прошли фильтры')),
+                ('seconds', models.FloatField(default=0, verbose_name='Обработка, с')),
+                ('stage_seconds', models.JSONField(default=dict, verbose_name='Время по стадиям, с')),
+                ('stage_queries', models.JSONField(default=dict, verbose_name='SQL-запросов по стадиям')),
+                ('fetch_seconds', models.JSONField(default=dict, verbose_name='Время загрузки по стадиям, с')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='page_stats', to='gallery.importrun')),
+            ],
+            options={
+                'verbose_name': 'Замеры страницы импорта',
+                'verbose_name_plural': 'Замеры страниц импорта',
+                'ordering': ['run', 'number'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='importpagestat',
+            constraint=models.UniqueConstraint(fields=('run', 'number'), name='uniq_import_page_stat'),
+        ),
+    ]
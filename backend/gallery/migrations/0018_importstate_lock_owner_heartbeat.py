@@ -0,0 +1,23 @@
+# Generated by Django 4.2.20 on 2026-10-17 23:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0017_importrun_importpagestat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importstate',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, help_text='Обновляется после каждой страницы. Если импорт упал, по нему блокировку перехватывает следующий запуск', null=True, verbose_name='Последний признак жизни'),
+        ),
+        migrations.AddField(
+            model_name='importstate',
+            name='lock_owner',
+            field=models.CharField(blank=True, help_text='host:pid:метка процесса, который держит блокировку', max_length=100, null=True, verbose_name='Кто выполняет импорт'),
+        ),
+    ]
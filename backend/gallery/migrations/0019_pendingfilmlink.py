@@ -0,0 +1,32 @@
+# Generated by Django 4.2.20 on 2026-10-18 00:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0018_importstate_lock_owner_heartbeat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingFilmLink',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('film_kinopoisk_id', models.PositiveIntegerField(verbose_name='ID фильма в Kinopoisk')),
+                ('related_kinopoisk_id', models.PositiveIntegerField(db_index=True, verbose_name='ID связанного фильма в Kinopoisk')),
+                ('kind', models.CharField(choices=[('similar', 'Похожий фильм'), ('sequel', 'Сиквел или приквел')], max_length=10, verbose_name='Тип связи')),
+                ('related_item', models.JSONField(blank=True, help_text='Из документа API - для Film-заглушки', null=True, verbose_name='Данные связанного фильма')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Отложенная связь фильмов',
+                'verbose_name_plural': 'Отложенные связи фильмов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='pendingfilmlink',
+            constraint=models.UniqueConstraint(fields=('film_kinopoisk_id', 'related_kinopoisk_id', 'kind'), name='uniq_pending_film_link'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 import uuid
+from datetime import timedelta
 
 from django.contrib.auth import get_user_model
 from django.core.files.storage import default_storage
@@ -36,7 +37,7 @@ from gallery.constants import (
     MIN_MOVIE_LENGTH
 )
 from gallery.validators import validate_max_future_year
-from gallery.utils import cut_str
+from gallery.utils import calculate_age, cut_str
 from talk_about.constants import DEFAULT_AVATAR_PATH
 from talk_about.utils import delete_folder_with_all_files
 
@@ -113,7 +114,7 @@ class Film(models.Model):
         'ID API Kinopoisk',
         null=True,
         blank=True,
-        db_index=True
+        unique=True,
     )
     created_at = models.DateTimeField(
         auto_now_add=True
@@ -122,6 +123,13 @@ class Film(models.Model):
         auto_now=True,
         db_index=True
     )
+    import_hashes = models.JSONField(
+        'Хэши данных последнего импорта',
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text='По разделам документа API: фильм, жанры, персоны и т.д.',
+    )
     name = models.CharField(
         'Название (на русском)',
         max_length=FILM_TITLE_MAX_LENGTH,
@@ -305,6 +313,13 @@ class Film(models.Model):
         verbose_name = 'Фильм'
         verbose_name_plural = 'Фильмы'
         ordering = ['year', 'id']
+        # Под keyset-пагинацию: поле сортировки + id как уникальный хвост
+        indexes = [
+            models.Index(fields=['kinopoisk_rating', 'year', 'id']),
+            models.Index(fields=['year', 'id']),
+            models.Index(fields=['imdb_rating', 'id']),
+            models.Index(fields=['movie_length', 'id']),
+        ]
 
     def __str__(self):
         return f'{self.name} {self.year if self.year else ""}'
@@ -498,30 +513,10 @@ class Person(models.Model):
     @property
     def age(self):
         """Возраст или возраст на момент смерти."""
-        if not self.birthday:
-            return None
-
-        end_date = timezone.now().date() if not self.death else self.death
-
-        # Проверка что дата смерти не раньше даты рождения
-        if self.death and self.death < self.birthday:
-            return None
-
-        # Точный расчет
-        age = end_date.year - self.birthday.year
-
-        # Проверяем, наступил ли день рождения в текущем году
-        has_birthday_occurred = (
-            (end_date.month > self.birthday.month) or
-            (end_date.month == self.birthday.month and 
-             end_date.day >= self.birthday.day)
+        return calculate_age(
+            self.birthday, self.death, timezone.now().date()
         )
 
-        if not has_birthday_occurred:
-            age -= 1
-
-        return max(0, age)  # Возраст не может быть отрицательным
-
 
 class Profession(models.Model):
     """Профессии.
@@ -580,6 +575,14 @@ class FilmPerson(models.Model):
         help_text='Описание роли, которую исполнил актре в фильме',
     )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['film', 'person'],
+                name='uniq_film_person'
+            )
+        ]
+
     def __str__(self) -> str:
         return (f'{self.pk} - {cut_str(self.film.name, CUT_FILM_NAME)} '
                 f'- {cut_str(self.person.name, CUT_PERSON_NAME)}')
@@ -743,6 +746,12 @@ class Fees(models.Model):
         verbose_name = 'Сборы'
         verbose_name_plural = 'Сборы'
         ordering = ['film', 'place']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['film', 'place'],
+                name='uniq_film_fees_place'
+            )
+        ]
 
     def __str__(self):
         return (f'{self.pk} - {cut_str(self.film.name, CUT_FILM_NAME)} '
@@ -817,6 +826,79 @@ class SimilarFilms(models.Model):
                 f'связан с - {cut_str(self.similar_film.name, CUT_FILM_NAME)}')
 
 
+class PendingFilmLink(models.Model):
+    """
+    Связь с похожим фильмом или сиквелом, ждущая связанный фильм.
+
+    Импорт сохраняет сюда связи, которые не удалось создать вместе
+    со страницей (связанного фильма ещё нет в БД), в той же транзакции,
+    что и страницу. Поэтому после падения импорта связи уже
+    сохранённых страниц не теряются: их разрешает следующий запуск.
+    """
+
+    class Kind(models.TextChoices):
+        SIMILAR = 'similar', 'Похожий фильм'
+        SEQUEL = 'sequel', 'Сиквел или приквел'
+
+    film_kinopoisk_id = models.PositiveIntegerField('ID фильма в Kinopoisk')
+    related_kinopoisk_id = models.PositiveIntegerField(
+        'ID связанного фильма в Kinopoisk',
+        db_index=True,
+    )
+    kind = models.CharField('Тип связи', max_length=10, choices=Kind.choices)
+    related_item = models.JSONField(
+        'Данные связанного фильма',
+        null=True,
+        blank=True,
+        help_text='Из документа API - для Film-заглушки',
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Отложенная связь фильмов'
+        verbose_name_plural = 'Отложенные связи фильмов'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['film_kinopoisk_id', 'related_kinopoisk_id', 'kind'],
+                name='uniq_pending_film_link'
+            )
+        ]
+
+    def __str__(self) -> str:
+        return (f'{self.film_kinopoisk_id} -> {self.related_kinopoisk_id} '
+                f'({self.kind})')
+
+
+class FilmTrigram(models.Model):
+    """Триграммы названий фильма.
+
+    Индекс для нечёткого поиска по названиям на SQLite.
+    На PostgreSQL вместо этой таблицы используется pg_trgm.
+    """
+
+    trigram = models.CharField('Триграмма', max_length=3)
+    film = models.ForeignKey(
+        Film,
+        on_delete=models.CASCADE,
+        verbose_name='Фильм',
+        related_name='title_trigrams'
+    )
+
+    class Meta:
+        verbose_name = 'Триграмма названия'
+        verbose_name_plural = 'Триграммы названий'
+        constraints = [
+            # Индекс (trigram, film) - по нему идёт выборка кандидатов
+            models.UniqueConstraint(
+                fields=['trigram', 'film'],
+                name='uniq_film_trigram'
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.trigram} - {self.film_id}'
+
+
 class ImportState(models.Model):
     """Состояние импорта из внешнего API."""
 
@@ -863,6 +945,22 @@ class ImportState(models.Model):
         'Импорт сейчас выполняется',
         default=False,
     )
+    lock_owner = models.CharField(
+        'Кто выполняет импорт',
+        max_length=100,
+        null=True,
+        blank=True,
+        help_text='host:pid:метка процесса, который держит блокировку',
+    )
+    heartbeat_at = models.DateTimeField(
+        'Последний признак жизни',
+        null=True,
+        blank=True,
+        help_text=(
+            'Обновляется после каждой страницы. Если импорт упал, '
+            'по нему блокировку перехватывает следующий запуск'
+        ),
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -874,6 +972,217 @@ class ImportState(models.Model):
     def __str__(self):
         return self.source
 
+    def lock_is_stale(self, timeout: timedelta) -> bool:
+        """Импорт помечен запущенным, но признаков жизни нет дольше timeout."""
+        last_seen = self.heartbeat_at or self.updated_at
+        return last_seen is None or last_seen < timezone.now() - timeout
+
+    def acquire_lock(self, owner: str, timeout: timedelta) -> bool:
+        """
+        Атомарно помечает импорт запущенным от имени owner.
+
+        Удаётся, если импорт не запущен или блокировка зависла
+        (heartbeat старше timeout). False - импорт идёт в другом процессе.
+        """
+        now = timezone.now()
+        stale_before = now - timeout
+        locked = type(self).objects.filter(pk=self.pk).filter(
+            models.Q(is_running=False)
+            | models.Q(heartbeat_at__lt=stale_before)
+            | models.Q(heartbeat_at__isnull=True, updated_at__lt=stale_before)
+        ).update(
+            is_running=True,
+            lock_owner=owner,
+            heartbeat_at=now,
+            last_error=None,
+            updated_at=now,
+        )
+        if locked:
+            self.is_running = True
+            self.lock_owner = owner
+            self.heartbeat_at = now
+            self.last_error = None
+        return bool(locked)
+
+    def heartbeat(self, *fields: str) -> bool:
+        """
+        Сохраняет поля и обновляет heartbeat_at, если блокировка всё ещё
+        у self.lock_owner. False - её перехватил другой процесс.
+        """
+        return self._save_locked(fields)
+
+    def release_lock(self, *fields: str) -> bool:
+        """Сохраняет поля и снимает блокировку, если она ещё наша."""
+        released = self._save_locked(fields, is_running=False, lock_owner=None)
+        if released:
+            self.is_running = False
+            self.lock_owner = None
+        return released
+
+    def _save_locked(self, fields, **extra) -> bool:
+        now = timezone.now()
+        updated = type(self).objects.filter(
+            pk=self.pk, is_running=True, lock_owner=self.lock_owner,
+        ).update(
+            heartbeat_at=now,
+            updated_at=now,
+            **{name: getattr(self, name) for name in fields},
+            **extra,
+        )
+        if updated:
+            self.heartbeat_at = now
+            self.updated_at = now
+        return bool(updated)
+
+
+class ImportQuota(models.Model):
+    """Общий лимит запросов к API для параллельных импортов."""
+
+    name = models.CharField(
+        'Название',
+        max_length=100,
+        unique=True,
+    )
+    remaining = models.PositiveIntegerField(
+        'Осталось запросов',
+        default=0,
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Лимит запросов импорта'
+        verbose_name_plural = 'Лимиты запросов импорта'
+        ordering = ['name']
+
+    def __str__(self):
+        return f'{self.name}: {self.remaining}'
+
+    @classmethod
+    def start(cls, name: str, remaining: int, timeout: timedelta) -> bool:
+        """
+        Атомарно заводит лимит для нового запуска.
+
+        Удаётся, если лимита нет, он исчерпан или не расходовался дольше
+        timeout (координатор прошлого запуска упал, не удалив запись).
+        False - лимит сейчас расходует другой запуск.
+        """
+        _, created = cls.objects.get_or_create(
+            name=name, defaults={'remaining': remaining}
+        )
+        if created:
+            return True
+
+        now = timezone.now()
+        return bool(
+            cls.objects.filter(name=name).filter(
+                models.Q(remaining=0) | models.Q(updated_at__lt=now - timeout)
+            ).update(remaining=remaining, updated_at=now)
+        )
+
+    @classmethod
+    def claim(cls, name: str, amount: int = 1) -> bool:
+        """Атомарно списывает запросы. False - лимит исчерпан."""
+        return bool(
+            cls.objects.filter(name=name, remaining__gte=amount).update(
+                remaining=models.F('remaining') - amount,
+                updated_at=timezone.now(),
+            )
+        )
+
+
+class ImportRun(models.Model):
+    """Один запуск импорта: итоги и время по стадиям."""
+
+    class Status(models.TextChoices):
+        RUNNING = 'running', 'Выполняется'
+        SUCCESS = 'success', 'Завершён'
+        ERROR = 'error', 'Ошибка'
+
+    source = models.CharField(
+        'Источник',
+        max_length=100,
+        db_index=True,
+        help_text='Как ImportState.source',
+    )
+    status = models.CharField(
+        'Статус',
+        max_length=10,
+        choices=Status.choices,
+        default=Status.RUNNING,
+    )
+    options = models.JSONField('Параметры запуска', default=dict, blank=True)
+    started_at = models.DateTimeField('Начало', default=timezone.now)
+    finished_at = models.DateTimeField('Окончание', null=True, blank=True)
+    pages = models.PositiveIntegerField('Страниц', default=0)
+    movies_seen = models.PositiveIntegerField('Просмотрено фильмов', default=0)
+    movies_saved = models.PositiveIntegerField('Сохранено фильмов', default=0)
+    movies_unchanged = models.PositiveIntegerField(
+        'Фильмов без изменений',
+        default=0,
+    )
+    requests = models.PositiveIntegerField('Запросов к API', default=0)
+    retries = models.PositiveIntegerField('Повторов запросов', default=0)
+    seconds = models.FloatField('Длительность, с', default=0)
+    stage_seconds = models.JSONField(
+        'Время по стадиям, с',
+        default=dict,
+        blank=True,
+        help_text='Основной поток: запись в БД, фильтры, ожидание страниц',
+    )
+    stage_queries = models.JSONField(
+        'SQL-запросов по стадиям',
+        default=dict,
+        blank=True,
+    )
+    fetch_seconds = models.JSONField(
+        'Время загрузки по стадиям, с',
+        default=dict,
+        blank=True,
+        help_text='http, decode, rate_wait... (в фоновом потоке)',
+    )
+    error = models.TextField('Ошибка', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Запуск импорта'
+        verbose_name_plural = 'Запуски импорта'
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f'{self.source} {self.started_at:%Y-%m-%d %H:%M} {self.status}'
+
+
+class ImportPageStat(models.Model):
+    """Замеры по одной странице импорта."""
+
+    run = models.ForeignKey(
+        ImportRun,
+        related_name='page_stats',
+        on_delete=models.CASCADE,
+    )
+    number = models.PositiveIntegerField('Номер страницы')
+    movies = models.PositiveIntegerField('Фильмов на странице', default=0)
+    accepted = models.PositiveIntegerField('Прошли фильтры', default=0)
+    seconds = models.FloatField('Обработка, с', default=0)
+    stage_seconds = models.JSONField('Время по стадиям, с', default=dict)
+    stage_queries = models.JSONField('SQL-запросов по стадиям', default=dict)
+    fetch_seconds = models.JSONField('Время загрузки по стадиям, с', default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Замеры страницы импорта'
+        verbose_name_plural = 'Замеры страниц импорта'
+        ordering = ['run', 'number']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['run', 'number'],
+                name='uniq_import_page_stat',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.run_id} #{self.number}'
+
 
 class UserTopFilm(models.Model):
     user = models.ForeignKey(
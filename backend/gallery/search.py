@@ -0,0 +1,423 @@
+"""
+Полнотекстовый поиск фильмов по названиям.
+
+SQLite: виртуальная таблица FTS5 (external content) над gallery_film,
+синхронизация через триггеры на INSERT/UPDATE/DELETE.
+PostgreSQL: GIN-индекс по выражению to_tsvector(...).
+
+Если индекса нет (миграция не применена, FTS5 не собран и тд.),
+поиск откатывается на старый путь через icontains.
+
+Для опечаток есть нечёткий поиск по триграммам (fuzzy_search).
+"""
+import re
+from typing import Dict, List
+
+from django.db import connections, DEFAULT_DB_ALIAS, OperationalError
+from django.db.models import Count, FloatField, Q, Value
+
+
+FTS_TABLE = 'gallery_film_fts'
+PG_SEARCH_INDEX = 'gallery_film_title_search_gin'
+
+SEARCH_FIELDS = ('name', 'alternative_name', 'en_name')
+
+# Выражение должно совпадать с выражением индекса,
+# иначе PostgreSQL не сможет его использовать
+PG_VECTOR_TEMPLATE = (
+    "to_tsvector('simple'::regconfig, "
+    "coalesce({table}name, '') || ' ' || "
+    "coalesce({table}alternative_name, '') || ' ' || "
+    "coalesce({table}en_name, ''))"
+)
+
+SQLITE_TRIGGERS = {
+    'gallery_film_fts_ai': (
+        'CREATE TRIGGER IF NOT EXISTS gallery_film_fts_ai '
+        'AFTER INSERT ON gallery_film BEGIN '
+        'INSERT INTO gallery_film_fts(rowid, name, alternative_name, en_name) '
+        'VALUES (new.id, new.name, new.alternative_name, new.en_name); '
+        'END'
+    ),
+    'gallery_film_fts_ad': (
+        'CREATE TRIGGER IF NOT EXISTS gallery_film_fts_ad '
+        'AFTER DELETE ON gallery_film BEGIN '
+        'INSERT INTO gallery_film_fts'
+        '(gallery_film_fts, rowid, name, alternative_name, en_name) '
+        "VALUES ('delete', old.id, old.name, old.alternative_name, old.en_name); "
+        'END'
+    ),
+    'gallery_film_fts_au': (
+        'CREATE TRIGGER IF NOT EXISTS gallery_film_fts_au '
+        'AFTER UPDATE OF name, alternative_name, en_name ON gallery_film BEGIN '
+        'INSERT INTO gallery_film_fts'
+        '(gallery_film_fts, rowid, name, alternative_name, en_name) '
+        "VALUES ('delete', old.id, old.name, old.alternative_name, old.en_name); "
+        'INSERT INTO gallery_film_fts(rowid, name, alternative_name, en_name) '
+        'VALUES (new.id, new.name, new.alternative_name, new.en_name); '
+        'END'
+    ),
+}
+
+# Кэш проверки наличия индекса: alias БД -> bool
+_index_available: Dict[str, bool] = {}
+
+
+def tokenize(query: str) -> List[str]:
+    """Разбивает поисковую строку на слова в нижнем регистре."""
+    return re.findall(r'\w+', (query or '').lower())
+
+
+def title_q(query: str) -> Q:
+    """Старый путь поиска: подстрока в любом из названий."""
+    return (
+        Q(name__icontains=query) |
+        Q(alternative_name__icontains=query) |
+        Q(en_name__icontains=query)
+    )
+
+
+def _sqlite_fts_query(tokens: List[str]) -> str:
+    # Каждое слово ищем как префикс: "интер"* "стел"*
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def _pg_ts_query(tokens: List[str]) -> str:
+    return ' & '.join(f'{token}:*' for token in tokens)
+
+
+def search_index_available(using: str = DEFAULT_DB_ALIAS) -> bool:
+    """Есть ли в БД поисковый индекс по названиям фильмов."""
+    if using in _index_available:
+        return _index_available[using]
+
+    connection = connections[using]
+    available = False
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+                [FTS_TABLE],
+            )
+            available = cursor.fetchone() is not None
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                'SELECT 1 FROM pg_indexes WHERE indexname = %s',
+                [PG_SEARCH_INDEX],
+            )
+            available = cursor.fetchone() is not None
+
+    _index_available[using] = available
+    return available
+
+
+def reset_search_index_cache() -> None:
+    _index_available.clear()
+
+
+def filter_by_title(queryset, query: str):
+    """
+    Фильтрует queryset фильмов по названиям.
+
+    Добавляет аннотацию search_rank (чем больше, тем релевантнее).
+    На старом пути через icontains search_rank всегда 0.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return queryset.none()
+
+    using = queryset.db
+    if not search_index_available(using):
+        return queryset.filter(title_q(query)).annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        )
+
+    vendor = connections[using].vendor
+    film_table = queryset.model._meta.db_table
+
+    if vendor == 'sqlite':
+        return queryset.extra(
+            # bm25 возвращает отрицательные числа: чем меньше, тем лучше
+            select={'search_rank': f'-bm25({FTS_TABLE})'},
+            tables=[FTS_TABLE],
+            where=[
+                f'{FTS_TABLE} MATCH %s',
+                f'{FTS_TABLE}.rowid = {film_table}.id',
+            ],
+            params=[_sqlite_fts_query(tokens)],
+        )
+
+    vector = PG_VECTOR_TEMPLATE.format(table=f'{film_table}.')
+    ts_query = _pg_ts_query(tokens)
+    return queryset.extra(
+        select={
+            'search_rank': (
+                f"ts_rank({vector}, to_tsquery('simple'::regconfig, %s))"
+            )
+        },
+        select_params=[ts_query],
+        where=[f"{vector} @@ to_tsquery('simple'::regconfig, %s)"],
+        params=[ts_query],
+    )
+
+
+def install_search_index(connection) -> None:
+    """Создаёт поисковый индекс (идемпотентно)."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT name FROM sqlite_master "
+                "WHERE type IN ('table', 'trigger') AND name LIKE %s",
+                ['gallery_film_fts%'],
+            )
+            existing = {row[0] for row in cursor.fetchall()}
+
+            if FTS_TABLE in existing and existing.issuperset(SQLITE_TRIGGERS):
+                return
+
+            try:
+                cursor.execute(
+                    f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+                    'name, alternative_name, en_name, '
+                    "content='gallery_film', content_rowid='id', "
+                    "tokenize='unicode61 remove_diacritics 2')"
+                )
+            except OperationalError:
+                # SQLite собран без FTS5 - работаем через icontains
+                return
+            for sql in SQLITE_TRIGGERS.values():
+                cursor.execute(sql)
+
+            # Триггеров не было (новая таблица или таблицу фильмов
+            # пересоздали миграцией) - индекс мог разойтись с данными
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+            )
+        elif connection.vendor == 'postgresql':
+            vector = PG_VECTOR_TEMPLATE.format(table='')
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {PG_SEARCH_INDEX} '
+                f'ON gallery_film USING GIN ({vector})'
+            )
+
+    _index_available.pop(connection.alias, None)
+
+
+def uninstall_search_index(connection) -> None:
+    """Удаляет поисковый индекс."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            for name in SQLITE_TRIGGERS:
+                cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f'DROP INDEX IF EXISTS {PG_SEARCH_INDEX}')
+
+    _index_available.pop(connection.alias, None)
+
+
+def rebuild_search_index(connection) -> None:
+    """Полностью перестраивает индекс по текущим данным."""
+    uninstall_search_index(connection)
+    install_search_index(connection)
+
+
+# Нечёткий поиск по триграммам.
+# PostgreSQL: pg_trgm и GIN-индексы gin_trgm_ops по lower(названию).
+# Остальные БД: таблица FilmTrigram, которую ведём из Python.
+
+TRIGRAM_SIMILARITY_THRESHOLD = 0.3
+FUZZY_CANDIDATES_LIMIT = 50
+
+PG_TRIGRAM_INDEXES = {
+    field: f'gallery_film_{field}_trgm' for field in SEARCH_FIELDS
+}
+
+
+def normalize_title(value: str) -> str:
+    return (value or '').lower().replace('ё', 'е')
+
+
+def make_trigrams(value: str) -> set:
+    """Триграммы строки как в pg_trgm: слово дополняется '  ' и ' '."""
+    trigrams = set()
+    for word in tokenize(normalize_title(value)):
+        padded = f'  {word} '
+        for index in range(len(padded) - 2):
+            trigrams.add(padded[index:index + 3])
+    return trigrams
+
+
+def trigram_similarity(left: set, right: set) -> float:
+    if not left or not right:
+        return 0.0
+    shared = len(left & right)
+    return shared / (len(left) + len(right) - shared)
+
+
+def film_title_trigrams(film) -> set:
+    trigrams = set()
+    for field in SEARCH_FIELDS:
+        trigrams |= make_trigrams(getattr(film, field))
+    return trigrams
+
+
+def refresh_film_trigrams(film_ids, using: str = DEFAULT_DB_ALIAS) -> None:
+    """Пересобирает строки FilmTrigram для указанных фильмов."""
+    if connections[using].vendor == 'postgresql':
+        return
+
+    from gallery.models import Film, FilmTrigram
+
+    film_ids = list(film_ids)
+    FilmTrigram.objects.using(using).filter(film_id__in=film_ids).delete()
+
+    films = Film.objects.using(using).filter(
+        pk__in=film_ids
+    ).only(*SEARCH_FIELDS)
+
+    FilmTrigram.objects.using(using).bulk_create(
+        [
+            FilmTrigram(film_id=film.pk, trigram=trigram)
+            for film in films
+            for trigram in film_title_trigrams(film)
+        ],
+        batch_size=1000,
+    )
+
+
+def refresh_film_trigrams_on_save(sender, instance, raw=False,
+                                  update_fields=None, using=DEFAULT_DB_ALIAS,
+                                  **kwargs):
+    """post_save для Film: держим триграммы в актуальном состоянии."""
+    if raw:
+        return
+    if update_fields is not None and not set(update_fields) & set(SEARCH_FIELDS):
+        return
+    refresh_film_trigrams([instance.pk], using=using)
+
+
+def rebuild_film_trigrams(using: str = DEFAULT_DB_ALIAS,
+                          chunk_size: int = 2000) -> None:
+    """Перестраивает триграммы для всего каталога."""
+    from gallery.models import Film
+
+    film_ids = Film.objects.using(using).values_list('pk', flat=True)
+    chunk = []
+    for film_id in film_ids.iterator(chunk_size=chunk_size):
+        chunk.append(film_id)
+        if len(chunk) >= chunk_size:
+            refresh_film_trigrams(chunk, using=using)
+            chunk = []
+    if chunk:
+        refresh_film_trigrams(chunk, using=using)
+
+
+def install_trigram_index(connection) -> None:
+    if connection.vendor != 'postgresql':
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for field, index_name in PG_TRIGRAM_INDEXES.items():
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {index_name} '
+                f'ON gallery_film USING GIN (lower({field}) gin_trgm_ops)'
+            )
+
+
+def uninstall_trigram_index(connection) -> None:
+    if connection.vendor != 'postgresql':
+        return
+
+    with connection.cursor() as cursor:
+        for index_name in PG_TRIGRAM_INDEXES.values():
+            cursor.execute(f'DROP INDEX IF EXISTS {index_name}')
+
+
+def _fuzzy_candidates_pg(queryset, query: str):
+    film_table = queryset.model._meta.db_table
+    value = query.lower()
+
+    similarity = 'GREATEST({0})'.format(', '.join(
+        f'similarity(lower({film_table}.{field}), %s)'
+        for field in SEARCH_FIELDS
+    ))
+    # Оператор % использует GIN-индексы gin_trgm_ops
+    matches = ' OR '.join(
+        f'lower({film_table}.{field}) %% %s' for field in SEARCH_FIELDS
+    )
+
+    films = queryset.extra(
+        select={'similarity': similarity},
+        select_params=[value] * len(SEARCH_FIELDS),
+        where=[f'({matches})'],
+        params=[value] * len(SEARCH_FIELDS),
+    ).order_by('-similarity')[:FUZZY_CANDIDATES_LIMIT]
+
+    return list(films)
+
+
+def _fuzzy_candidates_trigram_table(queryset, query: str):
+    from gallery.models import FilmTrigram
+
+    query_trigrams = make_trigrams(query)
+    if not query_trigrams:
+        return []
+
+    # Жаккар не больше shared / len(query_trigrams), поэтому фильмы
+    # с малым числом общих триграмм отсекаем ещё в индексе
+    min_shared = max(
+        1, int(TRIGRAM_SIMILARITY_THRESHOLD * len(query_trigrams))
+    )
+
+    candidate_ids = list(
+        FilmTrigram.objects.using(queryset.db).filter(
+            trigram__in=query_trigrams
+        ).values(
+            'film_id'
+        ).annotate(
+            shared=Count('film_id')
+        ).filter(
+            shared__gte=min_shared
+        ).order_by(
+            '-shared'
+        ).values_list('film_id', flat=True)[:FUZZY_CANDIDATES_LIMIT]
+    )
+    if not candidate_ids:
+        return []
+
+    films = list(queryset.filter(pk__in=candidate_ids))
+    for film in films:
+        film.similarity = max(
+            trigram_similarity(query_trigrams, make_trigrams(getattr(film, field)))
+            for field in SEARCH_FIELDS
+        )
+    return films
+
+
+def fuzzy_search(queryset, query: str, limit: int):
+    """
+    Нечёткий поиск фильмов по названиям с учётом опечаток.
+
+    Кандидаты выбираются по индексу, похожесть досчитывается только
+    для них. Итог сортируется по popularity_priority (если он
+    проаннотирован), затем по похожести и рейтингу.
+    """
+    if connections[queryset.db].vendor == 'postgresql':
+        films = _fuzzy_candidates_pg(queryset, query)
+    else:
+        films = _fuzzy_candidates_trigram_table(queryset, query)
+
+    films = [
+        film for film in films
+        if film.similarity >= TRIGRAM_SIMILARITY_THRESHOLD
+    ]
+    films.sort(key=lambda film: (
+        -getattr(film, 'popularity_priority', 0),
+        -film.similarity,
+        -(film.kinopoisk_rating or 0),
+        -(film.kinopoisk_votes or 0),
+    ))
+    return films[:limit]
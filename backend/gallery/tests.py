@@ -0,0 +1,480 @@
+import json
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from activities.models import UserFilmActivity
+from api.views.films import film_autocomplete
+from gallery.autocomplete import FilmAutocomplete
+from gallery.discover import DiscoverPool
+from gallery.kinopoisk.client import (
+    KinopoiskAPIError,
+    KinopoiskClient,
+    KinopoiskQuotaExhausted,
+    TokenBucket,
+)
+from gallery.kinopoisk.ingest import PageIngestor
+from gallery.kinopoisk.prefetch import PagePrefetcher
+from gallery.models import (
+    Film,
+    Genre,
+    ImportQuota,
+    ImportRun,
+    ImportState,
+    PendingFilmLink,
+    SequelsAndPrequels,
+    SimilarFilms,
+)
+
+
+def make_doc(kinopoisk_id, similar=(), sequels=()):
+    return {
+        "id": kinopoisk_id,
+        "name": f"Фильм {kinopoisk_id}",
+        "type": "movie",
+        "year": 2000,
+        "similarMovies": [
+            {"id": related_id, "name": f"Похожий {related_id}"}
+            for related_id in similar
+        ],
+        "sequelsAndPrequels": [
+            {"id": related_id, "name": f"Сиквел {related_id}"}
+            for related_id in sequels
+        ],
+    }
+
+
+class PendingFilmLinkTests(TestCase):
+    """Связи с фильмами, которых ещё нет в БД, не теряются между страницами."""
+
+    def film(self, kinopoisk_id):
+        return Film.objects.get(kinopoisk_api_id=kinopoisk_id)
+
+    def test_link_saved_with_page_when_related_exists(self):
+        ingestor = PageIngestor()
+        ingestor.ingest([make_doc(2)])
+        ingestor.ingest([make_doc(1, similar=[2])])
+
+        self.assertTrue(SimilarFilms.objects.filter(
+            film=self.film(1), similar_film=self.film(2)
+        ).exists())
+        self.assertFalse(PendingFilmLink.objects.exists())
+
+    def test_pending_link_survives_crash(self):
+        PageIngestor().ingest([make_doc(1, similar=[2], sequels=[3])])
+        self.assertEqual(PendingFilmLink.objects.count(), 2)
+
+        # Процесс упал; связанный фильм пришёл в следующем запуске
+        ingestor = PageIngestor()
+        ingestor.ingest([make_doc(2)])
+
+        self.assertTrue(SimilarFilms.objects.filter(
+            film=self.film(1), similar_film=self.film(2)
+        ).exists())
+        self.assertEqual(ingestor.links_resolved, 1)
+        self.assertEqual(
+            list(PendingFilmLink.objects.values_list(
+                "film_kinopoisk_id", "related_kinopoisk_id", "kind"
+            )),
+            [(1, 3, PendingFilmLink.Kind.SEQUEL)],
+        )
+
+    def test_resolve_links_creates_placeholders(self):
+        PageIngestor(allow_related_placeholders=True).ingest(
+            [make_doc(1, sequels=[3])]
+        )
+
+        ingestor = PageIngestor(allow_related_placeholders=True)
+        self.assertEqual(ingestor.resolve_links(), [])
+
+        self.assertEqual(self.film(3).name, "Сиквел 3")
+        self.assertTrue(SequelsAndPrequels.objects.filter(
+            film=self.film(1), related_film=self.film(3)
+        ).exists())
+        self.assertFalse(PendingFilmLink.objects.exists())
+
+    def test_resolve_links_keeps_unresolved(self):
+        PageIngestor().ingest([make_doc(1, similar=[2])])
+
+        self.assertEqual(
+            PageIngestor().resolve_links(),
+            [(1, 2, PendingFilmLink.Kind.SIMILAR)],
+        )
+        self.assertEqual(PendingFilmLink.objects.count(), 1)
+
+
+class FilmRowChurnTests(TestCase):
+    """Строка фильма переписывается только при изменении её полей."""
+
+    def test_relations_only_change_keeps_film_row(self):
+        doc = dict(make_doc(1), facts=[{"value": "факт", "type": "FACT"}])
+        PageIngestor().ingest([doc])
+        film = Film.objects.get(kinopoisk_api_id=1)
+
+        doc["facts"].append({"value": "ещё факт", "type": "FACT"})
+        PageIngestor().ingest([doc])
+
+        updated = Film.objects.get(pk=film.pk)
+        self.assertEqual(updated.updated_at, film.updated_at)
+        self.assertNotEqual(
+            updated.import_hashes["facts"], film.import_hashes["facts"]
+        )
+        self.assertEqual(updated.facts.count(), 2)
+
+    def test_film_fields_change_moves_updated_at(self):
+        PageIngestor().ingest([make_doc(1)])
+        film = Film.objects.get(kinopoisk_api_id=1)
+
+        PageIngestor().ingest([dict(make_doc(1), name="Новое название")])
+
+        updated = Film.objects.get(pk=film.pk)
+        self.assertEqual(updated.name, "Новое название")
+        self.assertGreater(updated.updated_at, film.updated_at)
+
+
+class FilmAutocompleteRefreshTests(TestCase):
+    """Догрузка индекса автодополнения: оценки, поздние коммиты, удаления."""
+
+    def setUp(self):
+        self.ingestor = PageIngestor()
+        self.ingestor.ingest([dict(make_doc(1), rating={"kp": 7.0})])
+        self.film = Film.objects.get(kinopoisk_api_id=1)
+        self.index = FilmAutocomplete(
+            get_queryset=film_autocomplete.get_queryset,
+            serialize=film_autocomplete.serialize,
+            limit=10,
+            change_fields=film_autocomplete.change_fields,
+            # Без фонового потока: догрузка вызывается в тесте явно
+            refresh_seconds=float("inf"),
+            rebuild_seconds=float("inf"),
+        )
+        self.index.build()
+
+    def suggestion(self):
+        _, payloads = self.index.suggest("фи")
+        return payloads[0]
+
+    def test_user_vote(self):
+        user = get_user_model().objects.create_user(
+            username="user", email="user@example.com", password="password"
+        )
+        activity = UserFilmActivity.objects.create(
+            user=user, film=self.film, is_watched=True, rating=8
+        )
+        self.index.refresh()
+        self.assertEqual(self.suggestion()["rating"], 8)
+
+        activity.delete()
+        self.index.refresh()
+        self.assertIsNone(self.suggestion()["rating"])
+
+        # Голос не переписывает строку фильма
+        self.assertEqual(
+            Film.objects.get(pk=self.film.pk).updated_at, self.film.updated_at
+        )
+
+    def test_import_rating_only(self):
+        self.ingestor.ingest([dict(make_doc(1), rating={"kp": 8.5})])
+
+        self.index.refresh()
+        self.assertEqual(self.suggestion()["kinopoisk_rating"], 8.5)
+
+    def test_late_commit(self):
+        # Транзакция поставила метку раньше уже загруженных изменений,
+        # а закоммитилась позже
+        Film.objects.filter(pk=self.film.pk).update(
+            name="Поздний коммит",
+            updated_at=self.index._synced_until - timedelta(seconds=1),
+        )
+
+        self.index.refresh()
+        self.assertEqual(self.index.suggest("позд")[0], 1)
+
+    def test_deleted_film(self):
+        self.film.delete()
+
+        self.index.refresh()
+        self.assertEqual(self.index.suggest("фи"), (0, []))
+
+    def test_film_leaves_queryset(self):
+        # update() не трогает updated_at: фильм пропадает без метки
+        Film.objects.filter(pk=self.film.pk).update(
+            name=None, alternative_name=None, en_name=None
+        )
+
+        self.index.refresh()
+        self.assertEqual(self.index.stats()["films"], 0)
+
+
+class DiscoverPoolTests(TestCase):
+    """Пул discover перестраивается по завершении запуска импорта."""
+
+    def setUp(self):
+        self.state = ImportState.objects.create(source="kinopoisk")
+        self.run = ImportRun.objects.create(source="kinopoisk")
+        self.pool = DiscoverPool(get_queryset=Film.objects.all)
+        self.pool.build()
+
+    def test_page_heartbeat_keeps_pool(self):
+        self.state.last_successful_run_at = timezone.now()
+        self.state.save()
+
+        self.assertFalse(self.pool.is_stale())
+
+    def test_finished_run_rebuilds_pool(self):
+        self.run.status = ImportRun.Status.SUCCESS
+        self.run.finished_at = timezone.now()
+        self.run.save()
+
+        self.assertTrue(self.pool.is_stale())
+
+        self.pool.build()
+        self.assertFalse(self.pool.is_stale())
+
+
+class DiscoverPoolSampleTests(TestCase):
+    """Фильтры пула совпадают с фильтрами ORM: без повторов и пропусков."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.genres = [
+            Genre.objects.create(name=f"Жанр {i}", slug=f"genre-{i}")
+            for i in range(3)
+        ]
+        for i in range(40):
+            film = Film.objects.create(
+                name=f"Фильм {i}", year=None if i % 7 == 0 else 2000 + i % 5
+            )
+            film.genres.add(*(
+                genre for index, genre in enumerate(cls.genres)
+                if i % (index + 2) == 0
+            ))
+
+    def test_filters(self):
+        pool = DiscoverPool(
+            get_queryset=Film.objects.all,
+            ttl=float("inf"),
+            check_seconds=float("inf"),
+        )
+        pool.build()
+
+        first, second, third = (genre.pk for genre in self.genres)
+        cases = [
+            ((), None, None),
+            ((), 2001, 2003),
+            ((first,), None, None),
+            ((first, second, third), None, None),
+            ((first,), 2002, None),
+            ((first, third, first), None, 2002),
+            ((second, third), 2001, 2003),
+            ((0,), 2001, 2003),
+        ]
+        for genre_ids, year_min, year_max in cases:
+            with self.subTest(genres=genre_ids, years=(year_min, year_max)):
+                films = Film.objects.all()
+                if genre_ids:
+                    films = films.filter(genres__id__in=genre_ids)
+                if year_min is not None:
+                    films = films.filter(year__gte=year_min)
+                if year_max is not None:
+                    films = films.filter(year__lte=year_max)
+                expected = sorted(set(films.values_list("pk", flat=True)))
+
+                total, sampled = pool.sample(
+                    100, genre_ids, year_min=year_min, year_max=year_max
+                )
+                self.assertEqual(total, len(expected))
+                self.assertEqual(sorted(sampled), expected)
+
+
+class ImportQuotaTests(TestCase):
+    """Общий лимит шардов после падения координатора."""
+
+    timeout = timedelta(minutes=30)
+
+    def start(self, remaining):
+        return ImportQuota.start("shards", remaining, self.timeout)
+
+    def test_busy_quota(self):
+        self.assertTrue(self.start(100))
+        self.assertTrue(ImportQuota.claim("shards"))
+
+        self.assertFalse(self.start(50))
+        self.assertEqual(ImportQuota.objects.get().remaining, 99)
+
+    def test_stale_quota(self):
+        self.assertTrue(self.start(100))
+        ImportQuota.objects.update(
+            updated_at=timezone.now() - self.timeout - timedelta(minutes=1)
+        )
+
+        self.assertTrue(self.start(50))
+        self.assertEqual(ImportQuota.objects.get().remaining, 50)
+
+    def test_exhausted_quota(self):
+        self.assertTrue(self.start(1))
+        self.assertTrue(ImportQuota.claim("shards"))
+
+        self.assertTrue(self.start(50))
+        self.assertEqual(ImportQuota.objects.get().remaining, 50)
+
+
+class FakeAPIHandler(BaseHTTPRequestHandler):
+    """Отдаёт ответы из server.responses по очереди, потом - 200."""
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requested_at.append(time.monotonic())
+            status, headers = (
+                server.responses.pop(0) if server.responses else (200, {})
+            )
+
+        body = json.dumps({"docs": [], "next": None}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class KinopoiskClientTests(SimpleTestCase):
+    """Повторы и ограничение частоты на локальном HTTP-сервере."""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeAPIHandler)
+        self.server.lock = threading.Lock()
+        self.server.responses = []
+        self.server.requested_at = []
+
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def make_client(self, **kwargs):
+        # Маленькая экспонента: паузу больше неё даёт только Retry-After
+        kwargs.setdefault("backoff", 0.001)
+        client = KinopoiskClient(
+            "key",
+            api_base="http://127.0.0.1:{0}".format(self.server.server_port),
+            **kwargs,
+        )
+        self.addCleanup(client.session.close)
+        return client
+
+    def gaps(self):
+        requested_at = self.server.requested_at
+        return [b - a for a, b in zip(requested_at, requested_at[1:])]
+
+    def test_retry_after_on_429_and_503(self):
+        self.server.responses = [
+            (429, {"Retry-After": "0.3"}),
+            (503, {"Retry-After": "0.2"}),
+        ]
+        client = self.make_client()
+
+        self.assertEqual(client.get_movies_page()["docs"], [])
+
+        self.assertEqual(client.requests_sent, 3)
+        self.assertEqual(client.retries, 2)
+        first, second = self.gaps()
+        self.assertGreaterEqual(first, 0.3)
+        self.assertGreaterEqual(second, 0.2)
+
+    def test_retry_after_capped_by_max_backoff(self):
+        self.server.responses = [(429, {"Retry-After": "30"})]
+        client = self.make_client(max_backoff=0.1)
+
+        client.get_token_info()
+
+        self.assertEqual(client.retries, 1)
+        self.assertLess(self.gaps()[0], 1)
+
+    def test_gives_up_after_max_retries(self):
+        self.server.responses = [(503, {})] * 4
+        client = self.make_client(max_retries=2)
+
+        with self.assertRaises(KinopoiskAPIError):
+            client.get_token_info()
+
+        self.assertEqual(client.requests_sent, 3)
+        self.assertEqual(client.retries, 2)
+        self.assertEqual(len(self.server.requested_at), 3)
+
+    def test_quota_charged_per_attempt(self):
+        self.server.responses = [(503, {}), (429, {})]
+        claims = []
+        client = self.make_client(
+            before_request=lambda: claims.append(1) or len(claims) <= 4
+        )
+
+        client.get_token_info()
+        self.assertEqual(len(claims), 3)
+        self.assertEqual(client.requests_sent, 3)
+
+        # Лимит кончился на повторе - запрос не уходит
+        self.server.responses = [(503, {})]
+        with self.assertRaises(KinopoiskQuotaExhausted):
+            client.get_token_info()
+        with self.assertRaises(KinopoiskQuotaExhausted):
+            client.get_token_info()
+        self.assertEqual(len(self.server.requested_at), 4)
+
+    def test_rate_limit(self):
+        # 20 запросов в секунду, без запаса: 10 запросов из двух
+        # потоков через один ограничитель занимают не меньше 9 / 20 с
+        # (сервер отмечает время чуть позже клиента - сравниваем с 0.4)
+        bucket = TokenBucket(rate=20, capacity=1)
+        clients = [self.make_client(rate_limiter=bucket) for _ in range(2)]
+        threads = [
+            threading.Thread(
+                target=lambda client=client: [
+                    client.get_token_info() for _ in range(5)
+                ]
+            )
+            for client in clients
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        requested_at = self.server.requested_at
+        self.assertEqual(len(requested_at), 10)
+        self.assertGreaterEqual(requested_at[-1] - requested_at[0], 0.4)
+        self.assertGreater(
+            sum(client.stage_seconds["rate_wait"] for client in clients), 0
+        )
+
+
+class PagePrefetcherTests(SimpleTestCase):
+    """Исключение из stop_on останавливает загрузку без ошибки."""
+
+    def test_stop_on(self):
+        def fetch_page(cursor):
+            if cursor == "2":
+                raise KinopoiskQuotaExhausted("Общий лимит запросов исчерпан.")
+            return {"docs": [], "next": "2", "hasNext": True}
+
+        for depth in (0, 2):
+            with self.subTest(depth=depth):
+                prefetcher = PagePrefetcher(
+                    fetch_page=fetch_page,
+                    depth=depth,
+                    stop_on=(KinopoiskQuotaExhausted,),
+                )
+
+                self.assertEqual([page.number for page in prefetcher], [1])
+                self.assertTrue(prefetcher.stopped_early)
@@ -1,3 +1,4 @@
+from datetime import date
 from typing import Optional
 
 
@@ -15,3 +16,37 @@ def cut_str(string: Optional[str], max_length: int) -> str:
         return string[:max_length] + '...'
 
     return string
+
+
+def calculate_age(birthday: Optional[date], death: Optional[date] = None,
+                  today: Optional[date] = None) -> Optional[int]:
+    """Возраст или возраст на момент смерти.
+
+    Args:
+        birthday: дата рождения
+        death: дата смерти (если есть)
+        today: текущая дата
+    """
+    if not birthday:
+        return None
+
+    # Проверка что дата смерти не раньше даты рождения
+    if death and death < birthday:
+        return None
+
+    end_date = death or today or date.today()
+
+    # Точный расчет
+    age = end_date.year - birthday.year
+
+    # Проверяем, наступил ли день рождения в текущем году
+    has_birthday_occurred = (
+        (end_date.month > birthday.month) or
+        (end_date.month == birthday.month and
+         end_date.day >= birthday.day)
+    )
+
+    if not has_birthday_occurred:
+        age -= 1
+
+    return max(0, age)  # Возраст не может быть отрицательным
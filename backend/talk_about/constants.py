@@ -23,3 +23,41 @@ MIN_SEARCH_VOTES = 2000
 
 # Минимальное кол-во в результирующем списке
 SEARCH_SUGGESTIONS_LIMIT = 10
+
+# Автодополнение из памяти процесса
+# Длина ключей индекса (более длинные запросы идут в БД)
+AUTOCOMPLETE_KEY_LENGTH = 24
+# Как часто догружать изменённые фильмы, сек
+AUTOCOMPLETE_REFRESH_SECONDS = 60
+# Сколько секунд до прошлой догрузки просматривать повторно: метка
+# updated_at ставится до коммита, медленная транзакция видна позже
+AUTOCOMPLETE_REFRESH_OVERLAP_SECONDS = 2 * 60
+# Как часто перестраивать индекс целиком, сек
+AUTOCOMPLETE_REBUILD_SECONDS = 60 * 60
+
+# Подсчёт total в выдаче фильмов
+# Сколько секунд храним точный count в кэше
+COUNT_CACHE_TTL = 5 * 60
+# Ниже этого числа оценке планировщика не доверяем и считаем точно
+COUNT_ESTIMATE_THRESHOLD = 10000
+
+# Пул фильмов для discover в памяти процесса
+# Через сколько секунд пул перестраивается в любом случае
+DISCOVER_POOL_TTL = 30 * 60
+# Как часто проверять, не закончился ли импорт, сек
+DISCOVER_POOL_CHECK_SECONDS = 60
+
+# Страница фильма
+# Сколько похожих фильмов показываем
+SIMILAR_FILMS_LIMIT = 12
+# Сколько последних рецензий показываем
+LATEST_REVIEWS_LIMIT = 7
+# Сколько секунд живёт кэш страницы фильма (сбрасывается и раньше - при записи)
+FILM_DETAIL_CACHE_TTL = 15 * 60
+# Сколько персон каждой профессии отдаём на странице фильма
+# (полный состав - /films/{id}/credits/)
+CREDITS_PER_PROFESSION = 20
+
+# Профиль пользователя
+# Сколько фильмов подборки показываем в списке подборок профиля
+PROFILE_COMPILATION_PREVIEW_FILMS = 4
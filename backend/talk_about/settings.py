@@ -72,6 +72,13 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'talk-about',
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -133,3 +140,4 @@ SPECTACULAR_SETTINGS = {
 }
 
 KINOPOISK_API_KEY = "QM90F9Y-V2P4X0N-PKP66KR-YX4339W"
+KINOPOISK_API_BASE = "https://api.kinopoisk.dev"
@@ -1,6 +1,36 @@
-from django.apps import AppConfig
+from django.apps import AppConfig, apps
+from django.db.models.signals import post_delete, post_save
 
 
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
+
+    def ready(self):
+        from users import stats
+
+        post_save.connect(
+            stats.create_user_stats_on_save,
+            sender=self.get_model('User'),
+            dispatch_uid='users_stats_user_save',
+        )
+
+        # Модели, от которых зависят счётчики UserStats
+        senders = (
+            ('activities', 'UserFilmActivity', 'activity'),
+            ('compilations', 'Compilation', 'compilation'),
+            ('blog', 'Follow', 'follow'),
+            ('blog', 'PhotoUser', 'photo'),
+        )
+        for app_label, model_name, suffix in senders:
+            sender = apps.get_model(app_label, model_name)
+            post_save.connect(
+                getattr(stats, f'update_user_stats_on_{suffix}_save'),
+                sender=sender,
+                dispatch_uid=f'users_stats_{suffix}_save',
+            )
+            post_delete.connect(
+                getattr(stats, f'update_user_stats_on_{suffix}_delete'),
+                sender=sender,
+                dispatch_uid=f'users_stats_{suffix}_delete',
+            )
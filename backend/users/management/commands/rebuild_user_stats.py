@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from users.stats import rebuild_user_stats
+
+
+class Command(BaseCommand):
+    help = 'Сверить счётчики пользователей (UserStats) с данными и исправить.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, сколько строк разошлось с данными.',
+        )
+
+    def handle(self, *args, **options):
+        users, drifted = rebuild_user_stats(
+            using=options['database'],
+            dry_run=options['dry_run'],
+        )
+        if options['dry_run']:
+            self.stdout.write(
+                f'Расходится с данными: {drifted} из {users} пользователей'
+            )
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Счётчики пользователей сверены: исправлено {drifted} '
+            f'из {users}'
+        ))
@@ -0,0 +1,79 @@
+# Generated by Django 4.2.20 on 2026-10-17 23:53
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+import django.db.models.deletion
+
+
+# Подсчёт скопирован из users.stats на момент миграции: исторический
+# код не должен меняться вместе с приложением
+def fill_user_stats(apps, schema_editor):
+    using = schema_editor.connection.alias
+    User = apps.get_model('users', 'User')
+    UserStats = apps.get_model('users', 'UserStats')
+    UserFilmActivity = apps.get_model('activities', 'UserFilmActivity')
+    Compilation = apps.get_model('compilations', 'Compilation')
+    Follow = apps.get_model('blog', 'Follow')
+    PhotoUser = apps.get_model('blog', 'PhotoUser')
+
+    counts = {}
+
+    def count(model, user_field, **annotations):
+        rows = model.objects.using(using).values(user_field).annotate(
+            **annotations
+        ).order_by().values_list(user_field, *annotations)
+        for user_id, *values in rows:
+            counts.setdefault(user_id, {}).update(zip(annotations, values))
+
+    count(
+        UserFilmActivity, 'user_id',
+        activities_count=Count('pk'),
+        watched_count=Count('pk', filter=Q(is_watched=True)),
+        planned_count=Count('pk', filter=Q(is_planned=True)),
+    )
+    count(Compilation, 'user_id', compilations_count=Count('pk'))
+    count(Follow, 'follower_id', subscriptions_count=Count('pk'))
+    count(Follow, 'following_id', subscribers_count=Count('pk'))
+    count(PhotoUser, 'user_id', photos_count=Count('pk'))
+
+    UserStats.objects.using(using).bulk_create(
+        [
+            UserStats(user_id=user_id, **counts.get(user_id, {}))
+            for user_id in User.objects.using(using).values_list(
+                'pk', flat=True
+            )
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_role'),
+        ('activities', '0011_filmratingstats'),
+        ('blog', '0004_follow_unique_user_follow'),
+        ('compilations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('activities_count', models.PositiveIntegerField(default=0, verbose_name='Активностей')),
+                ('watched_count', models.PositiveIntegerField(default=0, verbose_name='Просмотрено')),
+                ('planned_count', models.PositiveIntegerField(default=0, verbose_name='Буду смотреть')),
+                ('compilations_count', models.PositiveIntegerField(default=0, verbose_name='Подборок')),
+                ('subscriptions_count', models.PositiveIntegerField(default=0, verbose_name='Подписок')),
+                ('subscribers_count', models.PositiveIntegerField(default=0, verbose_name='Подписчиков')),
+                ('photos_count', models.PositiveIntegerField(default=0, verbose_name='Фотографий')),
+            ],
+            options={
+                'verbose_name': 'Статистика пользователя',
+                'verbose_name_plural': 'Статистика пользователей',
+            },
+        ),
+        migrations.RunPython(fill_user_stats, migrations.RunPython.noop),
+    ]
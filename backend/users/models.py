@@ -79,3 +79,56 @@ class User(AbstractUser):
     @property
     def is_moderator(self):
         return self.role == self.Role.MODERATOR
+
+
+class UserStats(models.Model):
+    """
+    Счётчики страницы пользователя.
+
+    Денормализация активностей, подборок, подписок и фотографий:
+    обновляется сигналами в той же транзакции, что и сама запись,
+    пересчитывается командой rebuild_user_stats.
+    """
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name='Пользователь',
+        related_name='stats',
+    )
+    activities_count = models.PositiveIntegerField(
+        'Активностей',
+        default=0,
+    )
+    watched_count = models.PositiveIntegerField(
+        'Просмотрено',
+        default=0,
+    )
+    planned_count = models.PositiveIntegerField(
+        'Буду смотреть',
+        default=0,
+    )
+    compilations_count = models.PositiveIntegerField(
+        'Подборок',
+        default=0,
+    )
+    subscriptions_count = models.PositiveIntegerField(
+        'Подписок',
+        default=0,
+    )
+    subscribers_count = models.PositiveIntegerField(
+        'Подписчиков',
+        default=0,
+    )
+    photos_count = models.PositiveIntegerField(
+        'Фотографий',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Статистика пользователя'
+        verbose_name_plural = 'Статистика пользователей'
+
+    def __str__(self):
+        return f'Статистика пользователя {self.user_id}'
@@ -0,0 +1,277 @@
+"""
+Поддержка UserStats в актуальном состоянии.
+
+Счётчики меняются сигналами post_save/post_delete активностей, подборок,
+подписок и фотографий: save этих моделей обёрнут в транзакцию, поэтому
+запись и счётчик фиксируются вместе. Обновление - один UPDATE с F(),
+без чтения строки. Массовые операции (queryset.update, bulk_create)
+сигналов не шлют - после них нужен rebuild_user_stats.
+
+Строки статистики нет, если пользователь создан в обход save; тогда
+UPDATE ничего не меняет, а get_user_stats посчитает её при чтении.
+"""
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.apps import apps as global_apps
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, F, Q, Value
+from django.db.models.functions import Greatest
+
+
+# Поля UserStats со счётчиками
+COUNTERS = (
+    'activities_count',
+    'watched_count',
+    'planned_count',
+    'compilations_count',
+    'subscriptions_count',
+    'subscribers_count',
+    'photos_count',
+)
+
+
+def apply_user_stats_change(
+    user_id: int,
+    changes: Dict[str, int],
+    using: str = DEFAULT_DB_ALIAS,
+) -> None:
+    """Прибавляет к счётчикам пользователя changes ({поле: +-n})."""
+    changes = {name: delta for name, delta in changes.items() if delta}
+    if not changes:
+        return
+
+    from users.models import UserStats
+
+    UserStats.objects.using(using).filter(user_id=user_id).update(**{
+        # Не уходим в минус, если счётчик уже разошёлся с данными
+        name: Greatest(F(name) + Value(delta), Value(0))
+        for name, delta in changes.items()
+    })
+
+
+def create_user_stats_on_save(sender, instance, created, using, raw=False,
+                              **kwargs):
+    """Обработчик post_save для User: новому пользователю - пустые счётчики."""
+    if created and not raw:
+        from users.models import UserStats
+
+        UserStats.objects.using(using).get_or_create(user_id=instance.pk)
+
+
+def update_user_stats_on_activity_save(sender, instance, created, using,
+                                       **kwargs):
+    """Обработчик post_save для UserFilmActivity."""
+    if created:
+        old_watched, old_planned = False, False
+    else:
+        old_watched, old_planned = getattr(
+            instance,
+            '_loaded_flags',
+            (instance.is_watched, instance.is_planned),
+        )
+
+    apply_user_stats_change(instance.user_id, {
+        'activities_count': int(created),
+        'watched_count': int(instance.is_watched) - int(bool(old_watched)),
+        'planned_count': int(instance.is_planned) - int(bool(old_planned)),
+    }, using)
+    instance._loaded_flags = (instance.is_watched, instance.is_planned)
+
+
+def update_user_stats_on_activity_delete(sender, instance, using, **kwargs):
+    """Обработчик post_delete для UserFilmActivity."""
+    old_watched, old_planned = getattr(
+        instance,
+        '_loaded_flags',
+        (instance.is_watched, instance.is_planned),
+    )
+    apply_user_stats_change(instance.user_id, {
+        'activities_count': -1,
+        'watched_count': -int(bool(old_watched)),
+        'planned_count': -int(bool(old_planned)),
+    }, using)
+
+
+def update_user_stats_on_compilation_save(sender, instance, created, using,
+                                          **kwargs):
+    """Обработчик post_save для Compilation."""
+    if created:
+        apply_user_stats_change(
+            instance.user_id, {'compilations_count': 1}, using
+        )
+
+
+def update_user_stats_on_compilation_delete(sender, instance, using,
+                                            **kwargs):
+    """Обработчик post_delete для Compilation."""
+    apply_user_stats_change(instance.user_id, {'compilations_count': -1}, using)
+
+
+def update_user_stats_on_follow_save(sender, instance, created, using,
+                                     **kwargs):
+    """Обработчик post_save для Follow."""
+    if created:
+        apply_user_stats_change(
+            instance.follower_id, {'subscriptions_count': 1}, using
+        )
+        apply_user_stats_change(
+            instance.following_id, {'subscribers_count': 1}, using
+        )
+
+
+def update_user_stats_on_follow_delete(sender, instance, using, **kwargs):
+    """Обработчик post_delete для Follow."""
+    apply_user_stats_change(
+        instance.follower_id, {'subscriptions_count': -1}, using
+    )
+    apply_user_stats_change(
+        instance.following_id, {'subscribers_count': -1}, using
+    )
+
+
+def update_user_stats_on_photo_save(sender, instance, created, using,
+                                    **kwargs):
+    """Обработчик post_save для PhotoUser."""
+    if created:
+        apply_user_stats_change(instance.user_id, {'photos_count': 1}, using)
+
+
+def update_user_stats_on_photo_delete(sender, instance, using, **kwargs):
+    """Обработчик post_delete для PhotoUser."""
+    apply_user_stats_change(instance.user_id, {'photos_count': -1}, using)
+
+
+def count_user_stats(
+    using: str = DEFAULT_DB_ALIAS,
+    apps=global_apps,
+    user_ids: Optional[Iterable[int]] = None,
+) -> Dict[int, Dict[str, int]]:
+    """
+    Счётчики по данным: {user_id: {поле: значение}}.
+
+    Пять GROUP BY на все таблицы; user_ids - только эти пользователи.
+    Пользователей без записей в результате нет.
+    """
+    UserFilmActivity = apps.get_model('activities', 'UserFilmActivity')
+    Compilation = apps.get_model('compilations', 'Compilation')
+    Follow = apps.get_model('blog', 'Follow')
+    PhotoUser = apps.get_model('blog', 'PhotoUser')
+
+    if user_ids is not None:
+        user_ids = list(user_ids)
+
+    def grouped(model, user_field, **annotations):
+        queryset = model.objects.using(using)
+        if user_ids is not None:
+            queryset = queryset.filter(**{f'{user_field}__in': user_ids})
+        return queryset.values(user_field).annotate(
+            **annotations
+        ).order_by().values_list(user_field, *annotations)
+
+    sources = (
+        (
+            ('activities_count', 'watched_count', 'planned_count'),
+            grouped(
+                UserFilmActivity, 'user_id',
+                activities_count=Count('pk'),
+                watched_count=Count('pk', filter=Q(is_watched=True)),
+                planned_count=Count('pk', filter=Q(is_planned=True)),
+            ),
+        ),
+        (
+            ('compilations_count',),
+            grouped(Compilation, 'user_id', compilations_count=Count('pk')),
+        ),
+        (
+            ('subscriptions_count',),
+            grouped(Follow, 'follower_id', subscriptions_count=Count('pk')),
+        ),
+        (
+            ('subscribers_count',),
+            grouped(Follow, 'following_id', subscribers_count=Count('pk')),
+        ),
+        (
+            ('photos_count',),
+            grouped(PhotoUser, 'user_id', photos_count=Count('pk')),
+        ),
+    )
+
+    counts = {}
+    for names, rows in sources:
+        for user_id, *values in rows:
+            counts.setdefault(user_id, {}).update(zip(names, values))
+    return counts
+
+
+def get_user_stats(user, using: Optional[str] = None):
+    """
+    Счётчики пользователя: строка UserStats (select_related('stats')
+    избавляет от запроса). Если строки нет - считает и создаёт её.
+    """
+    from users.models import UserStats
+
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        pass
+
+    using = using or user._state.db or DEFAULT_DB_ALIAS
+    counts = count_user_stats(using, user_ids=[user.pk]).get(user.pk, {})
+    stats, _ = UserStats.objects.using(using).get_or_create(
+        user_id=user.pk, defaults=counts
+    )
+    user.stats = stats
+    return stats
+
+
+def rebuild_user_stats(
+    using: str = DEFAULT_DB_ALIAS,
+    apps=global_apps,
+    dry_run: bool = False,
+) -> Tuple[int, int]:
+    """
+    Сверяет UserStats с данными и исправляет расхождения пачками.
+
+    apps - реестр моделей (в миграциях передаётся исторический);
+    dry_run - только посчитать расхождения.
+    Возвращает (число пользователей, число исправленных строк).
+    """
+    User = apps.get_model('users', 'User')
+    UserStats = apps.get_model('users', 'UserStats')
+
+    counts = count_user_stats(using, apps)
+    existing = {
+        row[0]: row[1:]
+        for row in UserStats.objects.using(using).values_list(
+            'user_id', *COUNTERS
+        )
+    }
+
+    to_create = []
+    to_update = []
+    users = 0
+    for user_id in User.objects.using(using).values_list(
+        'pk', flat=True
+    ).iterator():
+        users += 1
+        user_counts = counts.get(user_id, {})
+        values = tuple(user_counts.get(name, 0) for name in COUNTERS)
+        if user_id in existing and existing[user_id] == values:
+            continue
+
+        stats = UserStats(user_id=user_id, **dict(zip(COUNTERS, values)))
+        if user_id in existing:
+            to_update.append(stats)
+        else:
+            to_create.append(stats)
+
+    if not dry_run:
+        with transaction.atomic(using=using):
+            UserStats.objects.using(using).bulk_create(
+                to_create, batch_size=1000
+            )
+            UserStats.objects.using(using).bulk_update(
+                to_update, COUNTERS, batch_size=1000
+            )
+
+    return users, len(to_create) + len(to_update)
@@ -0,0 +1,134 @@
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from activities.models import UserFilmActivity
+from blog.models import Follow, PhotoUser
+from compilations.models import Compilation
+from gallery.models import Film
+from users.models import UserStats
+from users.stats import COUNTERS
+
+User = get_user_model()
+
+
+def make_user(name):
+    return User.objects.create_user(
+        username=name, email=f'{name}@example.com', password='password'
+    )
+
+
+class UserStatsTests(TestCase):
+    """Счётчики UserStats после каждого пути записи."""
+
+    def setUp(self):
+        # Удаление пользователя стирает его папку в MEDIA_ROOT
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = self.settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        self.user = make_user('user')
+        self.other = make_user('other')
+        self.film = Film.objects.create(name='Фильм', year=2000)
+
+    def assert_stats(self, user, **expected):
+        stats = UserStats.objects.values(*COUNTERS).get(user=user)
+        self.assertEqual(
+            stats, {name: expected.get(name, 0) for name in COUNTERS}
+        )
+
+    def test_new_user(self):
+        self.assert_stats(self.user)
+
+    def test_follow_unfollow(self):
+        follow = Follow.objects.create(
+            follower=self.user, following=self.other
+        )
+        self.assert_stats(self.user, subscriptions_count=1)
+        self.assert_stats(self.other, subscribers_count=1)
+
+        follow.delete()
+        self.assert_stats(self.user)
+        self.assert_stats(self.other)
+
+    def test_watched_to_planned(self):
+        UserFilmActivity.objects.create(
+            user=self.user, film=self.film, is_watched=True
+        )
+        self.assert_stats(self.user, activities_count=1, watched_count=1)
+
+        # Отметки до изменения берутся из _loaded_flags записи из БД
+        activity = UserFilmActivity.objects.get(user=self.user)
+        activity.is_watched = False
+        activity.is_planned = True
+        activity.save()
+        self.assert_stats(self.user, activities_count=1, planned_count=1)
+
+        activity.delete()
+        self.assert_stats(self.user)
+
+    def test_upsert_flip(self):
+        UserFilmActivity.upsert(
+            self.user.pk, self.film.pk, {'is_watched': True}
+        )
+        self.assert_stats(self.user, activities_count=1, watched_count=1)
+
+        UserFilmActivity.upsert(
+            self.user.pk, self.film.pk,
+            {'is_watched': False, 'is_planned': True},
+        )
+        self.assert_stats(self.user, activities_count=1, planned_count=1)
+
+    def test_cascade_delete(self):
+        UserFilmActivity.objects.create(
+            user=self.user, film=self.film, is_watched=True, is_planned=True
+        )
+        Compilation.objects.create(user=self.user, title='Подборка')
+        PhotoUser.objects.create(user=self.user, image='photo.jpg')
+        Follow.objects.create(follower=self.other, following=self.user)
+        self.assert_stats(
+            self.user, activities_count=1, watched_count=1, planned_count=1,
+            compilations_count=1, subscribers_count=1, photos_count=1,
+        )
+
+        self.film.delete()
+        self.other.delete()
+        self.assert_stats(self.user, compilations_count=1, photos_count=1)
+
+        Compilation.objects.all().delete()
+        PhotoUser.objects.all().delete()
+        self.assert_stats(self.user)
+
+    def test_rebuild_command(self):
+        # bulk_create и update() сигналов не шлют - счётчики расходятся
+        UserFilmActivity.objects.bulk_create([
+            UserFilmActivity(user=self.user, film=self.film, is_watched=True)
+        ])
+        UserStats.objects.filter(user=self.other).update(subscribers_count=5)
+
+        out = StringIO()
+        call_command('rebuild_user_stats', '--dry-run', stdout=out)
+        self.assertIn('2 из 2', out.getvalue())
+        self.assert_stats(self.other, subscribers_count=5)
+
+        out = StringIO()
+        call_command('rebuild_user_stats', stdout=out)
+        self.assertIn('исправлено 2 из 2', out.getvalue())
+        self.assert_stats(self.user, activities_count=1, watched_count=1)
+        self.assert_stats(self.other)
+
+        out = StringIO()
+        call_command('rebuild_user_stats', stdout=out)
+        self.assertIn('исправлено 0 из 2', out.getvalue())
+
+    def test_rebuild_creates_missing_row(self):
+        UserStats.objects.filter(user=self.user).delete()
+        Follow.objects.create(follower=self.user, following=self.other)
+
+        call_command('rebuild_user_stats', stdout=StringIO())
+        self.assert_stats(self.user, subscriptions_count=1)